@@ -0,0 +1,285 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+import logging
+import threading
+import time
+
+import bpy
+
+from .config import Config
+from .fbloader import FBLoader
+
+
+class FBSolveJob:
+    def __init__(self, drag_id, generation, headnum, camnum, kid,
+                 pin_idx, pin_pos, received_time=None):
+        # Jobs of cancelled drags are dropped
+        self.drag_id = drag_id
+        # Request number, newer request makes job result obsolete
+        self.generation = generation
+        self.headnum = headnum
+        self.camnum = camnum
+        self.kid = kid
+        # Dragged pin position is the only change forwarded to worker
+        self.pin_idx = pin_idx
+        self.pin_pos = pin_pos
+        # Time of the mouse event this job was requested for
+        self.received_time = received_time
+        # Worker-owned builder the job is solved with
+        self.builder = None
+        self.error = None
+
+
+class FBAsyncSolver:
+    """ Pin drag solve on worker thread. Builder state is copied once
+    per drag, then requests carry dragged pin position only.
+    Solved builder becomes current one and the replaced builder
+    goes back to worker. Waiting job is replaced by newer one,
+    obsolete results are dropped unless viewport hasn't been updated
+    for too long. Finished result is applied on main thread
+    by Blender timer """
+    check_interval = 0.01
+
+    _cond = threading.Condition()
+    _thread = None
+    _job = None
+    _running_job = None
+    _finished_jobs = []
+    _drag_id = 0
+    _generation = 0
+    _timer_active = False
+    _on_result = None
+    # Builder the next job is solved with, None while worker has it
+    _spare_builder = None
+    _started = False
+    _preview = False
+    _last_move = None
+    _last_applied_time = 0.0
+    # Does solver release GIL: None until checked
+    _gil_released = None
+    _stats = {'requested': 0, 'applied': 0, 'discarded': 0}
+
+    @classmethod
+    def stats(cls):
+        return cls._stats.copy()
+
+    @classmethod
+    def reset_stats(cls):
+        cls._stats = {'requested': 0, 'applied': 0, 'discarded': 0}
+
+    @classmethod
+    def is_busy(cls):
+        with cls._cond:
+            return cls._job is not None or cls._running_job is not None \
+                or len(cls._finished_jobs) > 0
+
+    @classmethod
+    def start(cls, headnum, camnum, preview=False):
+        """ Worker builder is a snapshot of current builder state.
+        Should be called once on drag start. Returns False when
+        solving on worker thread isn't possible or useful """
+        logger = logging.getLogger(__name__)
+        cls.cancel()
+        builder = FBLoader.builder().make_snapshot()
+        if builder is None:
+            logger.warning('ASYNC SOLVER SNAPSHOT ERROR')
+            return False
+        cls._preview = preview
+        kid = FBLoader.prepare_solve(builder, headnum, camnum)
+        if cls._preview:
+            FBLoader.setup_preview_solve(builder)
+        if not cls._check_gil_released(builder, kid):
+            return False
+        with cls._cond:
+            cls._spare_builder = builder
+            cls._started = True
+            cls._last_applied_time = time.perf_counter()
+        return True
+
+    @classmethod
+    def _check_gil_released(cls, builder, kid):
+        """ Solver call on another thread gives nothing to UI if it holds
+        GIL. It's measured once by the longest main thread stall
+        during a probe solve """
+        logger = logging.getLogger(__name__)
+        if cls._gil_released is not None:
+            return cls._gil_released
+
+        def _probe():
+            try:
+                builder.solve_for_current_pins(kid)
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=_probe, daemon=True)
+        start_time = time.perf_counter()
+        thread.start()
+        max_stall = 0.0
+        last_time = time.perf_counter()
+        while thread.is_alive():
+            current_time = time.perf_counter()
+            max_stall = max(max_stall, current_time - last_time)
+            last_time = current_time
+        solve_time = time.perf_counter() - start_time
+        cls._gil_released = solve_time < Config.async_solve_min_time \
+            or max_stall < 0.5 * solve_time
+        logger.debug('ASYNC SOLVE GIL CHECK: solve {:.4f} sec. '
+                     'main thread stall {:.4f} sec. async: {}'.format(
+                         solve_time, max_stall, cls._gil_released))
+        return cls._gil_released
+
+    @classmethod
+    def request(cls, headnum, camnum, kid, pin_idx, pin_pos,
+                on_result=None, received_time=None):
+        """ Dragged pin position is solved on worker.
+        on_result(headnum, camnum, received_time) is called
+        after result applying """
+        with cls._cond:
+            if not cls._started:
+                return False
+            if cls._job is not None:
+                # Not started yet, so it is cancelled without solving
+                cls._stats['discarded'] += 1
+            cls._generation += 1
+            cls._job = FBSolveJob(cls._drag_id, cls._generation,
+                                  headnum, camnum, kid, pin_idx, pin_pos,
+                                  received_time)
+            cls._last_move = (kid, pin_idx, pin_pos)
+            cls._on_result = on_result
+            cls._stats['requested'] += 1
+            cls._cond.notify_all()
+
+        cls._start_worker()
+        cls._start_timer()
+        return True
+
+    @classmethod
+    def cancel(cls):
+        """ Drop all requests without waiting. Running solve result
+        will be dropped when it's finished """
+        with cls._cond:
+            cls._drag_id += 1
+            cls._generation += 1
+            if cls._job is not None:
+                cls._stats['discarded'] += 1
+                cls._job = None
+            cls._stats['discarded'] += len(cls._finished_jobs)
+            cls._finished_jobs = []
+            cls._spare_builder = None
+            cls._started = False
+            cls._last_move = None
+
+    @classmethod
+    def _start_worker(cls):
+        if cls._thread is not None and cls._thread.is_alive():
+            return
+        cls._thread = threading.Thread(target=cls._worker, daemon=True)
+        cls._thread.start()
+
+    @classmethod
+    def _worker(cls):
+        while True:
+            with cls._cond:
+                while cls._job is None or cls._spare_builder is None:
+                    cls._cond.wait()
+                job = cls._job
+                cls._job = None
+                job.builder = cls._spare_builder
+                cls._spare_builder = None
+                cls._running_job = job
+            start_time = time.perf_counter()
+            try:
+                job.builder.move_pin(job.kid, job.pin_idx, job.pin_pos)
+                job.builder.solve_for_current_pins(job.kid)
+            except Exception as err:
+                job.error = err
+            logger = logging.getLogger(__name__)
+            logger.debug("ASYNC SOLVE: {:.4f} sec.".format(
+                time.perf_counter() - start_time))
+            with cls._cond:
+                cls._running_job = None
+                cls._finished_jobs.append(job)
+                cls._cond.notify_all()
+
+    @classmethod
+    def _return_builder(cls, job, builder):
+        with cls._cond:
+            if cls._started and job.drag_id == cls._drag_id:
+                cls._spare_builder = builder
+                cls._cond.notify_all()
+
+    @classmethod
+    def _start_timer(cls):
+        if cls._timer_active:
+            return
+        cls._timer_active = True
+        bpy.app.timers.register(cls._apply_results,
+                                first_interval=cls.check_interval)
+
+    @classmethod
+    def _is_obsolete(cls, job, generation):
+        if job.generation == generation:
+            return False
+        # Viewport should follow the drag even if solver is behind
+        return time.perf_counter() - cls._last_applied_time < \
+            Config.async_solve_max_display_lag
+
+    @classmethod
+    def _apply_results(cls):
+        with cls._cond:
+            finished_jobs = cls._finished_jobs
+            cls._finished_jobs = []
+            drag_id = cls._drag_id
+            generation = cls._generation
+            on_result = cls._on_result
+            last_move = cls._last_move
+
+        for job in finished_jobs:
+            if job.drag_id != drag_id:
+                cls._stats['discarded'] += 1
+                continue
+            if job.error is not None:
+                cls._return_builder(job, job.builder)
+                FBLoader.handle_solve_exception(job.headnum, job.error)
+                continue
+            if cls._is_obsolete(job, generation):
+                cls._stats['discarded'] += 1
+                cls._return_builder(job, job.builder)
+                continue
+            # Solved builder has the same pins except latest drag position
+            replaced_builder = FBLoader.get_builder()
+            FBLoader.builder().replace_builder(job.builder)
+            if last_move is not None:
+                job.builder.move_pin(*last_move)
+            FBLoader.inc_builder_revision()
+            FBLoader.update_camera_focal_post(job.headnum, job.camnum,
+                                              lens_only=True)
+            FBLoader.prepare_solve(replaced_builder, job.headnum, job.camnum)
+            if cls._preview:
+                FBLoader.setup_preview_solve(replaced_builder)
+            cls._return_builder(job, replaced_builder)
+            cls._last_applied_time = time.perf_counter()
+            cls._stats['applied'] += 1
+            if on_result is not None:
+                on_result(job.headnum, job.camnum, job.received_time)
+
+        if cls.is_busy():
+            return cls.check_interval
+        cls._timer_active = False
+        return None
@@ -23,7 +23,7 @@ from .config import *
 from .install import is_installed, installation_path_exists
 __all__ = ['loaded', 'module', 'is_python_supported', 'installation_status',
            'cached_installation_status','cached_is_installed',
-           'reset_cached_is_installed']
+           'reset_cached_is_installed', 'pykeentools_version']
 
 
 CACHED_PYKEENTOOLS_INSTALLATION_STATUS = None
@@ -119,6 +119,11 @@ def _get_pykeentools_version():
         return None
 
 
+def pykeentools_version():
+    """ (major, minor, patch) or None if version is unavailable """
+    return _get_pykeentools_version()
+
+
 def installation_status():
     if not is_installed():
         return (False, 'NOT_INSTALLED')
@@ -23,30 +23,56 @@ from . config import BuilderType, Config
 
 
 class UniBuilder:
+    # Builder objects are numbered to tell apart their states
+    _instance_counter = 0
+
     def __init__(self, builder_type=BuilderType.FaceBuilder,
                  ver=Config.unknown_mod_ver):  # const
         self.builder_type = BuilderType.NoneBuilder
         self.builder = None
+        self.instance_num = 0
         self.version = ver
 
         if builder_type == BuilderType.FaceBuilder:
             self.init_facebuilder(ver)
         elif builder_type == BuilderType.BodyBuilder:
-            self.init_bodybuilder()
+            self.init_bodybuilder(ver)
+
+    def _set_builder(self, builder):
+        UniBuilder._instance_counter += 1
+        self.instance_num = UniBuilder._instance_counter
+        self.builder = builder
+
+    def get_instance_num(self):
+        """ Changes every time builder object is replaced """
+        return self.instance_num
 
     def init_facebuilder(self, ver=Config.unknown_mod_ver):
-        self.builder = pkt.module().FaceBuilder()
+        self._set_builder(pkt.module().FaceBuilder())
         self.version = ver
         self.builder_type = BuilderType.FaceBuilder
 
     def init_bodybuilder(self, ver=Config.unknown_mod_ver):
-        self.builder = pkt.module().BodyBuilder()
+        self._set_builder(pkt.module().BodyBuilder())
         self.builder_type = BuilderType.BodyBuilder
         self.version = ver
 
     def get_builder(self):
         return self.builder
 
+    def make_snapshot(self):
+        """ Independent builder of the same type and state or None """
+        if self.builder is None:
+            return None
+        builder = UniBuilder(self.builder_type, self.version).get_builder()
+        if not builder.deserialize(self.builder.serialize()):
+            return None
+        return builder
+
+    def replace_builder(self, builder):
+        """ Same type builder with another state, e.g. solved snapshot """
+        self._set_builder(builder)
+
     def get_version(self):
         return self.version
 
@@ -283,12 +283,25 @@ class Config:
     default_pin_size = 7.0
     surf_pin_size_scale = 0.85
     default_point_sensitivity = 16.0
+    # Pin hit-test grid cell in image space units (image width is 1.0)
+    pin_grid_cell_size = 0.02
     text_scale_y = 0.75
 
     viewport_redraw_interval = 0.1
+    pin_move_solve_interval = 0.01
+    # Solves shorter than that aren't worth a worker thread
+    async_solve_min_time = 0.005
+    # Obsolete async result is still shown after that time without updates
+    async_solve_max_display_lag = 0.1
+    undo_history_max_steps = 128
+    undo_history_max_size = 64 * 1024 * 1024
+    # New head template meshes can be stored in user cache directory
+    template_cache_dir_name = 'keentools_fb_templates'
+    expression_cache_max_size = 32 * 1024 * 1024
     unknown_mod_ver = -1
 
     default_sensor_width = 36.0
+    focal_update_tolerance = 1e-4
     default_sensor_height = 24.0
     default_camera_display_size = 0.75
 
@@ -347,6 +360,10 @@ def get_main_settings():
     return getattr(bpy.context.scene, Config.addon_global_var_name)
 
 
+def get_addon_preferences():
+    return bpy.context.preferences.addons[Config.addon_name].preferences
+
+
 def get_operators():
     return getattr(bpy.ops, Config.operators)
 
@@ -16,8855 +16,59 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # ##### END GPL LICENSE BLOCK #####
 
+import os
+
+import numpy as np
+
+
+# Edge index pairs are stored as int32 arrays with shape (N, 2)
+_DATA_DIR = 'data'
+_loaded_indices = {}
+
+
+def _load_indices(name):
+    """ Lazy loading of edge index pairs. Loaded arrays are shared
+    between calls so they are read-only """
+    if name not in _loaded_indices:
+        path = os.path.join(os.path.dirname(__file__), _DATA_DIR,
+                            '{}_indices.npy'.format(name))
+        arr = np.load(path).reshape((-1, 2))
+        arr.flags.writeable = False
+        _loaded_indices[name] = arr
+    return _loaded_indices[name]
+
+
 def get_eyes_indices():
-    return {
-(12725, 15930),
-(12725, 13898),
-(7844, 13901),
-(7844, 13902),
-(12775, 15924),
-(12775, 13901),
-(12802, 13904),
-(12802, 15924),
-(9386, 13906),
-(9386, 13904),
-(12768, 15925),
-(12768, 13906),
-(12783, 13910),
-(12783, 15925),
-(7432, 13911),
-(7432, 13910),
-(7418, 13913),
-(7418, 13911),
-(6927, 13915),
-(6927, 13913),
-(12749, 13902),
-(12749, 15922),
-(9976, 15922),
-(9976, 15921),
-(10020, 15927),
-(10020, 15926),
-(10059, 15926),
-(10059, 15928),
-(12796, 15928),
-(12796, 14363),
-(8154, 14363),
-(8154, 13915),
-(12741, 14364),
-(12741, 15927),
-(8712, 14365),
-(8712, 14364),
-(8647, 14366),
-(8647, 14365),
-(12758, 14366),
-(12758, 15929),
-(10088, 15929),
-(10088, 15930),
-(12797, 14383),
-(12797, 15921),
-(8836, 14383),
-(8836, 14384),
-(7159, 14384),
-(7159, 13898),
-(4999, 15265),
-(4999, 15266),
-(7372, 15269),
-(7372, 15270),
-(7321, 15272),
-(7321, 15270),
-(7530, 15274),
-(7530, 15272),
-(8316, 15276),
-(8316, 15274),
-(7852, 15278),
-(7852, 15276),
-(9858, 15278),
-(9858, 15281),
-(8982, 15282),
-(8982, 15281),
-(8963, 15284),
-(8963, 15282),
-(5830, 15286),
-(5830, 15284),
-(5333, 15311),
-(5333, 15269),
-(12792, 15974),
-(12792, 15311),
-(7997, 15718),
-(7997, 15719),
-(7744, 15720),
-(7744, 15718),
-(7495, 15721),
-(7495, 15720),
-(5506, 15286),
-(5506, 15721),
-(6377, 15719),
-(6377, 15722),
-(6994, 15723),
-(6994, 15722),
-(9910, 15723),
-(9910, 15724),
-(9809, 15724),
-(9809, 15725),
-(8095, 15725),
-(8095, 15265),
-(2651, 6294),
-(2651, 7372),
-(6294, 15269),
-(2651, 4627),
-(6294, 15726),
-(4627, 15726),
-(2651, 6386),
-(4627, 15727),
-(6386, 15727),
-(6386, 15270),
-(2652, 6386),
-(2652, 7321),
-(2652, 5530),
-(5530, 15727),
-(2652, 5990),
-(5530, 15728),
-(5990, 15728),
-(5990, 15272),
-(2653, 5990),
-(2653, 7530),
-(2653, 5448),
-(5448, 15728),
-(2653, 6955),
-(5448, 15729),
-(6955, 15729),
-(6955, 15274),
-(2654, 6955),
-(2654, 8316),
-(2654, 12685),
-(12685, 15729),
-(2654, 12733),
-(12685, 15963),
-(12733, 15963),
-(12733, 15276),
-(2655, 12692),
-(2655, 12733),
-(12692, 15963),
-(2655, 5395),
-(12692, 15730),
-(5395, 15730),
-(2655, 7852),
-(5395, 15278),
-(2656, 9199),
-(2656, 5395),
-(9199, 15730),
-(2656, 4759),
-(9199, 15731),
-(4759, 15731),
-(2656, 9858),
-(4759, 15281),
-(2657, 9116),
-(2657, 4759),
-(9116, 15731),
-(2657, 9854),
-(9116, 15732),
-(9854, 15732),
-(2657, 8982),
-(9854, 15282),
-(2658, 9037),
-(2658, 9854),
-(9037, 15732),
-(2658, 4810),
-(9037, 15733),
-(4810, 15733),
-(2658, 8963),
-(4810, 15284),
-(2708, 7907),
-(2708, 5506),
-(7907, 15286),
-(2708, 5503),
-(7907, 15748),
-(5503, 15748),
-(2708, 4962),
-(5503, 15749),
-(4962, 15749),
-(4962, 15721),
-(2709, 4810),
-(2709, 5830),
-(2709, 8137),
-(8137, 15733),
-(2709, 7907),
-(8137, 15748),
-(2710, 5226),
-(2710, 7997),
-(5226, 15718),
-(2710, 4700),
-(5226, 15750),
-(4700, 15750),
-(2710, 4808),
-(4700, 15751),
-(4808, 15751),
-(4808, 15719),
-(2711, 4738),
-(2711, 7744),
-(4738, 15720),
-(2711, 4935),
-(4738, 15752),
-(4935, 15752),
-(2711, 5226),
-(4935, 15750),
-(2712, 4962),
-(2712, 7495),
-(2712, 5097),
-(5097, 15749),
-(2712, 4738),
-(5097, 15752),
-(2713, 4808),
-(2713, 6377),
-(2713, 12682),
-(12682, 15751),
-(2713, 12820),
-(12682, 15961),
-(12820, 15961),
-(12820, 15722),
-(2714, 6994),
-(2714, 7076),
-(7076, 15723),
-(2714, 12820),
-(2714, 12815),
-(12815, 15961),
-(12815, 15753),
-(7076, 15753),
-(2715, 9910),
-(2715, 7336),
-(7336, 15724),
-(2715, 7076),
-(2715, 7049),
-(7049, 15753),
-(7049, 15754),
-(7336, 15754),
-(2716, 7134),
-(2716, 7336),
-(7134, 15754),
-(2716, 7547),
-(7134, 15755),
-(7547, 15755),
-(2716, 9809),
-(7547, 15725),
-(2717, 12766),
-(2717, 7547),
-(12766, 15755),
-(2717, 12701),
-(12766, 15962),
-(12701, 15962),
-(2717, 8095),
-(12701, 15265),
-(2745, 12701),
-(2745, 4999),
-(2745, 10125),
-(10125, 15962),
-(2745, 12714),
-(10125, 15972),
-(12714, 15972),
-(12714, 15266),
-(9971, 15975),
-(9971, 15974),
-(10069, 15973),
-(10069, 15975),
-(12709, 15973),
-(12709, 15266),
-(2752, 12757),
-(2752, 5333),
-(12757, 15311),
-(2752, 12753),
-(12757, 15976),
-(12753, 15976),
-(2752, 6294),
-(12753, 15726),
-(2928, 10008),
-(2928, 10108),
-(10108, 15863),
-(10008, 15863),
-(2928, 10146),
-(10008, 15864),
-(10146, 15864),
-(2928, 10107),
-(10146, 15865),
-(10107, 15865),
-(10107, 15866),
-(10108, 15866),
-(2929, 9993),
-(2929, 10092),
-(10092, 15867),
-(9993, 15867),
-(2929, 10134),
-(9993, 15868),
-(10134, 15868),
-(2929, 10100),
-(10134, 15869),
-(10100, 15869),
-(10100, 15870),
-(10092, 15870),
-(2930, 9982),
-(2930, 10080),
-(10080, 15871),
-(9982, 15871),
-(2930, 10123),
-(9982, 15872),
-(10123, 15872),
-(2930, 10079),
-(10123, 15873),
-(10079, 15873),
-(10079, 15874),
-(10080, 15874),
-(2931, 9982),
-(2931, 10068),
-(10068, 15872),
-(2931, 10120),
-(10120, 15871),
-(2931, 9985),
-(10120, 15875),
-(9985, 15875),
-(9985, 15876),
-(10068, 15876),
-(2932, 10086),
-(2932, 10027),
-(10027, 15877),
-(10086, 15877),
-(2932, 9979),
-(10086, 15878),
-(9979, 15878),
-(2932, 10107),
-(9979, 15866),
-(10027, 15865),
-(2933, 10118),
-(2933, 10039),
-(10039, 15879),
-(10118, 15879),
-(2933, 10108),
-(10118, 15863),
-(2933, 9979),
-(10039, 15878),
-(2934, 10103),
-(2934, 10001),
-(10001, 15880),
-(10103, 15880),
-(2934, 10045),
-(10103, 15881),
-(10045, 15881),
-(2934, 9999),
-(10045, 15882),
-(9999, 15882),
-(9999, 15883),
-(10001, 15883),
-(2935, 10083),
-(2935, 10132),
-(10132, 15884),
-(10083, 15884),
-(2935, 10040),
-(10083, 15885),
-(10040, 15885),
-(2935, 10035),
-(10040, 15886),
-(10035, 15886),
-(10035, 15883),
-(10132, 15883),
-(2936, 9996),
-(2936, 9999),
-(9996, 15882),
-(2936, 9984),
-(9996, 15887),
-(9984, 15887),
-(2936, 10132),
-(9984, 15884),
-(2937, 10041),
-(2937, 10048),
-(10048, 15868),
-(10041, 15868),
-(2937, 10122),
-(10041, 15888),
-(10122, 15888),
-(2937, 10083),
-(10122, 15885),
-(10048, 15884),
-(2938, 10048),
-(2938, 10134),
-(2938, 9984),
-(2938, 10106),
-(10106, 15887),
-(10106, 15869),
-(2939, 9992),
-(2939, 9993),
-(9992, 15867),
-(2939, 10112),
-(9992, 15889),
-(10112, 15889),
-(2939, 10041),
-(10112, 15888),
-(2940, 10031),
-(2940, 10068),
-(10031, 15876),
-(2940, 10039),
-(10031, 15879),
-(2940, 9966),
-(9966, 15878),
-(9966, 15872),
-(2941, 10021),
-(2941, 10086),
-(10021, 15877),
-(2941, 10123),
-(10021, 15873),
-(2941, 9966),
-(2942, 9970),
-(2942, 10080),
-(9970, 15874),
-(2942, 10007),
-(9970, 15890),
-(10007, 15890),
-(2942, 10117),
-(10007, 15891),
-(10117, 15891),
-(10117, 15871),
-(2943, 9978),
-(2943, 9968),
-(9968, 15892),
-(9978, 15892),
-(2943, 10120),
-(9978, 15875),
-(2943, 10117),
-(9968, 15891),
-(2944, 10058),
-(2944, 10007),
-(10058, 15890),
-(2944, 9992),
-(10058, 15889),
-(2944, 10091),
-(10091, 15867),
-(10091, 15891),
-(2945, 10044),
-(2945, 10092),
-(10044, 15870),
-(2945, 9968),
-(10044, 15892),
-(2945, 10091),
-(2946, 10079),
-(2946, 9967),
-(9967, 15874),
-(2946, 10014),
-(10014, 15873),
-(2946, 10073),
-(10014, 15893),
-(10073, 15893),
-(10073, 15894),
-(9967, 15894),
-(2947, 9970),
-(2947, 10006),
-(10006, 15890),
-(2947, 9967),
-(2947, 10023),
-(10023, 15894),
-(10023, 15895),
-(10006, 15895),
-(2948, 10004),
-(2948, 10006),
-(10004, 15895),
-(2948, 10072),
-(10004, 15896),
-(10072, 15896),
-(2948, 10058),
-(10072, 15889),
-(2949, 10072),
-(2949, 10112),
-(2949, 10043),
-(10043, 15896),
-(2949, 10055),
-(10043, 15897),
-(10055, 15897),
-(10055, 15888),
-(2950, 10055),
-(2950, 10122),
-(2950, 10096),
-(10096, 15897),
-(2950, 10013),
-(10096, 15898),
-(10013, 15898),
-(10013, 15885),
-(2951, 10013),
-(2951, 10040),
-(2951, 10135),
-(10135, 15898),
-(2951, 9965),
-(10135, 15899),
-(9965, 15899),
-(9965, 15886),
-(2952, 9996),
-(2952, 10133),
-(10133, 15887),
-(2952, 10016),
-(10016, 15882),
-(2952, 10030),
-(10016, 15900),
-(10030, 15900),
-(10030, 15901),
-(10133, 15901),
-(2953, 10106),
-(2953, 10011),
-(10011, 15869),
-(2953, 10133),
-(2953, 10090),
-(10090, 15901),
-(10090, 15902),
-(10011, 15902),
-(2954, 10100),
-(2954, 9963),
-(9963, 15870),
-(2954, 10011),
-(2954, 10131),
-(10131, 15902),
-(10131, 15903),
-(9963, 15903),
-(2955, 10044),
-(2955, 9991),
-(9991, 15892),
-(2955, 9963),
-(2955, 9973),
-(9973, 15903),
-(9973, 15904),
-(9991, 15904),
-(2956, 9978),
-(2956, 10136),
-(10136, 15875),
-(2956, 9991),
-(2956, 10015),
-(10015, 15904),
-(10015, 15905),
-(10136, 15905),
-(2957, 10136),
-(2957, 9985),
-(2957, 10067),
-(10067, 15905),
-(2957, 10089),
-(10067, 15906),
-(10089, 15906),
-(10089, 15876),
-(2958, 10089),
-(2958, 10031),
-(2958, 10116),
-(10116, 15906),
-(2958, 10057),
-(10116, 15907),
-(10057, 15907),
-(10057, 15879),
-(2959, 10118),
-(2959, 10094),
-(10094, 15863),
-(2959, 10057),
-(2959, 9977),
-(9977, 15907),
-(9977, 15908),
-(10094, 15908),
-(2960, 10008),
-(2960, 10037),
-(10037, 15864),
-(2960, 10094),
-(2960, 10024),
-(10024, 15908),
-(10024, 15909),
-(10037, 15909),
-(2961, 10037),
-(2961, 10146),
-(2961, 10082),
-(10082, 15909),
-(2961, 9990),
-(10082, 15910),
-(9990, 15910),
-(9990, 15865),
-(2962, 9990),
-(2962, 10027),
-(2962, 10124),
-(10124, 15910),
-(2962, 10054),
-(10124, 15911),
-(10054, 15911),
-(10054, 15877),
-(2963, 10021),
-(2963, 10014),
-(2963, 10054),
-(2963, 10063),
-(10063, 15911),
-(10063, 15893),
-(2964, 10064),
-(2964, 9962),
-(9962, 15912),
-(10064, 15912),
-(2964, 10114),
-(10064, 15913),
-(10114, 15913),
-(2964, 9961),
-(10114, 15914),
-(9961, 15914),
-(9961, 15915),
-(9962, 15915),
-(2965, 10003),
-(2965, 10114),
-(10003, 15913),
-(2965, 10053),
-(10003, 15916),
-(10053, 15916),
-(2965, 10056),
-(10053, 15917),
-(10056, 15917),
-(10056, 15914),
-(2966, 10056),
-(2966, 9961),
-(2966, 10111),
-(10111, 15917),
-(2966, 10102),
-(10111, 15918),
-(10102, 15918),
-(10102, 15915),
-(2967, 10035),
-(2967, 10001),
-(2967, 9981),
-(9981, 15886),
-(2967, 9975),
-(9981, 15919),
-(9975, 15919),
-(9975, 15880),
-(2968, 9965),
-(2968, 9981),
-(2968, 10119),
-(10119, 15899),
-(2968, 10029),
-(10119, 15920),
-(10029, 15920),
-(10029, 15919),
-(2969, 10143),
-(2969, 12836),
-(12836, 15912),
-(10143, 15912),
-(2969, 10029),
-(10143, 15919),
-(2969, 12843),
-(12843, 15920),
-(12843, 13898),
-(12836, 13898),
-(2970, 10064),
-(2970, 12848),
-(12848, 15913),
-(2970, 12836),
-(2970, 7159),
-(12848, 14384),
-(2971, 10038),
-(2971, 12797),
-(10038, 15921),
-(2971, 10053),
-(10038, 15917),
-(2971, 12851),
-(12851, 15916),
-(12851, 14383),
-(2972, 10047),
-(2972, 9976),
-(10047, 15922),
-(2972, 10111),
-(10047, 15918),
-(2972, 10038),
-(2973, 10045),
-(2973, 10016),
-(2973, 10010),
-(10010, 15881),
-(2973, 10127),
-(10010, 15923),
-(10127, 15923),
-(10127, 15900),
-(2974, 8836),
-(2974, 12848),
-(2974, 12851),
-(2974, 10003),
-(2975, 7844),
-(2975, 12846),
-(12846, 13902),
-(2975, 12831),
-(12831, 13901),
-(2975, 10030),
-(12831, 15901),
-(12846, 15900),
-(2976, 12775),
-(2976, 12831),
-(2976, 10075),
-(10075, 15924),
-(2976, 10090),
-(10075, 15902),
-(2977, 12802),
-(2977, 10075),
-(2977, 12833),
-(12833, 13904),
-(2977, 10131),
-(12833, 15903),
-(2978, 9386),
-(2978, 12833),
-(2978, 12842),
-(12842, 13906),
-(2978, 9973),
-(12842, 15904),
-(2979, 12842),
-(2979, 10015),
-(2979, 12768),
-(2979, 10113),
-(10113, 15925),
-(10113, 15905),
-(2980, 10113),
-(2980, 10067),
-(2980, 12783),
-(2980, 12824),
-(12824, 13910),
-(12824, 15906),
-(2981, 12824),
-(2981, 10116),
-(2981, 7432),
-(2981, 12828),
-(12828, 13911),
-(12828, 15907),
-(2982, 12828),
-(2982, 9977),
-(2982, 7418),
-(2982, 12840),
-(12840, 13913),
-(12840, 15908),
-(2983, 9986),
-(2983, 9962),
-(9986, 15915),
-(2983, 9975),
-(9986, 15880),
-(2983, 10143),
-(2984, 10032),
-(2984, 10102),
-(10032, 15918),
-(2984, 10103),
-(10032, 15881),
-(2984, 9986),
-(2985, 10047),
-(2985, 10032),
-(2985, 10129),
-(10129, 15922),
-(2985, 10010),
-(10129, 15923),
-(2986, 8154),
-(2986, 12854),
-(12854, 13915),
-(2986, 12825),
-(12825, 14363),
-(2986, 10082),
-(12825, 15910),
-(12854, 15909),
-(2987, 6927),
-(2987, 12840),
-(2987, 12854),
-(2987, 10024),
-(2988, 10020),
-(2988, 10042),
-(10042, 15926),
-(2988, 9989),
-(9989, 15927),
-(2988, 10073),
-(9989, 15894),
-(10042, 15893),
-(2989, 10059),
-(2989, 10066),
-(10066, 15928),
-(2989, 10042),
-(2989, 10063),
-(10066, 15911),
-(2990, 12796),
-(2990, 12825),
-(2990, 10066),
-(2990, 10124),
-(2991, 12741),
-(2991, 9989),
-(2991, 12845),
-(12845, 14364),
-(2991, 10023),
-(12845, 15895),
-(2992, 12853),
-(2992, 8712),
-(12853, 14365),
-(2992, 10004),
-(12853, 15896),
-(2992, 12845),
-(2993, 12826),
-(2993, 8647),
-(12826, 14366),
-(2993, 10043),
-(12826, 15897),
-(2993, 12853),
-(2994, 12826),
-(2994, 10096),
-(2994, 12758),
-(2994, 10019),
-(10019, 15929),
-(10019, 15898),
-(2995, 10019),
-(2995, 10135),
-(2995, 10088),
-(2995, 10071),
-(10071, 15930),
-(10071, 15899),
-(2996, 12725),
-(2996, 10071),
-(2996, 12843),
-(2996, 10119),
-(2997, 12749),
-(2997, 10129),
-(2997, 12846),
-(2997, 10127),
-(2998, 9972),
-(2998, 10062),
-(10062, 15931),
-(9972, 15931),
-(2998, 10121),
-(9972, 15932),
-(10121, 15932),
-(2998, 10065),
-(10121, 15933),
-(10065, 15933),
-(10065, 15934),
-(10062, 15934),
-(2999, 9995),
-(2999, 10078),
-(10078, 15935),
-(9995, 15935),
-(2999, 10137),
-(9995, 15936),
-(10137, 15936),
-(2999, 10101),
-(10137, 15937),
-(10101, 15937),
-(10101, 15938),
-(10078, 15938),
-(3000, 10002),
-(3000, 10087),
-(10087, 15939),
-(10002, 15939),
-(3000, 10142),
-(10002, 15940),
-(10142, 15940),
-(3000, 10095),
-(10142, 15941),
-(10095, 15941),
-(10095, 15942),
-(10087, 15942),
-(3001, 10052),
-(3001, 10087),
-(10052, 15942),
-(3001, 10081),
-(10052, 15943),
-(10081, 15943),
-(3001, 9987),
-(10081, 15944),
-(9987, 15944),
-(9987, 15939),
-(3002, 10140),
-(3002, 9980),
-(9980, 15945),
-(10140, 15945),
-(3002, 10121),
-(10140, 15933),
-(3002, 10099),
-(10099, 15932),
-(10099, 15946),
-(9980, 15946),
-(3003, 10034),
-(3003, 10051),
-(10051, 15947),
-(10034, 15947),
-(3003, 10099),
-(10034, 15946),
-(3003, 9972),
-(10051, 15931),
-(3004, 10115),
-(3004, 10012),
-(10012, 15948),
-(10115, 15948),
-(3004, 10148),
-(10115, 15949),
-(10148, 15949),
-(3004, 10009),
-(10148, 15950),
-(10009, 15950),
-(10009, 15951),
-(10012, 15951),
-(3005, 10061),
-(3005, 10050),
-(10050, 15952),
-(10061, 15952),
-(3005, 9994),
-(10061, 15949),
-(9994, 15949),
-(3005, 10144),
-(9994, 15953),
-(10144, 15953),
-(10144, 15954),
-(10050, 15954),
-(3006, 10148),
-(3006, 9998),
-(9998, 15950),
-(3006, 10061),
-(3006, 10000),
-(10000, 15952),
-(10000, 15955),
-(9998, 15955),
-(3007, 10025),
-(3007, 10028),
-(10028, 15938),
-(10025, 15938),
-(3007, 10050),
-(10025, 15952),
-(3007, 10130),
-(10130, 15954),
-(10130, 15956),
-(10028, 15956),
-(3008, 10101),
-(3008, 10025),
-(3008, 10085),
-(10085, 15937),
-(3008, 10000),
-(10085, 15955),
-(3009, 10078),
-(3009, 9969),
-(9969, 15935),
-(3009, 10028),
-(3009, 10110),
-(10110, 15956),
-(10110, 15957),
-(9969, 15957),
-(3010, 10052),
-(3010, 10126),
-(10126, 15943),
-(3010, 10109),
-(10109, 15942),
-(3010, 10034),
-(10109, 15946),
-(10126, 15947),
-(3011, 9980),
-(3011, 10147),
-(10147, 15945),
-(3011, 10109),
-(3011, 10095),
-(10147, 15941),
-(3012, 10002),
-(3012, 9988),
-(9988, 15940),
-(3012, 10033),
-(10033, 15939),
-(3012, 10005),
-(10033, 15958),
-(10005, 15958),
-(10005, 15959),
-(9988, 15959),
-(3013, 10141),
-(3013, 10128),
-(10128, 15960),
-(10141, 15960),
-(3013, 10033),
-(10141, 15958),
-(3013, 9987),
-(10128, 15944),
-(3014, 10005),
-(3014, 10098),
-(10098, 15959),
-(3014, 10018),
-(10018, 15958),
-(3014, 9969),
-(10018, 15935),
-(10098, 15957),
-(3015, 9995),
-(3015, 10017),
-(10017, 15936),
-(3015, 10018),
-(3015, 10141),
-(10017, 15960),
-(3016, 12850),
-(3016, 10142),
-(12850, 15940),
-(3016, 4700),
-(12850, 15751),
-(3016, 12838),
-(12838, 15750),
-(12838, 15941),
-(3017, 10105),
-(3017, 9988),
-(10105, 15959),
-(3017, 12682),
-(10105, 15961),
-(3017, 12850),
-(3018, 10105),
-(3018, 12815),
-(3018, 10098),
-(3018, 12829),
-(12829, 15957),
-(12829, 15753),
-(3019, 10110),
-(3019, 12829),
-(3019, 12844),
-(12844, 15956),
-(3019, 7049),
-(12844, 15754),
-(3020, 10130),
-(3020, 12844),
-(3020, 12832),
-(12832, 15954),
-(3020, 7134),
-(12832, 15755),
-(3021, 10144),
-(3021, 12832),
-(3021, 10074),
-(10074, 15953),
-(3021, 12766),
-(10074, 15962),
-(3022, 12830),
-(3022, 9998),
-(12830, 15955),
-(3022, 4627),
-(12830, 15727),
-(3022, 12837),
-(12837, 15726),
-(12837, 15950),
-(3023, 12847),
-(3023, 10085),
-(12847, 15937),
-(3023, 5530),
-(12847, 15728),
-(3023, 12830),
-(3024, 12834),
-(3024, 10137),
-(12834, 15936),
-(3024, 5448),
-(12834, 15729),
-(3024, 12847),
-(3025, 9964),
-(3025, 10017),
-(9964, 15960),
-(3025, 12685),
-(9964, 15963),
-(3025, 12834),
-(3026, 12839),
-(3026, 10128),
-(12839, 15944),
-(3026, 12692),
-(12839, 15730),
-(3026, 9964),
-(3027, 10081),
-(3027, 12839),
-(3027, 12849),
-(12849, 15943),
-(3027, 9199),
-(12849, 15731),
-(3028, 10126),
-(3028, 12849),
-(3028, 12841),
-(12841, 15947),
-(3028, 9116),
-(12841, 15732),
-(3029, 12856),
-(3029, 10051),
-(12856, 15931),
-(3029, 9037),
-(12856, 15733),
-(3029, 12841),
-(3030, 12835),
-(3030, 10062),
-(12835, 15934),
-(3030, 8137),
-(12835, 15748),
-(3030, 12856),
-(3031, 10065),
-(3031, 12835),
-(3031, 12827),
-(12827, 15933),
-(3031, 5503),
-(12827, 15749),
-(3032, 10140),
-(3032, 12827),
-(3032, 12855),
-(12855, 15945),
-(3032, 5097),
-(12855, 15752),
-(3033, 12838),
-(3033, 10147),
-(3033, 4935),
-(3033, 12855),
-(3034, 10145),
-(3034, 10049),
-(10049, 15964),
-(10145, 15964),
-(3034, 10104),
-(10145, 15965),
-(10104, 15965),
-(3034, 10046),
-(10104, 15966),
-(10046, 15966),
-(10046, 15967),
-(10049, 15967),
-(3035, 10046),
-(3035, 10022),
-(10022, 15967),
-(3035, 10097),
-(10097, 15966),
-(3035, 10139),
-(10097, 15968),
-(10139, 15968),
-(10139, 15969),
-(10022, 15969),
-(3036, 10104),
-(3036, 10097),
-(3036, 10084),
-(10084, 15965),
-(3036, 9997),
-(10084, 15970),
-(9997, 15970),
-(9997, 15968),
-(3037, 10115),
-(3037, 9994),
-(3037, 10138),
-(10138, 15948),
-(3037, 10060),
-(10138, 15971),
-(10060, 15971),
-(10060, 15953),
-(3038, 10060),
-(3038, 10074),
-(3038, 9983),
-(9983, 15971),
-(3038, 10125),
-(9983, 15972),
-(3039, 12857),
-(3039, 10036),
-(10036, 15964),
-(12857, 15964),
-(3039, 12714),
-(12857, 15266),
-(3039, 9983),
-(10036, 15971),
-(3040, 10077),
-(3040, 10049),
-(10077, 15967),
-(3040, 12709),
-(10077, 15973),
-(3040, 12857),
-(3041, 9971),
-(3041, 10026),
-(10026, 15974),
-(3041, 9974),
-(9974, 15975),
-(3041, 10139),
-(9974, 15969),
-(10026, 15968),
-(3042, 12792),
-(3042, 12852),
-(12852, 15311),
-(3042, 10026),
-(3042, 9997),
-(12852, 15970),
-(3043, 12837),
-(3043, 10009),
-(3043, 12753),
-(3043, 10070),
-(10070, 15976),
-(10070, 15951),
-(3044, 10077),
-(3044, 10069),
-(3044, 10022),
-(3044, 9974),
-(3045, 10145),
-(3045, 10076),
-(10076, 15965),
-(3045, 10036),
-(3045, 10138),
-(10076, 15948),
-(3046, 10084),
-(3046, 10093),
-(10093, 15970),
-(3046, 10076),
-(3046, 10012),
-(10093, 15951),
-(3047, 10093),
-(3047, 12852),
-(3047, 10070),
-(3047, 12757),
-    }
+    return _load_indices('eyes')
 
 
 def get_eyebrows_indices():
-    return {
-(323, 7607),
-(323, 7532),
-(7607, 13432),
-(7532, 13432),
-(323, 7439),
-(7532, 13433),
-(7439, 13433),
-(325, 7768),
-(325, 6586),
-(7768, 13438),
-(6586, 13438),
-(325, 7607),
-(6586, 13432),
-(327, 8170),
-(327, 7095),
-(8170, 13441),
-(7095, 13441),
-(327, 7768),
-(7095, 13438),
-(329, 9207),
-(329, 7586),
-(9207, 13444),
-(7586, 13444),
-(329, 8170),
-(7586, 13441),
-(338, 6426),
-(338, 5314),
-(6426, 13460),
-(5314, 13460),
-(5920, 13603),
-(453, 6210),
-(453, 6700),
-(453, 6766),
-(6700, 13444),
-(6766, 13444),
-(6766, 13609),
-(6210, 13609),
-(454, 6700),
-(454, 4987),
-(454, 7586),
-(4987, 13441),
-(455, 4987),
-(455, 5518),
-(455, 7095),
-(5518, 13438),
-(456, 8917),
-(456, 7532),
-(8917, 13432),
-(456, 8511),
-(8511, 13433),
-(457, 8511),
-(457, 4787),
-(4787, 13433),
-(457, 9544),
-(9544, 13460),
-(4787, 13460),
-(458, 5518),
-(458, 6586),
-(458, 8917),
-(459, 9544),
-(459, 5314),
-(483, 6426),
-(483, 4787),
-(483, 7439),
-(492, 5319),
-(492, 6920),
-(5319, 13603),
-(6920, 13603),
-(492, 9402),
-(6920, 13609),
-(9402, 13609),
-(646, 9402),
-(646, 6766),
-(646, 9207),
-(871, 6920),
-(871, 6210),
-(871, 5920),
-(1679, 5846),
-(1679, 5413),
-(1679, 5494),
-(5413, 14824),
-(5494, 14824),
-(5494, 14825),
-(5846, 14825),
-(1681, 8621),
-(1681, 5846),
-(1681, 5318),
-(5318, 14825),
-(5318, 14829),
-(8621, 14829),
-(1683, 8856),
-(1683, 8621),
-(1683, 8530),
-(8530, 14829),
-(8530, 14832),
-(8856, 14832),
-(1685, 7520),
-(1685, 8856),
-(1685, 9103),
-(9103, 14832),
-(9103, 14835),
-(7520, 14835),
-(1694, 7998),
-(1694, 7667),
-(7667, 14849),
-(7998, 14849),
-(4685, 14984),
-(1809, 9863),
-(1809, 6713),
-(9863, 14991),
-(6713, 14991),
-(1809, 6627),
-(6713, 14835),
-(6627, 14835),
-(1810, 6627),
-(1810, 9103),
-(1810, 9713),
-(9713, 14832),
-(1811, 9713),
-(1811, 8530),
-(1811, 6114),
-(6114, 14829),
-(1812, 5494),
-(1812, 7882),
-(7882, 14825),
-(1812, 7796),
-(7796, 14824),
-(1813, 8748),
-(1813, 7796),
-(8748, 14824),
-(1813, 9118),
-(8748, 14849),
-(9118, 14849),
-(1814, 5318),
-(1814, 6114),
-(1814, 7882),
-(1815, 7667),
-(1815, 9118),
-(1839, 8748),
-(1839, 7998),
-(1839, 5413),
-(1848, 7451),
-(1848, 8368),
-(1848, 5474),
-(8368, 14991),
-(5474, 14991),
-(5474, 14984),
-(7451, 14984),
-(2002, 8368),
-(2002, 7520),
-(2002, 6713),
-(2227, 9863),
-(2227, 5474),
-(2227, 4685),
-    }
+    return _load_indices('eyebrows')
 
 
 def get_nose_indices():
-    return {
-(652, 6862),
-(652, 6652),
-(6652, 13812),
-(6862, 13812),
-(652, 6415),
-(6862, 13813),
-(6415, 13813),
-(652, 6317),
-(6415, 13814),
-(6317, 13814),
-(6317, 13815),
-(6652, 13815),
-(653, 6574),
-(653, 6415),
-(6574, 13813),
-(653, 5149),
-(6574, 13816),
-(5149, 13816),
-(653, 6157),
-(5149, 13817),
-(6157, 13817),
-(6157, 13814),
-(654, 5225),
-(654, 5149),
-(5225, 13816),
-(654, 5299),
-(5225, 13818),
-(5299, 13818),
-(654, 5388),
-(5299, 13819),
-(5388, 13819),
-(5388, 13817),
-(655, 9924),
-(655, 4809),
-(4809, 13820),
-(9924, 13820),
-(655, 5299),
-(9924, 13819),
-(655, 5143),
-(5143, 13818),
-(5143, 13821),
-(4809, 13821),
-(656, 9665),
-(656, 9752),
-(9752, 13822),
-(9665, 13822),
-(656, 4626),
-(9665, 13823),
-(4626, 13823),
-(656, 4809),
-(4626, 13820),
-(9752, 13821),
-(657, 9827),
-(657, 9747),
-(9747, 13824),
-(9827, 13824),
-(657, 9655),
-(9827, 13825),
-(9655, 13825),
-(657, 9665),
-(9655, 13823),
-(9747, 13822),
-(663, 9153),
-(663, 6652),
-(9153, 13815),
-(663, 5729),
-(9153, 13837),
-(5729, 13837),
-(663, 7477),
-(5729, 13838),
-(7477, 13838),
-(7477, 13812),
-(664, 9153),
-(664, 5886),
-(5886, 13837),
-(664, 9345),
-(9345, 13815),
-(664, 8240),
-(9345, 13839),
-(8240, 13839),
-(8240, 13840),
-(5886, 13840),
-(665, 8690),
-(665, 8819),
-(8819, 13841),
-(8690, 13841),
-(665, 8774),
-(8690, 13842),
-(8774, 13842),
-(665, 9203),
-(8774, 13843),
-(9203, 13843),
-(9203, 13844),
-(8819, 13844),
-(667, 8374),
-(667, 7343),
-(7343, 13848),
-(8374, 13848),
-(667, 8386),
-(8374, 13842),
-(8386, 13842),
-(667, 8742),
-(8386, 13839),
-(8742, 13839),
-(8742, 13849),
-(7343, 13849),
-(668, 7928),
-(668, 8166),
-(8166, 13850),
-(7928, 13850),
-(668, 7343),
-(7928, 13848),
-(668, 7935),
-(7935, 13849),
-(7935, 13851),
-(8166, 13851),
-(669, 5388),
-(669, 8001),
-(8001, 13817),
-(669, 7156),
-(7156, 13819),
-(669, 7256),
-(7156, 13852),
-(7256, 13852),
-(7256, 13851),
-(8001, 13851),
-(670, 7085),
-(670, 7240),
-(7240, 13853),
-(7085, 13853),
-(670, 7168),
-(7085, 13854),
-(7168, 13854),
-(670, 7044),
-(7168, 13855),
-(7044, 13855),
-(7044, 13856),
-(7240, 13856),
-(671, 7542),
-(671, 6816),
-(6816, 13857),
-(7542, 13857),
-(671, 6757),
-(7542, 13858),
-(6757, 13858),
-(671, 7240),
-(6757, 13853),
-(6816, 13856),
-(672, 8041),
-(672, 7422),
-(7422, 13859),
-(8041, 13859),
-(672, 7539),
-(8041, 13860),
-(7539, 13860),
-(672, 7542),
-(7539, 13858),
-(7422, 13857),
-(673, 5095),
-(673, 5583),
-(5583, 13861),
-(5095, 13861),
-(673, 8774),
-(5095, 13843),
-(673, 8374),
-(5583, 13848),
-(674, 7870),
-(674, 5867),
-(5867, 13862),
-(7870, 13862),
-(674, 5583),
-(7870, 13861),
-(674, 7928),
-(5867, 13850),
-(675, 6553),
-(675, 7168),
-(6553, 13854),
-(675, 5867),
-(6553, 13862),
-(675, 7832),
-(7832, 13850),
-(7832, 13855),
-(676, 6282),
-(676, 7085),
-(6282, 13853),
-(676, 12729),
-(12729, 13854),
-(677, 12752),
-(677, 6757),
-(12752, 13858),
-(677, 6282),
-(678, 7371),
-(678, 7539),
-(7371, 13860),
-(678, 12752),
-(679, 12790),
-(679, 7371),
-(679, 7216),
-(7216, 13860),
-(7216, 13865),
-(12790, 13865),
-(680, 8811),
-(680, 8634),
-(8634, 13866),
-(8811, 13866),
-(680, 5417),
-(8811, 13867),
-(5417, 13867),
-(680, 5675),
-(5417, 13868),
-(5675, 13868),
-(5675, 13869),
-(8634, 13869),
-(681, 5579),
-(681, 5183),
-(5183, 13870),
-(5579, 13870),
-(681, 8811),
-(5579, 13867),
-(681, 8471),
-(8471, 13866),
-(8471, 13871),
-(5183, 13871),
-(682, 6718),
-(682, 6528),
-(6528, 13872),
-(6718, 13872),
-(682, 6971),
-(6718, 13873),
-(6971, 13873),
-(682, 6897),
-(6971, 13874),
-(6897, 13874),
-(6897, 13875),
-(6528, 13875),
-(683, 6607),
-(683, 6971),
-(6607, 13874),
-(683, 6514),
-(6514, 13873),
-(684, 9865),
-(684, 6524),
-(9865, 13879),
-(6524, 13879),
-(684, 6607),
-(6524, 13874),
-(685, 5019),
-(685, 9779),
-(9779, 13880),
-(5019, 13880),
-(685, 6897),
-(5019, 13875),
-(685, 6524),
-(9779, 13879),
-(689, 7505),
-(689, 9434),
-(9434, 13883),
-(7505, 13883),
-(689, 8634),
-(7505, 13866),
-(689, 6399),
-(6399, 13869),
-(6399, 13884),
-(9434, 13884),
-(690, 5260),
-(690, 6528),
-(5260, 13875),
-(690, 9434),
-(5260, 13883),
-(690, 6200),
-(6200, 13884),
-(6200, 13872),
-(691, 9530),
-(691, 5000),
-(5000, 13885),
-(9530, 13885),
-(691, 5260),
-(9530, 13883),
-(691, 5019),
-(5000, 13880),
-(692, 8471),
-(692, 6116),
-(6116, 13871),
-(692, 7505),
-(692, 9530),
-(6116, 13885),
-(726, 4970),
-(726, 8806),
-(4970, 13938),
-(8806, 13938),
-(726, 8263),
-(8806, 13825),
-(8263, 13825),
-(761, 5579),
-(761, 8675),
-(8675, 13867),
-(761, 8753),
-(8753, 13870),
-(761, 8160),
-(8753, 13969),
-(8160, 13969),
-(8160, 13970),
-(8675, 13970),
-(762, 8564),
-(762, 8005),
-(8005, 13971),
-(8564, 13971),
-(762, 5183),
-(8564, 13870),
-(762, 9509),
-(9509, 13871),
-(9509, 13972),
-(8005, 13972),
-(763, 9865),
-(763, 7084),
-(7084, 13879),
-(763, 12738),
-(12738, 13973),
-(7084, 13973),
-(764, 7333),
-(764, 6646),
-(6646, 13974),
-(7333, 13974),
-(764, 9779),
-(7333, 13880),
-(764, 7084),
-(6646, 13973),
-(765, 7333),
-(765, 5000),
-(765, 7063),
-(7063, 13974),
-(765, 6954),
-(7063, 13975),
-(6954, 13975),
-(6954, 13885),
-(766, 9509),
-(766, 7487),
-(7487, 13972),
-(766, 6116),
-(766, 6954),
-(7487, 13975),
-(873, 8041),
-(873, 6914),
-(6914, 13860),
-(873, 6833),
-(6833, 13859),
-(960, 9827),
-(960, 8263),
-(960, 6661),
-(6661, 13824),
-(961, 5675),
-(961, 4613),
-(4613, 13869),
-(961, 4857),
-(4857, 13868),
-(961, 9203),
-(4857, 13844),
-(4613, 13843),
-(962, 5417),
-(962, 4857),
-(962, 8675),
-(962, 9576),
-(9576, 13970),
-(9576, 13844),
-(963, 8564),
-(963, 8753),
-(963, 7279),
-(7279, 13971),
-(963, 7595),
-(7279, 14162),
-(7595, 14162),
-(7595, 13969),
-(964, 7279),
-(964, 9361),
-(9361, 14162),
-(964, 8005),
-(964, 7375),
-(7375, 13972),
-(7375, 14163),
-(9361, 14163),
-(965, 7375),
-(965, 9446),
-(9446, 14163),
-(965, 7487),
-(965, 6611),
-(6611, 13975),
-(6611, 14164),
-(9446, 14164),
-(966, 6754),
-(966, 7063),
-(6754, 13974),
-(966, 8995),
-(6754, 14165),
-(8995, 14165),
-(966, 6611),
-(8995, 14164),
-(967, 6646),
-(967, 6754),
-(967, 6851),
-(6851, 13973),
-(967, 8907),
-(6851, 14166),
-(8907, 14166),
-(8907, 14165),
-(968, 7216),
-(968, 9573),
-(9573, 13865),
-(968, 6914),
-(969, 6399),
-(969, 8451),
-(8451, 13884),
-(969, 4613),
-(969, 5095),
-(8451, 13861),
-(970, 6200),
-(970, 9625),
-(9625, 13872),
-(970, 8451),
-(970, 7870),
-(9625, 13862),
-(971, 6718),
-(971, 5394),
-(5394, 13873),
-(971, 9625),
-(971, 6553),
-(5394, 13854),
-(972, 5394),
-(972, 6514),
-(972, 12729),
-(976, 12738),
-(976, 12790),
-(976, 4703),
-(4703, 13865),
-(4703, 13973),
-(978, 9573),
-(978, 4703),
-(978, 6851),
-(1150, 7367),
-(1150, 7073),
-(1150, 8160),
-(7073, 13970),
-(7367, 13969),
-(1151, 9719),
-(1151, 5886),
-(9719, 13837),
-(1151, 9891),
-(9891, 13840),
-(1152, 9719),
-(1152, 5729),
-(1152, 9634),
-(9634, 13838),
-(1153, 7073),
-(1153, 9576),
-(1153, 8491),
-(8491, 13844),
-(1155, 6102),
-(1155, 9361),
-(6102, 14162),
-(1155, 9048),
-(9048, 14163),
-(1156, 9048),
-(1156, 9446),
-(1156, 8944),
-(8944, 14164),
-(1157, 8944),
-(1157, 8995),
-(1157, 8657),
-(8657, 14165),
-(1158, 8907),
-(1158, 8657),
-(1161, 6102),
-(1161, 7367),
-(1161, 7595),
-(1162, 8491),
-(1162, 8819),
-(1162, 8447),
-(8447, 13841),
-(1404, 9924),
-(1404, 7156),
-(1404, 9231),
-(9231, 13820),
-(1404, 9311),
-(9231, 14385),
-(9311, 14385),
-(9311, 13852),
-(1405, 4626),
-(1405, 9231),
-(1405, 4824),
-(4824, 13823),
-(1405, 9380),
-(4824, 14386),
-(9380, 14386),
-(9380, 14385),
-(1406, 4946),
-(1406, 7422),
-(4946, 13857),
-(1406, 8862),
-(4946, 14386),
-(8862, 14386),
-(1406, 9169),
-(8862, 13938),
-(9169, 13938),
-(9169, 13859),
-(1532, 8690),
-(1532, 8386),
-(1532, 8011),
-(8011, 13841),
-(1532, 8240),
-(8011, 13840),
-(1534, 6317),
-(1534, 9345),
-(1534, 9013),
-(9013, 13814),
-(1534, 8742),
-(9013, 13849),
-(1535, 6157),
-(1535, 9013),
-(1535, 8001),
-(1535, 7935),
-(1536, 7832),
-(1536, 7492),
-(7492, 13855),
-(1536, 8166),
-(1536, 7256),
-(7492, 13852),
-(1537, 4970),
-(1537, 6833),
-(1537, 9169),
-(1544, 8447),
-(1544, 8011),
-(1544, 9891),
-(1547, 7044),
-(1547, 9884),
-(9884, 13856),
-(1547, 7492),
-(1547, 9311),
-(9884, 14385),
-(1548, 6816),
-(1548, 4946),
-(1548, 9884),
-(1548, 9380),
-(1549, 4824),
-(1549, 8862),
-(1549, 9655),
-(1549, 8806),
-(2008, 8790),
-(2008, 6862),
-(8790, 13812),
-(2008, 8085),
-(8790, 15189),
-(8085, 15189),
-(2008, 9034),
-(8085, 15190),
-(9034, 15190),
-(9034, 13813),
-(2009, 9034),
-(2009, 6574),
-(2009, 8602),
-(8602, 15190),
-(2009, 6676),
-(8602, 15191),
-(6676, 15191),
-(6676, 13816),
-(2010, 6676),
-(2010, 5225),
-(2010, 8231),
-(8231, 15191),
-(2010, 6838),
-(8231, 15192),
-(6838, 15192),
-(6838, 13818),
-(2011, 7410),
-(2011, 6490),
-(6490, 15193),
-(7410, 15193),
-(2011, 5143),
-(7410, 13821),
-(2011, 6838),
-(6490, 15192),
-(2012, 9752),
-(2012, 7301),
-(7301, 13822),
-(2012, 7410),
-(2012, 6403),
-(6403, 15193),
-(6403, 15194),
-(7301, 15194),
-(2013, 9747),
-(2013, 5666),
-(5666, 13824),
-(2013, 7301),
-(2013, 6306),
-(6306, 15194),
-(6306, 15195),
-(5666, 15195),
-(2019, 8790),
-(2019, 9510),
-(9510, 15189),
-(2019, 7477),
-(2019, 9162),
-(9162, 13838),
-(9162, 15205),
-(9510, 15205),
-(2020, 6916),
-(2020, 9510),
-(6916, 15205),
-(2020, 7317),
-(6916, 15206),
-(7317, 15206),
-(2020, 9339),
-(7317, 15207),
-(9339, 15207),
-(9339, 15189),
-(2021, 7821),
-(2021, 7954),
-(7954, 15208),
-(7821, 15208),
-(2021, 7906),
-(7821, 15209),
-(7906, 15209),
-(2021, 7655),
-(7906, 15210),
-(7655, 15210),
-(7655, 15211),
-(7954, 15211),
-(2023, 7745),
-(2023, 8422),
-(8422, 15215),
-(7745, 15215),
-(2023, 6364),
-(7745, 15216),
-(6364, 15216),
-(2023, 6800),
-(6364, 15207),
-(6800, 15207),
-(6800, 15211),
-(8422, 15211),
-(2024, 9901),
-(2024, 7653),
-(7653, 15217),
-(9901, 15217),
-(2024, 9638),
-(9901, 15218),
-(9638, 15218),
-(2024, 7745),
-(9638, 15216),
-(7653, 15215),
-(2025, 8926),
-(2025, 8231),
-(8926, 15191),
-(2025, 9635),
-(8926, 15218),
-(9635, 15218),
-(2025, 5872),
-(9635, 15219),
-(5872, 15219),
-(5872, 15192),
-(2026, 5444),
-(2026, 5597),
-(5597, 15220),
-(5444, 15220),
-(2026, 5520),
-(5444, 15221),
-(5520, 15221),
-(2026, 5966),
-(5520, 15222),
-(5966, 15222),
-(5966, 15223),
-(5597, 15223),
-(2027, 5356),
-(2027, 9107),
-(9107, 15224),
-(5356, 15224),
-(2027, 5444),
-(5356, 15221),
-(2027, 5774),
-(5774, 15220),
-(5774, 15225),
-(9107, 15225),
-(2028, 8983),
-(2028, 8931),
-(8931, 15226),
-(8983, 15226),
-(2028, 9107),
-(8983, 15224),
-(2028, 9101),
-(9101, 15225),
-(9101, 15227),
-(8931, 15227),
-(2029, 6680),
-(2029, 6178),
-(6178, 15228),
-(6680, 15228),
-(2029, 8422),
-(6680, 15215),
-(2029, 7655),
-(6178, 15210),
-(2030, 5587),
-(2030, 8762),
-(8762, 15229),
-(5587, 15229),
-(2030, 7653),
-(5587, 15217),
-(2030, 6680),
-(8762, 15228),
-(2031, 5966),
-(2031, 5248),
-(5248, 15223),
-(2031, 4861),
-(4861, 15222),
-(2031, 5587),
-(4861, 15217),
-(5248, 15229),
-(2032, 5597),
-(2032, 4921),
-(4921, 15220),
-(2032, 12698),
-(12698, 15223),
-(2033, 5774),
-(2033, 9358),
-(9358, 15225),
-(2033, 4921),
-(2034, 9101),
-(2034, 9617),
-(9617, 15227),
-(2034, 9358),
-(2035, 8283),
-(2035, 9480),
-(8283, 15234),
-(9480, 15234),
-(2035, 9617),
-(9480, 15227),
-(2036, 7813),
-(2036, 9616),
-(9616, 15235),
-(7813, 15235),
-(2036, 9727),
-(7813, 15236),
-(9727, 15236),
-(2036, 4623),
-(9727, 15237),
-(4623, 15237),
-(4623, 15238),
-(9616, 15238),
-(2037, 4789),
-(2037, 4879),
-(4879, 15239),
-(4789, 15239),
-(2037, 9450),
-(4789, 15240),
-(9450, 15240),
-(2037, 9616),
-(9450, 15235),
-(4879, 15238),
-(2038, 4955),
-(2038, 4783),
-(4783, 15241),
-(4955, 15241),
-(2038, 5874),
-(4955, 15242),
-(5874, 15242),
-(2038, 5788),
-(5874, 15243),
-(5788, 15243),
-(5788, 15244),
-(4783, 15244),
-(2039, 4854),
-(2039, 12695),
-(2039, 5788),
-(12695, 15244),
-(4854, 15243),
-(2040, 6837),
-(2040, 4854),
-(2040, 4775),
-(4775, 15243),
-(4775, 15247),
-(6837, 15247),
-(2041, 6747),
-(2041, 4967),
-(4967, 15248),
-(6747, 15248),
-(2041, 4775),
-(6747, 15247),
-(2041, 5874),
-(4967, 15242),
-(2045, 8367),
-(2045, 9066),
-(9066, 15251),
-(8367, 15251),
-(2045, 5655),
-(8367, 15252),
-(5655, 15252),
-(2045, 7813),
-(5655, 15236),
-(9066, 15235),
-(2046, 4955),
-(2046, 5221),
-(5221, 15242),
-(2046, 9117),
-(9117, 15241),
-(2046, 8367),
-(9117, 15252),
-(5221, 15251),
-(2047, 7978),
-(2047, 8437),
-(8437, 15253),
-(7978, 15253),
-(2047, 4967),
-(7978, 15248),
-(2047, 5221),
-(8437, 15251),
-(2048, 9038),
-(2048, 9450),
-(9038, 15240),
-(2048, 8437),
-(9038, 15253),
-(2048, 9066),
-(2082, 5428),
-(2082, 7387),
-(2082, 7467),
-(7387, 15195),
-(7467, 15195),
-(7467, 15309),
-(5428, 15309),
-(2117, 7762),
-(2117, 4879),
-(7762, 15238),
-(2117, 9197),
-(7762, 15339),
-(9197, 15339),
-(2117, 7674),
-(9197, 15340),
-(7674, 15340),
-(7674, 15239),
-(2118, 9734),
-(2118, 7764),
-(7764, 15341),
-(9734, 15341),
-(2118, 8315),
-(9734, 15342),
-(8315, 15342),
-(2118, 4789),
-(8315, 15240),
-(7764, 15239),
-(2119, 9771),
-(2119, 6837),
-(9771, 15247),
-(2119, 8848),
-(9771, 15343),
-(8848, 15343),
-(2120, 8758),
-(2120, 9766),
-(9766, 15345),
-(8758, 15345),
-(2120, 9771),
-(8758, 15343),
-(2120, 6747),
-(9766, 15248),
-(2121, 7978),
-(2121, 9766),
-(2121, 5644),
-(5644, 15253),
-(2121, 8687),
-(5644, 15346),
-(8687, 15346),
-(8687, 15345),
-(2122, 9557),
-(2122, 8315),
-(9557, 15342),
-(2122, 5644),
-(9557, 15346),
-(2122, 9038),
-(2229, 4779),
-(2229, 8931),
-(4779, 15227),
-(2229, 4858),
-(4858, 15226),
-(2316, 7387),
-(2316, 5666),
-(2316, 6661),
-(2317, 6899),
-(2317, 9727),
-(6899, 15236),
-(2317, 7906),
-(6899, 15210),
-(2317, 4917),
-(4917, 15209),
-(4917, 15237),
-(2318, 4917),
-(2318, 4623),
-(2318, 7858),
-(7858, 15209),
-(2318, 7762),
-(7858, 15339),
-(2319, 7674),
-(2319, 7764),
-(2319, 9268),
-(9268, 15340),
-(2319, 9792),
-(9268, 15531),
-(9792, 15531),
-(9792, 15341),
-(2320, 5117),
-(2320, 9792),
-(5117, 15531),
-(2320, 9584),
-(5117, 15532),
-(9584, 15532),
-(2320, 9734),
-(9584, 15342),
-(2321, 4866),
-(2321, 9584),
-(4866, 15532),
-(2321, 8783),
-(4866, 15533),
-(8783, 15533),
-(2321, 9557),
-(8783, 15346),
-(2322, 8687),
-(2322, 8547),
-(8547, 15345),
-(2322, 8783),
-(2322, 6991),
-(6991, 15533),
-(6991, 15534),
-(8547, 15534),
-(2323, 8547),
-(2323, 8758),
-(2323, 7071),
-(7071, 15534),
-(2323, 9132),
-(7071, 15535),
-(9132, 15535),
-(9132, 15343),
-(2324, 6623),
-(2324, 9480),
-(6623, 15234),
-(2324, 4779),
-(2325, 6779),
-(2325, 5655),
-(6779, 15252),
-(2325, 6178),
-(6779, 15228),
-(2325, 6899),
-(2326, 8526),
-(2326, 9117),
-(8526, 15241),
-(2326, 8762),
-(8526, 15229),
-(2326, 6779),
-(2327, 6640),
-(2327, 4783),
-(6640, 15244),
-(2327, 5248),
-(6640, 15223),
-(2327, 8526),
-(2328, 12695),
-(2328, 6640),
-(2328, 12698),
-(2332, 8848),
-(2332, 6050),
-(6050, 15343),
-(2332, 8283),
-(6050, 15234),
-(2334, 6050),
-(2334, 6623),
-(2334, 9132),
-(2506, 9580),
-(2506, 9197),
-(9580, 15340),
-(2506, 9651),
-(9651, 15339),
-(2507, 6477),
-(2507, 8341),
-(2507, 6916),
-(8341, 15206),
-(6477, 15205),
-(2508, 9162),
-(2508, 6477),
-(2508, 9634),
-(2509, 7858),
-(2509, 9651),
-(2509, 8126),
-(8126, 15209),
-(2511, 5324),
-(2511, 8535),
-(2511, 5117),
-(8535, 15532),
-(5324, 15531),
-(2512, 8535),
-(2512, 8461),
-(2512, 4866),
-(8461, 15533),
-(2513, 8461),
-(2513, 8274),
-(2513, 6991),
-(8274, 15534),
-(2514, 8274),
-(2514, 7071),
-(2517, 5324),
-(2517, 9268),
-(2517, 9580),
-(2518, 7821),
-(2518, 8126),
-(2518, 8209),
-(8209, 15208),
-(2780, 5872),
-(2780, 6490),
-(2780, 8413),
-(8413, 15219),
-(2780, 6785),
-(8413, 15756),
-(6785, 15756),
-(6785, 15193),
-(2781, 6785),
-(2781, 6403),
-(2781, 6368),
-(6368, 15756),
-(2781, 7022),
-(6368, 15757),
-(7022, 15757),
-(7022, 15194),
-(2782, 8983),
-(2782, 6554),
-(6554, 15224),
-(2782, 7490),
-(7490, 15226),
-(2782, 8178),
-(7490, 15309),
-(8178, 15309),
-(8178, 15757),
-(6554, 15757),
-(2908, 6800),
-(2908, 7954),
-(2908, 7317),
-(2908, 7224),
-(7224, 15206),
-(7224, 15208),
-(2910, 9339),
-(2910, 8085),
-(2910, 6364),
-(2910, 9222),
-(9222, 15216),
-(9222, 15190),
-(2911, 9222),
-(2911, 8602),
-(2911, 9638),
-(2911, 8926),
-(2912, 5193),
-(2912, 4861),
-(5193, 15222),
-(2912, 9635),
-(5193, 15219),
-(2912, 9901),
-(2913, 5428),
-(2913, 7490),
-(2913, 4858),
-(2920, 7224),
-(2920, 8209),
-(2920, 8341),
-(2923, 7473),
-(2923, 5520),
-(7473, 15221),
-(2923, 8413),
-(7473, 15756),
-(2923, 5193),
-(2924, 6554),
-(2924, 5356),
-(2924, 6368),
-(2924, 7473),
-(2925, 8178),
-(2925, 7022),
-(2925, 7467),
-(2925, 6306),
-    }
+    return _load_indices('nose')
 
 
 def get_mouth_indices():
-    return {
-(15798, 15846),
-(9732, 15798),
-(5181, 9732),
-(5181, 15846),
-(5191, 14433),
-(14433, 14488),
-(8429, 14488),
-(5191, 8429),
-(8812, 9535),
-(8812, 15851),
-(15799, 15851),
-(9535, 15799),
-(5340, 8904),
-(8904, 14492),
-(14436, 14492),
-(5340, 14436),
-(5699, 15805),
-(5699, 15809),
-(15805, 15809),
-(14439, 14443),
-(5574, 14443),
-(5574, 14439),
-(7004, 7722),
-(7722, 14431),
-(14431, 14495),
-(7004, 14495),
-(15804, 15858),
-(5343, 15804),
-(5343, 8225),
-(8225, 15858),
-(8818, 9444),
-(8818, 15850),
-(15800, 15850),
-(9444, 15800),
-(8225, 15859),
-(5343, 5887),
-(5887, 15859),
-(5106, 15803),
-(5106, 15857),
-(8483, 15857),
-(8483, 15803),
-(5191, 14434),
-(8429, 14487),
-(14434, 14487),
-(5758, 7237),
-(7237, 15798),
-(5758, 15846),
-(5765, 14435),
-(5765, 8569),
-(8569, 14490),
-(14435, 14490),
-(5958, 14441),
-(14441, 14486),
-(7298, 14486),
-(5958, 7298),
-(9266, 9605),
-(9605, 15853),
-(15801, 15853),
-(9266, 15801),
-(5601, 14498),
-(14439, 14498),
-(6119, 14439),
-(5601, 6119),
-(5171, 5689),
-(5689, 15806),
-(15806, 15849),
-(5171, 15849),
-(7237, 14431),
-(5758, 14495),
-(15802, 15855),
-(9173, 15802),
-(9173, 15855),
-(8398, 14437),
-(8398, 14494),
-(6370, 14494),
-(6370, 14437),
-(8054, 14497),
-(14438, 14497),
-(6370, 14438),
-(6370, 8054),
-(5340, 14435),
-(8904, 14490),
-(5709, 14440),
-(5709, 7222),
-(7222, 14482),
-(14440, 14482),
-(15807, 15847),
-(5689, 15807),
-(5171, 15847),
-(9739, 14443),
-(9739, 14498),
-(6280, 14437),
-(6280, 8398),
-(6280, 14436),
-(8398, 14492),
-(14432, 14483),
-(7722, 14432),
-(7004, 14483),
-(6746, 14486),
-(4602, 14441),
-(4602, 6746),
-(5887, 15809),
-(5887, 15805),
-(8812, 15853),
-(9535, 15801),
-(7222, 14483),
-(5709, 14432),
-(5343, 15805),
-(8054, 14494),
-(5586, 8732),
-(5586, 15849),
-(8732, 15806),
-(4602, 14440),
-(6746, 14482),
-(5601, 14497),
-(6119, 14438),
-(5765, 14434),
-(8569, 14487),
-(8732, 15800),
-(5586, 15850),
-(9732, 15807),
-(5181, 15847),
-(5958, 14433),
-(7298, 14488),
-(9605, 15855),
-(9266, 15802),
-(8483, 15855),
-(9173, 15803),
-(8818, 15851),
-(9444, 15799),
-(8905, 15857),
-(5106, 8905),
-(5106, 15804),
-(8905, 15858),
-(1407, 9184),
-(1407, 9286),
-(9286, 14387),
-(9184, 14387),
-(1407, 9283),
-(9184, 14388),
-(9283, 14388),
-(1407, 5034),
-(9283, 14389),
-(5034, 14389),
-(5034, 14390),
-(9286, 14390),
-(1408, 9556),
-(1408, 4875),
-(4875, 14391),
-(9556, 14391),
-(1408, 4958),
-(9556, 14392),
-(4958, 14392),
-(1408, 9184),
-(4958, 14388),
-(4875, 14387),
-(1409, 6049),
-(1409, 9797),
-(9797, 14393),
-(6049, 14393),
-(1409, 9537),
-(6049, 14394),
-(9537, 14394),
-(1409, 9556),
-(9537, 14392),
-(9797, 14391),
-(1410, 6473),
-(1410, 5869),
-(5869, 14395),
-(6473, 14395),
-(1410, 6049),
-(6473, 14394),
-(1410, 6207),
-(6207, 14393),
-(6207, 14396),
-(5869, 14396),
-(1411, 6129),
-(1411, 5705),
-(5705, 14397),
-(6129, 14397),
-(1411, 5869),
-(6129, 14395),
-(1411, 5838),
-(5838, 14396),
-(5838, 14398),
-(5705, 14398),
-(1412, 4615),
-(1412, 4874),
-(4874, 14399),
-(4615, 14399),
-(1412, 5705),
-(4615, 14397),
-(1412, 4704),
-(4704, 14398),
-(4704, 14400),
-(4874, 14400),
-(1413, 5120),
-(1413, 8062),
-(8062, 14401),
-(5120, 14401),
-(1413, 4874),
-(5120, 14399),
-(1413, 4851),
-(4851, 14400),
-(4851, 14402),
-(8062, 14402),
-(1414, 7900),
-(1414, 8068),
-(8068, 14403),
-(7900, 14403),
-(1414, 7982),
-(7900, 14404),
-(7982, 14404),
-(1414, 8827),
-(7982, 14405),
-(8827, 14405),
-(8827, 14406),
-(8068, 14406),
-(1415, 8911),
-(1415, 8362),
-(8362, 14407),
-(8911, 14407),
-(1415, 7982),
-(8911, 14405),
-(1415, 9014),
-(9014, 14404),
-(9014, 14408),
-(8362, 14408),
-(1416, 8438),
-(1416, 5120),
-(8438, 14401),
-(1416, 7230),
-(8438, 14409),
-(7230, 14409),
-(1416, 9728),
-(7230, 14410),
-(9728, 14410),
-(9728, 14399),
-(1417, 4615),
-(1417, 9290),
-(9290, 14397),
-(1417, 9728),
-(1417, 7818),
-(7818, 14410),
-(7818, 14411),
-(9290, 14411),
-(1418, 6129),
-(1418, 9941),
-(9941, 14395),
-(1418, 9290),
-(1418, 7404),
-(7404, 14411),
-(7404, 14412),
-(9941, 14412),
-(1419, 6473),
-(1419, 4988),
-(4988, 14394),
-(1419, 9941),
-(1419, 6983),
-(6983, 14412),
-(6983, 14413),
-(4988, 14413),
-(1420, 9537),
-(1420, 5216),
-(5216, 14392),
-(1420, 4988),
-(1420, 6913),
-(6913, 14413),
-(6913, 14414),
-(5216, 14414),
-(1421, 4958),
-(1421, 5860),
-(5860, 14388),
-(1421, 5216),
-(1421, 6832),
-(6832, 14414),
-(6832, 14415),
-(5860, 14415),
-(1422, 9283),
-(1422, 7245),
-(7245, 14389),
-(1422, 5860),
-(1422, 6381),
-(6381, 14415),
-(6381, 14416),
-(7245, 14416),
-(1423, 6552),
-(1423, 5094),
-(5094, 14417),
-(6552, 14417),
-(1423, 9856),
-(6552, 14418),
-(9856, 14418),
-(1423, 8911),
-(9856, 14405),
-(5094, 14407),
-(1424, 9286),
-(1424, 7457),
-(7457, 14387),
-(1424, 7373),
-(7373, 14390),
-(1425, 8545),
-(1425, 4875),
-(8545, 14391),
-(1425, 7457),
-(1426, 8543),
-(1426, 9797),
-(8543, 14393),
-(1426, 8545),
-(1427, 6207),
-(1427, 8477),
-(8477, 14396),
-(1427, 8543),
-(1428, 5838),
-(1428, 8446),
-(8446, 14398),
-(1428, 8477),
-(1429, 4704),
-(1429, 7190),
-(7190, 14400),
-(1429, 8446),
-(1430, 4851),
-(1430, 8630),
-(8630, 14402),
-(1430, 7190),
-(1431, 7782),
-(1431, 8068),
-(7782, 14403),
-(1431, 4731),
-(4731, 14406),
-(1432, 8827),
-(1432, 5083),
-(5083, 14406),
-(1432, 9856),
-(1432, 7137),
-(7137, 14418),
-(7137, 14419),
-(5083, 14419),
-(1433, 8062),
-(1433, 9419),
-(9419, 14401),
-(1433, 9150),
-(9150, 14402),
-(1433, 7137),
-(9150, 14419),
-(9419, 14418),
-(1434, 8438),
-(1434, 5401),
-(5401, 14409),
-(1434, 9419),
-(1434, 6552),
-(5401, 14417),
-(1435, 4675),
-(1435, 7640),
-(7640, 14420),
-(4675, 14420),
-(1435, 8362),
-(4675, 14407),
-(1435, 5575),
-(5575, 14408),
-(5575, 14421),
-(7640, 14421),
-(1436, 7470),
-(1436, 5301),
-(5301, 14422),
-(7470, 14422),
-(1436, 5224),
-(7470, 14423),
-(5224, 14423),
-(1436, 7818),
-(5224, 14411),
-(5301, 14410),
-(1437, 7050),
-(1437, 5224),
-(7050, 14423),
-(1437, 5153),
-(7050, 14424),
-(5153, 14424),
-(1437, 7404),
-(5153, 14412),
-(1438, 8574),
-(1438, 5153),
-(8574, 14424),
-(1438, 5373),
-(8574, 14425),
-(5373, 14425),
-(1438, 6983),
-(5373, 14413),
-(1439, 8495),
-(1439, 5373),
-(8495, 14425),
-(1439, 5615),
-(8495, 14426),
-(5615, 14426),
-(1439, 6913),
-(5615, 14414),
-(1440, 9076),
-(1440, 5615),
-(9076, 14426),
-(1440, 5515),
-(9076, 14427),
-(5515, 14427),
-(1440, 6832),
-(5515, 14415),
-(1441, 8656),
-(1441, 5515),
-(8656, 14427),
-(1441, 7482),
-(8656, 14428),
-(7482, 14428),
-(1441, 6381),
-(7482, 14416),
-(1442, 5401),
-(1442, 6142),
-(6142, 14409),
-(1442, 7739),
-(7739, 14417),
-(1442, 8204),
-(7739, 14429),
-(8204, 14429),
-(8204, 14430),
-(6142, 14430),
-(1443, 7739),
-(1443, 6919),
-(6919, 14429),
-(1443, 5094),
-(1443, 4675),
-(6919, 14420),
-(1444, 6699),
-(1444, 6142),
-(6699, 14430),
-(1444, 5301),
-(6699, 14422),
-(1444, 7230),
-(1445, 6959),
-(1445, 7640),
-(6959, 14421),
-(1445, 7722),
-(6959, 14431),
-(1445, 8445),
-(8445, 14432),
-(8445, 14420),
-(1446, 7470),
-(1446, 8785),
-(8785, 14423),
-(1446, 8872),
-(8872, 14422),
-(1446, 5191),
-(8872, 14433),
-(8785, 14434),
-(1447, 7050),
-(1447, 6778),
-(6778, 14424),
-(1447, 8785),
-(1447, 5765),
-(6778, 14435),
-(1448, 8574),
-(1448, 7031),
-(7031, 14425),
-(1448, 6778),
-(1448, 5340),
-(7031, 14436),
-(1449, 8495),
-(1449, 6610),
-(6610, 14426),
-(1449, 7031),
-(1449, 6280),
-(6610, 14437),
-(1450, 9076),
-(1450, 6753),
-(6753, 14427),
-(1450, 6610),
-(1450, 6370),
-(6753, 14438),
-(1451, 8656),
-(1451, 7661),
-(7661, 14428),
-(1451, 6753),
-(1451, 6119),
-(7661, 14439),
-(1452, 8204),
-(1452, 6834),
-(6834, 14430),
-(1452, 7557),
-(7557, 14429),
-(1452, 4602),
-(7557, 14440),
-(6834, 14441),
-(1453, 6919),
-(1453, 7557),
-(1453, 8445),
-(1453, 5709),
-(1454, 6699),
-(1454, 8872),
-(1454, 6834),
-(1454, 5958),
-(1455, 6589),
-(1455, 5104),
-(5104, 14442),
-(6589, 14442),
-(1455, 7661),
-(6589, 14428),
-(1455, 5574),
-(5104, 14443),
-(1456, 4731),
-(1456, 5083),
-(1456, 9149),
-(9149, 14419),
-(1457, 8630),
-(1457, 9149),
-(1457, 9150),
-(1458, 9615),
-(1458, 9759),
-(9759, 14444),
-(9615, 14444),
-(1458, 9705),
-(9615, 14445),
-(9705, 14445),
-(1458, 9442),
-(9705, 14446),
-(9442, 14446),
-(9442, 14447),
-(9759, 14447),
-(1459, 9347),
-(1459, 9350),
-(9350, 14448),
-(9347, 14448),
-(1459, 9705),
-(9347, 14446),
-(1459, 8735),
-(8735, 14445),
-(8735, 14449),
-(9350, 14449),
-(1460, 9242),
-(1460, 9873),
-(9873, 14450),
-(9242, 14450),
-(1460, 9350),
-(9242, 14448),
-(1460, 9346),
-(9346, 14449),
-(9346, 14451),
-(9873, 14451),
-(1461, 5015),
-(1461, 5103),
-(5103, 14452),
-(5015, 14452),
-(1461, 5099),
-(5015, 14453),
-(5099, 14453),
-(1461, 4850),
-(5099, 14454),
-(4850, 14454),
-(4850, 14455),
-(5103, 14455),
-(1462, 5023),
-(1462, 6030),
-(6030, 14456),
-(5023, 14456),
-(1462, 5103),
-(5023, 14452),
-(1462, 9869),
-(9869, 14455),
-(9869, 14457),
-(6030, 14457),
-(1463, 5931),
-(1463, 6543),
-(6543, 14458),
-(5931, 14458),
-(1463, 6030),
-(5931, 14456),
-(1463, 6025),
-(6025, 14457),
-(6025, 14459),
-(6543, 14459),
-(1464, 6448),
-(1464, 5681),
-(5681, 14460),
-(6448, 14460),
-(1464, 6543),
-(6448, 14458),
-(1464, 6194),
-(6194, 14459),
-(6194, 14461),
-(5681, 14461),
-(1465, 5543),
-(1465, 5501),
-(5501, 14462),
-(5543, 14462),
-(1465, 5681),
-(5543, 14460),
-(1465, 5679),
-(5679, 14461),
-(5679, 14463),
-(5501, 14463),
-(1466, 8016),
-(1466, 9442),
-(8016, 14446),
-(1466, 8048),
-(8016, 14464),
-(8048, 14464),
-(1466, 7779),
-(8048, 14465),
-(7779, 14465),
-(7779, 14447),
-(1467, 5209),
-(1467, 9347),
-(5209, 14448),
-(1467, 7948),
-(5209, 14466),
-(7948, 14466),
-(1467, 8016),
-(7948, 14464),
-(1468, 8486),
-(1468, 5811),
-(5811, 14467),
-(8486, 14467),
-(1468, 5209),
-(8486, 14466),
-(1468, 9242),
-(5811, 14450),
-(1469, 5015),
-(1469, 6499),
-(6499, 14453),
-(1469, 6073),
-(6073, 14452),
-(1469, 8989),
-(6073, 14468),
-(8989, 14468),
-(8989, 14469),
-(6499, 14469),
-(1470, 5023),
-(1470, 6073),
-(1470, 9649),
-(9649, 14456),
-(1470, 8901),
-(9649, 14470),
-(8901, 14470),
-(8901, 14468),
-(1471, 5931),
-(1471, 9649),
-(1471, 9202),
-(9202, 14458),
-(1471, 8813),
-(9202, 14471),
-(8813, 14471),
-(8813, 14470),
-(1472, 7808),
-(1472, 7207),
-(7207, 14444),
-(7808, 14444),
-(1472, 4672),
-(7808, 14472),
-(4672, 14472),
-(1473, 8735),
-(1473, 6366),
-(6366, 14449),
-(1473, 7132),
-(7132, 14445),
-(1474, 9346),
-(1474, 6865),
-(6865, 14451),
-(1474, 6366),
-(1475, 4850),
-(1475, 7054),
-(7054, 14455),
-(1475, 6251),
-(6251, 14454),
-(1476, 9869),
-(1476, 7391),
-(7391, 14457),
-(1476, 7054),
-(1477, 6025),
-(1477, 7735),
-(7735, 14459),
-(1477, 7391),
-(1478, 6194),
-(1478, 7408),
-(7408, 14461),
-(1478, 7735),
-(1479, 5679),
-(1479, 7108),
-(7108, 14463),
-(1479, 7408),
-(1480, 7045),
-(1480, 7201),
-(7201, 14473),
-(7045, 14473),
-(1480, 7808),
-(7045, 14472),
-(1480, 9759),
-(7201, 14447),
-(1481, 9343),
-(1481, 5099),
-(9343, 14453),
-(1481, 9873),
-(9343, 14450),
-(1481, 9356),
-(9356, 14451),
-(9356, 14454),
-(1482, 7779),
-(1482, 7201),
-(1482, 8745),
-(8745, 14465),
-(1482, 7635),
-(8745, 14474),
-(7635, 14474),
-(7635, 14473),
-(1483, 9343),
-(1483, 5811),
-(1483, 6499),
-(1483, 8196),
-(8196, 14469),
-(8196, 14467),
-(1484, 9002),
-(1484, 6817),
-(6817, 14475),
-(9002, 14475),
-(1484, 8196),
-(9002, 14467),
-(1484, 8408),
-(8408, 14469),
-(8408, 14476),
-(6817, 14476),
-(1485, 7534),
-(1485, 9401),
-(9401, 14477),
-(7534, 14477),
-(1485, 9202),
-(7534, 14471),
-(1485, 6448),
-(9401, 14460),
-(1486, 6628),
-(1486, 9310),
-(9310, 14478),
-(6628, 14478),
-(1486, 9401),
-(6628, 14477),
-(1486, 5543),
-(9310, 14462),
-(1487, 6465),
-(1487, 6903),
-(6903, 14479),
-(6465, 14479),
-(1487, 6814),
-(6465, 14480),
-(6814, 14480),
-(1487, 6628),
-(6814, 14477),
-(6903, 14478),
-(1488, 6980),
-(1488, 7142),
-(7142, 14481),
-(6980, 14481),
-(1488, 7222),
-(6980, 14482),
-(1488, 7481),
-(7481, 14483),
-(7481, 14484),
-(7142, 14484),
-(1489, 7307),
-(1489, 7211),
-(7211, 14485),
-(7307, 14485),
-(1489, 6746),
-(7307, 14486),
-(1489, 6980),
-(7211, 14481),
-(1490, 6485),
-(1490, 6817),
-(6485, 14476),
-(1490, 8429),
-(6485, 14487),
-(1490, 6397),
-(6397, 14488),
-(6397, 14475),
-(1491, 8909),
-(1491, 6299),
-(6299, 14489),
-(8909, 14489),
-(1491, 8569),
-(8909, 14490),
-(1491, 6485),
-(6299, 14476),
-(1492, 8141),
-(1492, 8998),
-(8998, 14491),
-(8141, 14491),
-(1492, 8904),
-(8141, 14492),
-(1492, 8909),
-(8998, 14489),
-(1493, 7979),
-(1493, 8206),
-(8206, 14493),
-(7979, 14493),
-(1493, 8398),
-(7979, 14494),
-(1493, 8141),
-(8206, 14491),
-(1494, 7481),
-(1494, 6938),
-(6938, 14484),
-(1494, 7004),
-(1494, 5115),
-(5115, 14495),
-(5115, 14496),
-(6938, 14496),
-(1495, 6397),
-(1495, 6179),
-(6179, 14475),
-(1495, 7298),
-(1495, 7307),
-(6179, 14485),
-(1496, 7690),
-(1496, 7318),
-(7318, 14480),
-(7690, 14480),
-(1496, 8054),
-(7690, 14497),
-(1496, 7979),
-(7318, 14493),
-(1497, 7923),
-(1497, 6465),
-(7923, 14479),
-(1497, 5601),
-(7923, 14498),
-(1497, 7690),
-(1498, 5104),
-(1498, 7192),
-(7192, 14442),
-(1498, 9739),
-(1498, 7923),
-(7192, 14479),
-(1499, 7142),
-(1499, 9035),
-(9035, 14481),
-(1499, 9306),
-(9306, 14484),
-(1499, 8048),
-(9306, 14465),
-(9035, 14464),
-(1500, 9743),
-(1500, 7948),
-(9743, 14466),
-(1500, 7211),
-(9743, 14485),
-(1500, 9035),
-(1501, 9002),
-(1501, 8486),
-(1501, 6179),
-(1501, 9743),
-(1502, 5059),
-(1502, 8989),
-(5059, 14468),
-(1502, 6299),
-(5059, 14489),
-(1502, 8408),
-(1503, 8998),
-(1503, 9813),
-(9813, 14491),
-(1503, 5059),
-(1503, 8901),
-(9813, 14470),
-(1504, 8206),
-(1504, 6141),
-(6141, 14493),
-(1504, 9813),
-(1504, 8813),
-(6141, 14471),
-(1505, 6938),
-(1505, 9306),
-(1505, 5859),
-(5859, 14496),
-(1505, 8745),
-(5859, 14474),
-(1506, 7318),
-(1506, 6814),
-(1506, 6141),
-(1506, 7534),
-(1507, 7207),
-(1507, 7132),
-(1507, 9615),
-(1508, 6865),
-(1508, 6251),
-(1508, 9356),
-(1509, 7785),
-(1509, 5995),
-(5995, 14499),
-(7785, 14499),
-(1509, 7108),
-(7785, 14463),
-(1510, 8627),
-(1510, 7373),
-(8627, 14390),
-(1510, 5995),
-(8627, 14499),
-(1511, 7855),
-(1511, 6127),
-(6127, 14500),
-(7855, 14500),
-(1511, 5501),
-(7855, 14462),
-(1511, 7785),
-(6127, 14499),
-(1512, 8697),
-(1512, 5034),
-(8697, 14389),
-(1512, 6127),
-(8697, 14500),
-(1512, 8627),
-(1513, 4957),
-(1513, 6045),
-(6045, 14501),
-(4957, 14501),
-(1513, 9310),
-(4957, 14478),
-(1513, 7855),
-(6045, 14500),
-(1514, 6045),
-(1514, 8100),
-(8100, 14501),
-(1514, 8697),
-(1514, 7245),
-(8100, 14416),
-(1515, 4957),
-(1515, 6903),
-(1515, 9648),
-(9648, 14501),
-(1515, 7192),
-(9648, 14442),
-(1516, 6589),
-(1516, 7482),
-(1516, 9648),
-(1516, 8100),
-(2783, 6905),
-(2783, 6361),
-(6361, 15758),
-(6905, 15758),
-(2783, 6633),
-(6905, 15759),
-(6633, 15759),
-(2783, 6037),
-(6633, 15760),
-(6037, 15760),
-(6037, 15761),
-(6361, 15761),
-(2784, 6621),
-(2784, 5862),
-(5862, 15762),
-(6621, 15762),
-(2784, 6361),
-(6621, 15758),
-(2784, 6014),
-(6014, 15761),
-(6014, 15763),
-(5862, 15763),
-(2785, 5425),
-(2785, 5703),
-(5703, 15764),
-(5425, 15764),
-(2785, 5862),
-(5425, 15762),
-(2785, 5500),
-(5500, 15763),
-(5500, 15765),
-(5703, 15765),
-(2786, 6212),
-(2786, 5781),
-(5781, 15766),
-(6212, 15766),
-(2786, 5840),
-(6212, 15767),
-(5840, 15767),
-(2786, 5703),
-(5840, 15764),
-(5781, 15765),
-(2787, 6742),
-(2787, 5776),
-(5776, 15768),
-(6742, 15768),
-(2787, 5865),
-(6742, 15769),
-(5865, 15769),
-(2787, 6212),
-(5865, 15767),
-(5776, 15766),
-(2788, 6561),
-(2788, 6981),
-(6981, 15770),
-(6561, 15770),
-(2788, 6723),
-(6561, 15771),
-(6723, 15771),
-(2788, 6742),
-(6723, 15769),
-(6981, 15768),
-(2789, 7736),
-(2789, 6128),
-(6128, 15772),
-(7736, 15772),
-(2789, 6204),
-(7736, 15773),
-(6204, 15773),
-(2789, 6561),
-(6204, 15771),
-(6128, 15770),
-(2790, 5889),
-(2790, 7900),
-(5889, 14403),
-(2790, 8060),
-(5889, 15774),
-(8060, 15774),
-(2790, 5623),
-(8060, 15775),
-(5623, 15775),
-(5623, 14404),
-(2791, 6923),
-(2791, 7313),
-(7313, 15776),
-(6923, 15776),
-(2791, 9014),
-(6923, 14408),
-(2791, 5623),
-(7313, 15775),
-(2792, 6128),
-(2792, 7988),
-(7988, 15772),
-(2792, 5708),
-(5708, 15770),
-(2792, 7149),
-(5708, 15777),
-(7149, 15777),
-(7149, 15778),
-(7988, 15778),
-(2793, 6216),
-(2793, 6981),
-(6216, 15768),
-(2793, 7204),
-(6216, 15779),
-(7204, 15779),
-(2793, 5708),
-(7204, 15777),
-(2794, 6482),
-(2794, 5776),
-(6482, 15766),
-(2794, 9629),
-(6482, 15780),
-(9629, 15780),
-(2794, 6216),
-(9629, 15779),
-(2795, 7268),
-(2795, 5781),
-(7268, 15765),
-(2795, 9897),
-(7268, 15781),
-(9897, 15781),
-(2795, 6482),
-(9897, 15780),
-(2796, 9489),
-(2796, 5500),
-(9489, 15763),
-(2796, 4782),
-(9489, 15782),
-(4782, 15782),
-(2796, 7268),
-(4782, 15781),
-(2797, 9022),
-(2797, 6014),
-(9022, 15761),
-(2797, 4711),
-(9022, 15783),
-(4711, 15783),
-(2797, 9489),
-(4711, 15782),
-(2798, 9096),
-(2798, 6037),
-(9096, 15760),
-(2798, 5273),
-(9096, 15784),
-(5273, 15784),
-(2798, 9022),
-(5273, 15783),
-(2799, 6898),
-(2799, 5124),
-(5124, 15785),
-(6898, 15785),
-(2799, 7313),
-(6898, 15776),
-(2799, 6809),
-(6809, 15775),
-(6809, 15786),
-(5124, 15786),
-(2800, 9814),
-(2800, 6905),
-(9814, 15758),
-(2800, 5405),
-(5405, 15759),
-(2801, 4674),
-(2801, 9814),
-(2801, 6621),
-(4674, 15762),
-(2802, 6698),
-(2802, 4674),
-(2802, 5425),
-(6698, 15764),
-(2803, 6808),
-(2803, 5840),
-(6808, 15767),
-(2803, 6698),
-(2804, 7455),
-(2804, 5865),
-(7455, 15769),
-(2804, 6808),
-(2805, 7459),
-(2805, 6723),
-(7459, 15771),
-(2805, 7455),
-(2806, 6024),
-(2806, 6204),
-(6024, 15773),
-(2806, 7459),
-(2807, 7782),
-(2807, 7124),
-(2807, 5889),
-(7124, 15774),
-(2808, 5665),
-(2808, 8060),
-(5665, 15774),
-(2808, 5031),
-(5665, 15787),
-(5031, 15787),
-(2808, 6809),
-(5031, 15786),
-(2809, 5983),
-(2809, 7736),
-(5983, 15772),
-(2809, 5031),
-(5983, 15786),
-(2809, 6082),
-(6082, 15787),
-(6082, 15773),
-(2810, 6519),
-(2810, 7988),
-(6519, 15778),
-(2810, 5124),
-(6519, 15785),
-(2810, 5983),
-(2811, 9661),
-(2811, 6793),
-(6793, 15788),
-(9661, 15788),
-(2811, 5575),
-(9661, 14421),
-(2811, 6923),
-(6793, 15776),
-(2812, 6012),
-(2812, 9455),
-(9455, 15789),
-(6012, 15789),
-(2812, 7204),
-(6012, 15777),
-(2812, 5089),
-(5089, 15779),
-(5089, 15790),
-(9455, 15790),
-(2813, 5089),
-(2813, 9377),
-(9377, 15790),
-(2813, 9629),
-(2813, 4974),
-(4974, 15780),
-(4974, 15791),
-(9377, 15791),
-(2814, 4974),
-(2814, 8598),
-(8598, 15791),
-(2814, 9897),
-(2814, 5541),
-(5541, 15781),
-(5541, 15792),
-(8598, 15792),
-(2815, 5541),
-(2815, 8835),
-(8835, 15792),
-(2815, 4782),
-(2815, 5136),
-(5136, 15782),
-(5136, 15793),
-(8835, 15793),
-(2816, 5136),
-(2816, 8443),
-(8443, 15793),
-(2816, 4711),
-(2816, 4726),
-(4726, 15783),
-(4726, 15794),
-(8443, 15794),
-(2817, 4726),
-(2817, 8372),
-(8372, 15794),
-(2817, 5273),
-(2817, 4621),
-(4621, 15784),
-(4621, 15795),
-(8372, 15795),
-(2818, 5740),
-(2818, 6519),
-(5740, 15778),
-(2818, 8670),
-(5740, 15796),
-(8670, 15796),
-(2818, 6660),
-(8670, 15797),
-(6660, 15797),
-(6660, 15785),
-(2819, 7176),
-(2819, 6660),
-(7176, 15797),
-(2819, 6793),
-(7176, 15788),
-(2819, 6898),
-(2820, 5740),
-(2820, 9206),
-(9206, 15796),
-(2820, 7149),
-(2820, 6012),
-(9206, 15789),
-(2821, 9661),
-(2821, 6959),
-(2821, 7261),
-(7261, 15788),
-(2821, 7237),
-(7261, 15798),
-(2822, 7392),
-(2822, 9455),
-(7392, 15790),
-(2822, 9444),
-(7392, 15799),
-(2822, 7601),
-(7601, 15800),
-(7601, 15789),
-(2823, 8050),
-(2823, 9377),
-(8050, 15791),
-(2823, 9535),
-(8050, 15801),
-(2823, 7392),
-(2824, 8279),
-(2824, 8598),
-(8279, 15792),
-(2824, 9266),
-(8279, 15802),
-(2824, 8050),
-(2825, 7863),
-(2825, 8835),
-(7863, 15793),
-(2825, 9173),
-(7863, 15803),
-(2825, 8279),
-(2826, 7809),
-(2826, 8443),
-(7809, 15794),
-(2826, 5106),
-(7809, 15804),
-(2826, 7863),
-(2827, 9151),
-(2827, 8372),
-(9151, 15795),
-(2827, 5343),
-(9151, 15805),
-(2827, 7809),
-(2828, 9424),
-(2828, 8670),
-(9424, 15796),
-(2828, 5689),
-(9424, 15806),
-(2828, 9564),
-(9564, 15807),
-(9564, 15797),
-(2829, 9564),
-(2829, 7176),
-(2829, 9732),
-(2829, 7261),
-(2830, 7601),
-(2830, 9206),
-(2830, 8732),
-(2830, 9424),
-(2831, 9880),
-(2831, 9308),
-(9308, 15808),
-(9880, 15808),
-(2831, 5699),
-(9880, 15809),
-(2831, 9151),
-(9308, 15795),
-(2832, 7124),
-(2832, 7671),
-(2832, 5665),
-(7671, 15787),
-(2833, 6024),
-(2833, 6082),
-(2833, 7671),
-(2834, 4701),
-(2834, 9874),
-(9874, 15810),
-(4701, 15810),
-(2834, 7140),
-(4701, 15811),
-(7140, 15811),
-(2834, 6907),
-(7140, 15812),
-(6907, 15812),
-(6907, 15813),
-(9874, 15813),
-(2835, 7724),
-(2835, 7469),
-(7469, 15814),
-(7724, 15814),
-(2835, 7522),
-(7724, 15815),
-(7522, 15815),
-(2835, 6907),
-(7522, 15813),
-(7469, 15812),
-(2836, 7888),
-(2836, 7638),
-(7638, 15816),
-(7888, 15816),
-(2836, 8045),
-(7888, 15817),
-(8045, 15817),
-(2836, 7724),
-(8045, 15815),
-(7638, 15814),
-(2837, 8053),
-(2837, 7879),
-(7879, 15818),
-(8053, 15818),
-(2837, 6459),
-(8053, 15819),
-(6459, 15819),
-(2837, 6201),
-(6459, 15820),
-(6201, 15820),
-(6201, 15821),
-(7879, 15821),
-(2838, 7051),
-(2838, 7806),
-(7806, 15822),
-(7051, 15822),
-(2838, 6469),
-(7051, 15823),
-(6469, 15823),
-(2838, 8053),
-(6469, 15819),
-(7806, 15818),
-(2839, 5864),
-(2839, 6976),
-(6976, 15824),
-(5864, 15824),
-(2839, 6028),
-(5864, 15825),
-(6028, 15825),
-(2839, 7051),
-(6028, 15823),
-(6976, 15822),
-(2840, 6040),
-(2840, 6458),
-(6458, 15826),
-(6040, 15826),
-(2840, 5851),
-(6040, 15827),
-(5851, 15827),
-(2840, 5864),
-(5851, 15825),
-(6458, 15824),
-(2841, 5499),
-(2841, 5951),
-(5951, 15828),
-(5499, 15828),
-(2841, 5664),
-(5499, 15829),
-(5664, 15829),
-(2841, 6040),
-(5664, 15827),
-(5951, 15826),
-(2842, 7140),
-(2842, 8591),
-(8591, 15812),
-(2842, 8541),
-(8541, 15811),
-(2842, 6358),
-(8541, 15830),
-(6358, 15830),
-(6358, 15831),
-(8591, 15831),
-(2843, 7469),
-(2843, 8865),
-(8865, 15814),
-(2843, 8591),
-(2843, 6812),
-(6812, 15831),
-(6812, 15832),
-(8865, 15832),
-(2844, 9136),
-(2844, 6532),
-(6532, 15833),
-(9136, 15833),
-(2844, 7638),
-(9136, 15816),
-(2844, 8865),
-(6532, 15832),
-(2845, 9921),
-(2845, 7879),
-(9921, 15821),
-(2845, 6716),
-(9921, 15834),
-(6716, 15834),
-(2845, 9316),
-(6716, 15835),
-(9316, 15835),
-(9316, 15818),
-(2846, 9316),
-(2846, 7806),
-(2846, 7799),
-(7799, 15835),
-(2846, 9935),
-(7799, 15836),
-(9935, 15836),
-(9935, 15822),
-(2847, 9935),
-(2847, 6976),
-(2847, 7541),
-(7541, 15836),
-(2847, 5482),
-(7541, 15837),
-(5482, 15837),
-(5482, 15824),
-(2848, 8102),
-(2848, 9770),
-(9770, 15810),
-(8102, 15810),
-(2848, 4672),
-(9770, 14472),
-(2849, 6384),
-(2849, 7522),
-(6384, 15815),
-(2849, 5836),
-(5836, 15813),
-(2850, 6289),
-(2850, 8045),
-(6289, 15817),
-(2850, 6384),
-(2851, 6906),
-(2851, 6459),
-(6906, 15819),
-(2851, 6039),
-(6039, 15820),
-(2852, 6110),
-(2852, 6469),
-(6110, 15823),
-(2852, 6906),
-(2853, 6104),
-(2853, 6028),
-(6104, 15825),
-(2853, 6110),
-(2854, 5460),
-(2854, 5851),
-(5460, 15827),
-(2854, 6104),
-(2855, 5463),
-(2855, 5664),
-(5463, 15829),
-(2855, 5460),
-(2856, 9331),
-(2856, 7045),
-(9331, 14473),
-(2856, 4701),
-(9331, 15811),
-(2856, 9770),
-(2857, 6201),
-(2857, 8193),
-(8193, 15821),
-(2857, 8120),
-(8120, 15820),
-(2857, 7888),
-(8120, 15817),
-(8193, 15816),
-(2858, 9331),
-(2858, 8541),
-(2858, 7635),
-(2858, 6400),
-(6400, 14474),
-(6400, 15830),
-(2859, 9136),
-(2859, 8193),
-(2859, 6619),
-(6619, 15833),
-(2859, 9921),
-(6619, 15834),
-(2860, 7199),
-(2860, 6263),
-(6263, 15838),
-(7199, 15838),
-(2860, 6367),
-(7199, 15839),
-(6367, 15839),
-(2860, 6619),
-(6367, 15834),
-(6263, 15833),
-(2861, 4965),
-(2861, 8125),
-(8125, 15840),
-(4965, 15840),
-(2861, 6458),
-(4965, 15826),
-(2861, 5482),
-(8125, 15837),
-(2862, 6567),
-(2862, 7711),
-(7711, 15841),
-(6567, 15841),
-(2862, 5951),
-(6567, 15828),
-(2862, 4965),
-(7711, 15840),
-(2863, 7628),
-(2863, 9531),
-(9531, 15842),
-(7628, 15842),
-(2863, 7711),
-(7628, 15841),
-(2863, 7184),
-(7184, 15840),
-(7184, 15843),
-(9531, 15843),
-(2864, 9341),
-(2864, 4806),
-(4806, 15844),
-(9341, 15844),
-(2864, 9254),
-(9341, 15845),
-(9254, 15845),
-(2864, 5181),
-(9254, 15846),
-(4806, 15847),
-(2865, 4887),
-(2865, 5674),
-(5674, 15848),
-(4887, 15848),
-(2865, 4806),
-(4887, 15844),
-(2865, 5171),
-(5674, 15849),
-(2866, 7199),
-(2866, 7011),
-(7011, 15839),
-(2866, 6772),
-(6772, 15838),
-(2866, 8818),
-(6772, 15850),
-(7011, 15851),
-(2867, 7088),
-(2867, 8658),
-(8658, 15852),
-(7088, 15852),
-(2867, 7011),
-(7088, 15839),
-(2867, 8812),
-(8658, 15853),
-(2868, 8727),
-(2868, 8498),
-(8498, 15854),
-(8727, 15854),
-(2868, 8658),
-(8727, 15852),
-(2868, 9605),
-(8498, 15855),
-(2869, 8573),
-(2869, 8992),
-(8992, 15856),
-(8573, 15856),
-(2869, 8498),
-(8573, 15854),
-(2869, 8483),
-(8992, 15857),
-(2870, 5497),
-(2870, 9254),
-(5497, 15845),
-(2870, 5115),
-(5497, 14496),
-(2870, 5758),
-(2871, 6598),
-(2871, 6772),
-(6598, 15838),
-(2871, 5674),
-(6598, 15848),
-(2871, 5586),
-(2872, 5363),
-(2872, 5206),
-(5206, 15843),
-(5363, 15843),
-(2872, 8992),
-(5363, 15856),
-(2872, 8905),
-(5206, 15858),
-(2873, 9531),
-(2873, 5456),
-(5456, 15842),
-(2873, 5206),
-(2873, 8225),
-(5456, 15859),
-(2874, 7209),
-(2874, 9880),
-(7209, 15808),
-(2874, 5456),
-(7209, 15842),
-(2874, 5887),
-(2875, 6117),
-(2875, 9341),
-(6117, 15844),
-(2875, 6358),
-(6117, 15831),
-(2875, 6541),
-(6541, 15830),
-(6541, 15845),
-(2876, 6812),
-(2876, 7995),
-(7995, 15832),
-(2876, 6117),
-(2876, 4887),
-(7995, 15848),
-(2877, 6532),
-(2877, 6263),
-(2877, 7995),
-(2877, 6598),
-(2878, 6716),
-(2878, 6152),
-(6152, 15835),
-(2878, 6367),
-(2878, 7088),
-(6152, 15852),
-(2879, 6147),
-(2879, 8727),
-(6147, 15854),
-(2879, 7799),
-(6147, 15836),
-(2879, 6152),
-(2880, 6858),
-(2880, 8573),
-(6858, 15856),
-(2880, 7541),
-(6858, 15837),
-(2880, 6147),
-(2881, 6541),
-(2881, 5497),
-(2881, 6400),
-(2881, 5859),
-(2882, 7184),
-(2882, 5363),
-(2882, 8125),
-(2882, 6858),
-(2883, 8102),
-(2883, 9874),
-(2883, 5836),
-(2884, 6289),
-(2884, 8120),
-(2884, 6039),
-(2885, 7811),
-(2885, 7861),
-(7861, 15860),
-(7811, 15860),
-(2885, 5463),
-(7861, 15829),
-(2886, 5405),
-(2886, 9205),
-(9205, 15759),
-(2886, 7811),
-(9205, 15860),
-(2887, 8082),
-(2887, 8265),
-(8265, 15861),
-(8082, 15861),
-(2887, 7861),
-(8082, 15860),
-(2887, 5499),
-(8265, 15828),
-(2888, 6633),
-(2888, 8937),
-(8937, 15760),
-(2888, 9205),
-(2888, 8082),
-(8937, 15861),
-(2889, 8000),
-(2889, 5878),
-(5878, 15862),
-(8000, 15862),
-(2889, 8265),
-(8000, 15861),
-(2889, 6567),
-(5878, 15841),
-(2890, 4732),
-(2890, 8000),
-(4732, 15862),
-(2890, 9096),
-(4732, 15784),
-(2890, 8937),
-(2891, 7628),
-(2891, 5878),
-(2891, 7209),
-(2891, 6151),
-(6151, 15808),
-(6151, 15862),
-(2892, 4621),
-(2892, 9308),
-(2892, 4732),
-(2892, 6151),
-    }
+    return _load_indices('mouth')
 
 
 def get_ears_indices():
-    return {
-(0, 4350),
-(0, 4461),
-(4461, 12921),
-(4350, 12921),
-(0, 4509),
-(4350, 12922),
-(4509, 12922),
-(0, 4458),
-(4509, 12923),
-(4458, 12923),
-(4458, 12924),
-(4461, 12924),
-(1, 4461),
-(1, 4337),
-(4337, 12921),
-(1, 4401),
-(4401, 12924),
-(1, 4333),
-(4401, 12925),
-(4333, 12925),
-(4333, 12926),
-(4337, 12926),
-(2, 4453),
-(2, 4391),
-(4391, 12927),
-(4453, 12927),
-(2, 4327),
-(4453, 12928),
-(4327, 12928),
-(2, 4333),
-(4327, 12926),
-(4391, 12925),
-(3, 4317),
-(3, 4497),
-(4497, 12929),
-(4317, 12929),
-(3, 4432),
-(4317, 12930),
-(4432, 12930),
-(3, 4453),
-(4432, 12928),
-(4497, 12927),
-(4, 4427),
-(4, 4307),
-(4307, 12931),
-(4427, 12931),
-(4, 4369),
-(4427, 12932),
-(4369, 12932),
-(4, 4319),
-(4369, 12933),
-(4319, 12933),
-(4319, 12934),
-(4307, 12934),
-(5, 4440),
-(5, 4360),
-(4360, 12935),
-(4440, 12935),
-(5, 4310),
-(4440, 12936),
-(4310, 12936),
-(5, 4427),
-(4310, 12932),
-(4360, 12931),
-(6, 4378),
-(6, 12657),
-(12657, 12937),
-(4378, 12937),
-(6, 4458),
-(4378, 12924),
-(6, 12658),
-(12658, 12923),
-(12658, 14147),
-(12657, 14147),
-(7, 4336),
-(7, 4342),
-(4342, 12938),
-(4336, 12938),
-(7, 4401),
-(4336, 12925),
-(7, 4378),
-(4342, 12937),
-(8, 12609),
-(8, 12611),
-(12611, 14148),
-(12609, 14148),
-(8, 4391),
-(12609, 12927),
-(8, 4336),
-(12611, 12938),
-(9, 4344),
-(9, 12652),
-(12652, 12939),
-(4344, 12939),
-(9, 4303),
-(4344, 12934),
-(4303, 12934),
-(9, 12577),
-(4303, 12929),
-(12577, 12929),
-(12577, 14149),
-(12652, 14149),
-(10, 4353),
-(10, 4324),
-(4324, 12940),
-(4353, 12940),
-(10, 4307),
-(4353, 12931),
-(10, 4344),
-(4324, 12939),
-(11, 4410),
-(11, 4390),
-(4390, 12941),
-(4410, 12941),
-(11, 4360),
-(4410, 12935),
-(11, 4353),
-(4390, 12940),
-(18, 4317),
-(18, 4374),
-(4374, 12930),
-(18, 4303),
-(18, 4319),
-(4374, 12933),
-(19, 12577),
-(19, 8504),
-(8504, 14149),
-(19, 4497),
-(19, 12609),
-(8504, 14148),
-(21, 4410),
-(21, 4490),
-(4490, 12935),
-(21, 12588),
-(12588, 12941),
-(21, 12591),
-(12588, 14231),
-(12591, 14231),
-(12591, 12950),
-(4490, 12950),
-(22, 4448),
-(22, 12655),
-(12655, 12951),
-(4448, 12951),
-(22, 4328),
-(4448, 12952),
-(4328, 12952),
-(22, 12591),
-(4328, 12950),
-(12655, 14231),
-(23, 12586),
-(23, 12606),
-(12606, 14232),
-(12586, 14232),
-(23, 4438),
-(12586, 12953),
-(4438, 12953),
-(23, 4448),
-(4438, 12952),
-(12606, 12951),
-(24, 5374),
-(24, 12586),
-(5374, 14232),
-(24, 12635),
-(5374, 14299),
-(12635, 14299),
-(24, 4314),
-(12635, 12954),
-(4314, 12954),
-(4314, 12953),
-(25, 4488),
-(25, 4489),
-(4489, 12955),
-(4488, 12955),
-(25, 4440),
-(4488, 12936),
-(25, 4490),
-(4489, 12950),
-(26, 4328),
-(26, 4489),
-(26, 4437),
-(4437, 12952),
-(26, 4309),
-(4437, 12956),
-(4309, 12956),
-(4309, 12955),
-(27, 4373),
-(27, 4438),
-(4373, 12953),
-(27, 4358),
-(4373, 12957),
-(4358, 12957),
-(27, 4437),
-(4358, 12956),
-(28, 4314),
-(28, 4373),
-(28, 4306),
-(4306, 12954),
-(28, 4420),
-(4306, 12958),
-(4420, 12958),
-(4420, 12957),
-(29, 6405),
-(29, 12635),
-(6405, 14299),
-(29, 5658),
-(6405, 14234),
-(5658, 14234),
-(29, 12627),
-(5658, 14242),
-(12627, 14242),
-(12627, 12954),
-(30, 12627),
-(30, 4306),
-(47, 12658),
-(47, 12656),
-(12656, 14147),
-(47, 4335),
-(4335, 12923),
-(47, 4331),
-(4335, 12970),
-(4331, 12970),
-(4331, 12971),
-(12656, 12971),
-(48, 4331),
-(48, 12582),
-(12582, 12971),
-(48, 4387),
-(4387, 12970),
-(48, 12630),
-(4387, 12972),
-(12630, 12972),
-(12630, 14169),
-(12582, 14169),
-(49, 12630),
-(49, 4856),
-(4856, 14169),
-(49, 4485),
-(4485, 12972),
-(49, 12581),
-(4485, 12973),
-(12581, 12973),
-(12581, 14170),
-(4856, 14170),
-(50, 12625),
-(50, 4372),
-(4372, 12974),
-(12625, 12974),
-(50, 5768),
-(12625, 14171),
-(5768, 14171),
-(50, 12581),
-(5768, 14170),
-(4372, 12973),
-(51, 12625),
-(51, 12607),
-(12607, 14171),
-(51, 4479),
-(4479, 12974),
-(51, 4298),
-(4479, 12975),
-(4298, 12975),
-(4298, 12976),
-(12607, 12976),
-(52, 12617),
-(52, 12594),
-(12594, 14245),
-(12617, 14245),
-(52, 4503),
-(12617, 12977),
-(4503, 12977),
-(52, 4298),
-(4503, 12976),
-(12594, 12975),
-(53, 4406),
-(53, 4509),
-(4406, 12922),
-(53, 4466),
-(4406, 12978),
-(4466, 12978),
-(53, 4335),
-(4466, 12970),
-(54, 4387),
-(54, 4507),
-(4507, 12972),
-(54, 4466),
-(54, 4301),
-(4301, 12978),
-(4301, 12979),
-(4507, 12979),
-(55, 4472),
-(55, 4507),
-(4472, 12979),
-(55, 4366),
-(4472, 12980),
-(4366, 12980),
-(55, 4485),
-(4366, 12973),
-(56, 4421),
-(56, 4366),
-(4421, 12980),
-(56, 4426),
-(4421, 12981),
-(4426, 12981),
-(56, 4372),
-(4426, 12974),
-(57, 4323),
-(57, 4426),
-(4323, 12981),
-(57, 4445),
-(4323, 12982),
-(4445, 12982),
-(57, 4479),
-(4445, 12975),
-(58, 12648),
-(58, 12651),
-(58, 12594),
-(12648, 14245),
-(58, 4445),
-(12651, 12982),
-(71, 4447),
-(71, 4334),
-(4334, 12990),
-(4447, 12990),
-(71, 4397),
-(4447, 12991),
-(4397, 12991),
-(71, 4431),
-(4397, 12992),
-(4431, 12992),
-(4431, 12993),
-(4334, 12993),
-(72, 4510),
-(72, 4447),
-(4510, 12990),
-(72, 4316),
-(4510, 12994),
-(4316, 12994),
-(72, 4462),
-(4316, 12995),
-(4462, 12995),
-(4462, 12991),
-(73, 4383),
-(73, 4417),
-(4417, 12996),
-(4383, 12996),
-(73, 4316),
-(4383, 12995),
-(73, 4418),
-(4418, 12994),
-(4418, 12997),
-(4417, 12997),
-(74, 4347),
-(74, 4512),
-(4512, 12998),
-(4347, 12998),
-(74, 4417),
-(4347, 12996),
-(74, 4414),
-(4414, 12997),
-(4414, 12999),
-(4512, 12999),
-(75, 4400),
-(75, 4481),
-(4481, 13000),
-(4400, 13000),
-(75, 4454),
-(4400, 13001),
-(4454, 13001),
-(75, 4506),
-(4454, 13002),
-(4506, 13002),
-(4506, 13003),
-(4481, 13003),
-(76, 4435),
-(76, 4403),
-(4403, 13004),
-(4435, 13004),
-(76, 4481),
-(4435, 13000),
-(76, 4493),
-(4493, 13003),
-(4493, 13005),
-(4403, 13005),
-(77, 9893),
-(77, 12632),
-(12632, 15517),
-(9893, 15517),
-(77, 12633),
-(9893, 15516),
-(12633, 15516),
-(77, 4397),
-(12633, 12992),
-(12632, 12991),
-(78, 12638),
-(78, 4330),
-(4330, 13006),
-(12638, 13006),
-(78, 12632),
-(12638, 15517),
-(78, 4462),
-(4330, 12995),
-(79, 4451),
-(79, 4399),
-(4399, 13007),
-(4451, 13007),
-(79, 4330),
-(4451, 13006),
-(79, 4383),
-(4399, 12996),
-(80, 12590),
-(80, 4402),
-(4402, 13008),
-(12590, 13008),
-(80, 12653),
-(12590, 15518),
-(12653, 15518),
-(80, 4412),
-(12653, 12998),
-(4412, 12998),
-(4412, 13001),
-(4402, 13001),
-(81, 4500),
-(81, 4408),
-(4408, 13009),
-(4500, 13009),
-(81, 4402),
-(4500, 13008),
-(81, 4400),
-(4408, 13000),
-(82, 12631),
-(82, 12598),
-(12598, 15519),
-(12631, 15519),
-(82, 4408),
-(12631, 13009),
-(82, 4435),
-(12598, 13004),
-(89, 4444),
-(89, 4512),
-(4444, 12999),
-(89, 4454),
-(4444, 13002),
-(89, 4412),
-(90, 12637),
-(90, 12653),
-(12637, 15518),
-(90, 4399),
-(12637, 13007),
-(90, 4347),
-(92, 4326),
-(92, 12598),
-(4326, 13004),
-(92, 4345),
-(4326, 13018),
-(4345, 13018),
-(92, 12629),
-(4345, 13019),
-(12629, 13019),
-(12629, 15519),
-(93, 4405),
-(93, 4363),
-(4363, 13020),
-(4405, 13020),
-(93, 4345),
-(4405, 13019),
-(93, 4465),
-(4465, 13018),
-(4465, 13021),
-(4363, 13021),
-(94, 4311),
-(94, 4478),
-(4478, 13022),
-(4311, 13022),
-(94, 4363),
-(4311, 13020),
-(94, 4368),
-(4368, 13021),
-(4368, 13023),
-(4478, 13023),
-(95, 4478),
-(95, 12597),
-(12597, 13022),
-(95, 4434),
-(4434, 13023),
-(95, 12601),
-(4434, 13024),
-(12601, 13024),
-(12601, 15665),
-(12597, 15665),
-(96, 4429),
-(96, 4389),
-(4389, 13025),
-(4429, 13025),
-(96, 4326),
-(4429, 13018),
-(96, 4403),
-(4389, 13005),
-(97, 4429),
-(97, 4465),
-(97, 4456),
-(4456, 13025),
-(97, 4346),
-(4456, 13026),
-(4346, 13026),
-(4346, 13021),
-(98, 4368),
-(98, 4398),
-(4398, 13023),
-(98, 4346),
-(98, 4395),
-(4395, 13026),
-(4395, 13027),
-(4398, 13027),
-(99, 4398),
-(99, 4434),
-(99, 4338),
-(4338, 13027),
-(99, 4343),
-(4338, 13028),
-(4343, 13028),
-(4343, 13024),
-(100, 12601),
-(100, 6217),
-(6217, 15665),
-(100, 12604),
-(12604, 13024),
-(100, 6820),
-(12604, 15610),
-(6820, 15610),
-(6820, 15602),
-(6217, 15602),
-(101, 4343),
-(101, 12604),
-(118, 6393),
-(118, 12633),
-(6393, 15516),
-(118, 12623),
-(6393, 15538),
-(12623, 15538),
-(118, 4504),
-(12623, 13041),
-(4504, 13041),
-(4504, 12992),
-(119, 8074),
-(119, 12623),
-(8074, 15538),
-(119, 12644),
-(8074, 15539),
-(12644, 15539),
-(119, 4354),
-(12644, 13042),
-(4354, 13042),
-(4354, 13041),
-(120, 12620),
-(120, 12644),
-(12620, 15539),
-(120, 4355),
-(12620, 13043),
-(4355, 13043),
-(120, 4475),
-(4355, 13044),
-(4475, 13044),
-(4475, 13042),
-(121, 4423),
-(121, 12647),
-(12647, 13045),
-(4423, 13045),
-(121, 4355),
-(4423, 13044),
-(121, 12643),
-(12643, 13043),
-(12643, 15540),
-(12647, 15540),
-(122, 6486),
-(122, 12647),
-(6486, 15540),
-(122, 12589),
-(6486, 15541),
-(12589, 15541),
-(122, 4321),
-(12589, 13046),
-(4321, 13046),
-(4321, 13045),
-(123, 4384),
-(123, 12634),
-(12634, 13047),
-(4384, 13047),
-(123, 12589),
-(4384, 13046),
-(123, 6059),
-(6059, 15541),
-(6059, 15542),
-(12634, 15542),
-(124, 4431),
-(124, 4439),
-(4439, 12993),
-(124, 4504),
-(124, 4304),
-(4304, 13041),
-(4304, 13048),
-(4439, 13048),
-(125, 4446),
-(125, 4354),
-(4446, 13042),
-(125, 4320),
-(4446, 13049),
-(4320, 13049),
-(125, 4304),
-(4320, 13048),
-(126, 4446),
-(126, 4370),
-(4370, 13049),
-(126, 4475),
-(126, 4380),
-(4380, 13044),
-(4380, 13050),
-(4370, 13050),
-(127, 4380),
-(127, 4428),
-(4428, 13050),
-(127, 4423),
-(127, 4436),
-(4436, 13045),
-(4436, 13051),
-(4428, 13051),
-(128, 4436),
-(128, 4484),
-(4484, 13051),
-(128, 4321),
-(128, 4476),
-(4476, 13046),
-(4476, 13052),
-(4484, 13052),
-(129, 12584),
-(129, 12578),
-(129, 4476),
-(12584, 13052),
-(129, 4384),
-(12578, 13047),
-(903, 9712),
-(903, 8506),
-(8506, 14062),
-(9712, 14062),
-(903, 8585),
-(9712, 14063),
-(8585, 14063),
-(903, 8830),
-(8585, 14064),
-(8830, 14064),
-(8830, 14065),
-(8506, 14065),
-(904, 8558),
-(904, 8065),
-(8065, 14066),
-(8558, 14066),
-(904, 8506),
-(8558, 14062),
-(904, 8828),
-(8828, 14065),
-(8828, 14067),
-(8065, 14067),
-(905, 8142),
-(905, 7903),
-(7903, 14068),
-(8142, 14068),
-(905, 8065),
-(8142, 14066),
-(905, 8364),
-(8364, 14067),
-(8364, 14069),
-(7903, 14069),
-(906, 7972),
-(906, 7743),
-(7743, 14070),
-(7972, 14070),
-(906, 7903),
-(7972, 14068),
-(906, 7901),
-(7901, 14069),
-(7901, 14071),
-(7743, 14071),
-(907, 7743),
-(907, 6573),
-(6573, 14070),
-(907, 6656),
-(6656, 14071),
-(907, 6928),
-(6656, 14072),
-(6928, 14072),
-(6928, 14073),
-(6573, 14073),
-(908, 6928),
-(908, 6925),
-(6925, 14073),
-(908, 6855),
-(6855, 14072),
-(908, 7417),
-(6855, 14074),
-(7417, 14074),
-(7417, 14075),
-(6925, 14075),
-(909, 7417),
-(909, 7753),
-(7753, 14075),
-(909, 7319),
-(7319, 14074),
-(909, 7246),
-(7319, 14076),
-(7246, 14076),
-(7246, 14077),
-(7753, 14077),
-(910, 7246),
-(910, 7242),
-(7242, 14077),
-(910, 7147),
-(7147, 14076),
-(910, 8377),
-(7147, 14078),
-(8377, 14078),
-(8377, 14079),
-(7242, 14079),
-(911, 8377),
-(911, 7414),
-(7414, 14079),
-(911, 8293),
-(8293, 14078),
-(911, 7572),
-(8293, 14080),
-(7572, 14080),
-(7572, 14081),
-(7414, 14081),
-(912, 7572),
-(912, 7570),
-(7570, 14081),
-(912, 7458),
-(7458, 14080),
-(912, 9384),
-(7458, 14082),
-(9384, 14082),
-(9384, 14083),
-(7570, 14083),
-(913, 9105),
-(913, 9188),
-(9188, 14084),
-(9105, 14084),
-(913, 9384),
-(9105, 14083),
-(913, 9550),
-(9550, 14082),
-(9550, 14085),
-(9188, 14085),
-(914, 9085),
-(914, 9027),
-(9027, 14086),
-(9085, 14086),
-(914, 9188),
-(9085, 14084),
-(914, 9185),
-(9185, 14085),
-(9185, 14087),
-(9027, 14087),
-(915, 8919),
-(915, 8229),
-(8229, 14088),
-(8919, 14088),
-(915, 9027),
-(8919, 14086),
-(915, 8081),
-(8081, 14087),
-(8081, 14089),
-(8229, 14089),
-(916, 8087),
-(916, 5633),
-(5633, 14090),
-(8087, 14090),
-(916, 8229),
-(8087, 14088),
-(916, 8223),
-(8223, 14089),
-(8223, 14091),
-(5633, 14091),
-(917, 5539),
-(917, 5472),
-(5472, 14092),
-(5539, 14092),
-(917, 5633),
-(5539, 14090),
-(917, 5981),
-(5981, 14091),
-(5981, 14093),
-(5472, 14093),
-(918, 6670),
-(918, 5466),
-(5466, 14094),
-(6670, 14094),
-(918, 6417),
-(6670, 14095),
-(6417, 14095),
-(918, 5814),
-(6417, 14096),
-(5814, 14096),
-(5814, 14097),
-(5466, 14097),
-(919, 5466),
-(919, 5604),
-(5604, 14094),
-(919, 5908),
-(5908, 14097),
-(919, 4980),
-(5908, 14098),
-(4980, 14098),
-(4980, 14099),
-(5604, 14099),
-(920, 4813),
-(920, 4890),
-(4890, 14100),
-(4813, 14100),
-(920, 5298),
-(4813, 14101),
-(5298, 14101),
-(920, 4980),
-(5298, 14099),
-(4890, 14098),
-(921, 4648),
-(921, 8770),
-(8770, 14102),
-(4648, 14102),
-(921, 9753),
-(4648, 14103),
-(9753, 14103),
-(921, 9121),
-(9753, 14104),
-(9121, 14104),
-(9121, 14105),
-(8770, 14105),
-(922, 9666),
-(922, 9043),
-(9043, 14106),
-(9666, 14106),
-(922, 9495),
-(9666, 14107),
-(9495, 14107),
-(922, 9121),
-(9495, 14105),
-(9043, 14104),
-(923, 9831),
-(923, 9646),
-(9646, 14108),
-(9831, 14108),
-(923, 5056),
-(9831, 14109),
-(5056, 14109),
-(923, 5302),
-(5056, 14110),
-(5302, 14110),
-(5302, 14111),
-(9646, 14111),
-(924, 9397),
-(924, 4812),
-(4812, 14112),
-(9397, 14112),
-(924, 9646),
-(9397, 14108),
-(924, 4977),
-(4977, 14111),
-(4977, 14113),
-(4812, 14113),
-(925, 9883),
-(925, 6319),
-(6319, 14114),
-(9883, 14114),
-(925, 4812),
-(9883, 14112),
-(925, 6164),
-(6164, 14113),
-(6164, 14115),
-(6319, 14115),
-(926, 6076),
-(926, 6503),
-(6503, 14116),
-(6076, 14116),
-(926, 6319),
-(6076, 14114),
-(926, 6663),
-(6663, 14115),
-(6663, 14117),
-(6503, 14117),
-(927, 6225),
-(927, 5987),
-(5987, 14118),
-(6225, 14118),
-(927, 6503),
-(6225, 14116),
-(927, 5812),
-(5812, 14117),
-(5812, 14119),
-(5987, 14119),
-(928, 5471),
-(928, 5235),
-(5235, 14120),
-(5471, 14120),
-(928, 8107),
-(5471, 14121),
-(8107, 14121),
-(928, 8326),
-(8107, 14122),
-(8326, 14122),
-(8326, 14123),
-(5235, 14123),
-(929, 6536),
-(929, 5332),
-(5332, 14124),
-(6536, 14124),
-(929, 5302),
-(6536, 14111),
-(929, 9916),
-(9916, 14110),
-(9916, 14106),
-(5332, 14106),
-(930, 9052),
-(930, 9216),
-(9216, 14125),
-(9052, 14125),
-(930, 9315),
-(9052, 14126),
-(9315, 14126),
-(930, 8868),
-(9315, 14127),
-(8868, 14127),
-(8868, 14128),
-(9216, 14128),
-(931, 8868),
-(931, 8514),
-(8514, 14128),
-(931, 8959),
-(8959, 14127),
-(931, 7438),
-(8959, 14129),
-(7438, 14129),
-(7438, 14130),
-(8514, 14130),
-(932, 7697),
-(932, 7941),
-(7941, 14131),
-(7697, 14131),
-(932, 7438),
-(7697, 14130),
-(932, 7600),
-(7600, 14129),
-(7600, 14132),
-(7941, 14132),
-(933, 8023),
-(933, 7102),
-(7102, 14133),
-(8023, 14133),
-(933, 7941),
-(8023, 14131),
-(933, 7585),
-(7585, 14132),
-(7585, 14134),
-(7102, 14134),
-(934, 6956),
-(934, 7363),
-(7363, 14135),
-(6956, 14135),
-(934, 7266),
-(6956, 14136),
-(7266, 14136),
-(934, 7102),
-(7266, 14133),
-(7363, 14134),
-(935, 6605),
-(935, 7026),
-(7026, 14137),
-(6605, 14137),
-(935, 6798),
-(6605, 14138),
-(6798, 14138),
-(935, 6956),
-(6798, 14136),
-(7026, 14135),
-(936, 7062),
-(936, 7212),
-(7212, 14139),
-(7062, 14139),
-(936, 7151),
-(7062, 14140),
-(7151, 14140),
-(936, 7558),
-(7151, 14141),
-(7558, 14141),
-(7558, 14142),
-(7212, 14142),
-(937, 7406),
-(937, 6821),
-(6821, 14143),
-(7406, 14143),
-(937, 6908),
-(7406, 14144),
-(6908, 14144),
-(937, 7062),
-(6908, 14140),
-(6821, 14139),
-(938, 7406),
-(938, 7369),
-(7369, 14144),
-(938, 7651),
-(7651, 14143),
-(938, 8513),
-(7651, 14145),
-(8513, 14145),
-(8513, 14146),
-(7369, 14146),
-(939, 12787),
-(939, 9085),
-(12787, 14086),
-(939, 12657),
-(12787, 12937),
-(939, 9474),
-(9474, 14147),
-(9474, 14084),
-(940, 12798),
-(940, 8919),
-(12798, 14088),
-(940, 4342),
-(12798, 12938),
-(940, 12787),
-(941, 12611),
-(941, 4807),
-(4807, 14148),
-(941, 12798),
-(941, 8087),
-(4807, 14090),
-(942, 12652),
-(942, 12822),
-(12822, 12939),
-(942, 4642),
-(4642, 14149),
-(942, 5619),
-(4642, 14092),
-(5619, 14092),
-(5619, 14095),
-(12822, 14095),
-(943, 4324),
-(943, 12823),
-(12823, 12940),
-(943, 12822),
-(943, 6670),
-(12823, 14094),
-(944, 4390),
-(944, 12727),
-(12727, 12941),
-(944, 12823),
-(944, 5604),
-(12727, 14099),
-(945, 5691),
-(945, 8015),
-(8015, 14150),
-(5691, 14150),
-(945, 8306),
-(5691, 14151),
-(8306, 14151),
-(945, 8081),
-(8306, 14089),
-(8015, 14087),
-(946, 5450),
-(946, 5769),
-(5769, 14152),
-(5450, 14152),
-(946, 8223),
-(5450, 14091),
-(946, 8306),
-(5769, 14151),
-(947, 5717),
-(947, 5383),
-(5383, 14093),
-(5717, 14093),
-(947, 6636),
-(5717, 14153),
-(6636, 14153),
-(947, 6143),
-(6636, 14154),
-(6143, 14154),
-(6143, 14096),
-(5383, 14096),
-(948, 6143),
-(948, 5814),
-(948, 6042),
-(6042, 14154),
-(948, 6195),
-(6042, 14155),
-(6195, 14155),
-(6195, 14097),
-(949, 5908),
-(949, 4597),
-(4597, 14098),
-(949, 6195),
-(949, 6121),
-(6121, 14155),
-(6121, 14156),
-(4597, 14156),
-(950, 9560),
-(950, 4961),
-(4961, 14100),
-(9560, 14100),
-(950, 4940),
-(9560, 14157),
-(4940, 14157),
-(950, 9628),
-(4940, 14158),
-(9628, 14158),
-(9628, 14103),
-(4961, 14103),
-(951, 9723),
-(951, 5024),
-(5024, 14159),
-(9723, 14159),
-(951, 9753),
-(9723, 14104),
-(951, 9628),
-(5024, 14158),
-(952, 9043),
-(952, 5332),
-(952, 9723),
-(952, 6625),
-(6625, 14159),
-(6625, 14124),
-(953, 6615),
-(953, 8185),
-(8185, 14160),
-(6615, 14160),
-(953, 8015),
-(6615, 14150),
-(953, 9185),
-(8185, 14085),
-(954, 9040),
-(954, 7651),
-(9040, 14143),
-(954, 6615),
-(9040, 14150),
-(954, 7599),
-(7599, 14160),
-(7599, 14145),
-(955, 8330),
-(955, 6821),
-(8330, 14139),
-(955, 5691),
-(8330, 14151),
-(955, 9040),
-(956, 8691),
-(956, 7212),
-(8691, 14142),
-(956, 5769),
-(8691, 14152),
-(956, 8330),
-(957, 4687),
-(957, 7026),
-(4687, 14135),
-(957, 6636),
-(4687, 14154),
-(957, 8175),
-(8175, 14153),
-(8175, 14137),
-(958, 5254),
-(958, 7363),
-(5254, 14134),
-(958, 6042),
-(5254, 14155),
-(958, 4687),
-(959, 7585),
-(959, 5254),
-(959, 9337),
-(9337, 14132),
-(959, 6121),
-(9337, 14156),
-(979, 4813),
-(979, 4897),
-(4897, 14101),
-(979, 4961),
-(979, 4648),
-(4897, 14102),
-(980, 9560),
-(980, 9881),
-(9881, 14157),
-(980, 4890),
-(980, 4597),
-(9881, 14156),
-(981, 7600),
-(981, 9337),
-(981, 4620),
-(4620, 14129),
-(981, 9881),
-(4620, 14157),
-(982, 5659),
-(982, 8959),
-(5659, 14127),
-(982, 4940),
-(5659, 14158),
-(982, 4620),
-(983, 5659),
-(983, 5024),
-(983, 9315),
-(983, 5566),
-(5566, 14126),
-(5566, 14159),
-(984, 12717),
-(984, 12656),
-(12717, 12971),
-(984, 9105),
-(12717, 14083),
-(984, 9474),
-(985, 12582),
-(985, 12717),
-(985, 5434),
-(5434, 14169),
-(985, 7570),
-(5434, 14081),
-(986, 5434),
-(986, 7414),
-(986, 4856),
-(986, 5733),
-(5733, 14170),
-(5733, 14079),
-(987, 4637),
-(987, 5768),
-(4637, 14171),
-(987, 7242),
-(4637, 14077),
-(987, 5733),
-(988, 12689),
-(988, 12607),
-(12689, 12976),
-(988, 7753),
-(12689, 14075),
-(988, 4637),
-(989, 12800),
-(989, 4503),
-(12800, 12977),
-(989, 6925),
-(12800, 14073),
-(989, 12689),
-(990, 8410),
-(990, 12735),
-(12735, 14172),
-(8410, 14172),
-(990, 6573),
-(8410, 14070),
-(990, 12800),
-(12735, 12977),
-(991, 9529),
-(991, 5430),
-(5430, 14173),
-(9529, 14173),
-(991, 7972),
-(9529, 14068),
-(991, 8410),
-(5430, 14172),
-(992, 7110),
-(992, 8585),
-(7110, 14063),
-(992, 5959),
-(7110, 14174),
-(5959, 14174),
-(992, 7698),
-(5959, 14175),
-(7698, 14175),
-(7698, 14064),
-(993, 5334),
-(993, 5959),
-(5334, 14174),
-(993, 7800),
-(5334, 14176),
-(7800, 14176),
-(993, 5596),
-(7800, 14177),
-(5596, 14177),
-(5596, 14175),
-(994, 7803),
-(994, 7800),
-(7803, 14176),
-(994, 7631),
-(7803, 14178),
-(7631, 14178),
-(994, 7798),
-(7631, 14179),
-(7798, 14179),
-(7798, 14177),
-(995, 7631),
-(995, 8563),
-(8563, 14179),
-(995, 8336),
-(8336, 14178),
-(995, 8720),
-(8336, 14180),
-(8720, 14180),
-(8720, 14181),
-(8563, 14181),
-(996, 7959),
-(996, 7266),
-(7959, 14136),
-(996, 8720),
-(7959, 14181),
-(996, 7374),
-(7374, 14180),
-(7374, 14133),
-(997, 7620),
-(997, 4661),
-(4661, 14182),
-(7620, 14182),
-(997, 8185),
-(7620, 14160),
-(997, 9550),
-(4661, 14082),
-(998, 6973),
-(998, 7458),
-(6973, 14080),
-(998, 9243),
-(6973, 14183),
-(9243, 14183),
-(998, 4661),
-(9243, 14182),
-(999, 6973),
-(999, 8809),
-(8809, 14183),
-(999, 8293),
-(999, 6901),
-(6901, 14078),
-(6901, 14184),
-(8809, 14184),
-(1000, 5759),
-(1000, 7147),
-(5759, 14076),
-(1000, 7126),
-(5759, 14185),
-(7126, 14185),
-(1000, 6901),
-(7126, 14184),
-(1001, 6347),
-(1001, 7319),
-(6347, 14074),
-(1001, 7043),
-(6347, 14186),
-(7043, 14186),
-(1001, 5759),
-(7043, 14185),
-(1002, 8080),
-(1002, 6855),
-(8080, 14072),
-(1002, 6970),
-(8080, 14187),
-(6970, 14187),
-(1002, 6347),
-(6970, 14186),
-(1003, 7330),
-(1003, 6656),
-(7330, 14071),
-(1003, 7869),
-(7330, 14188),
-(7869, 14188),
-(1003, 8080),
-(7869, 14187),
-(1004, 7901),
-(1004, 7330),
-(1004, 8371),
-(8371, 14069),
-(1004, 6815),
-(8371, 14189),
-(6815, 14189),
-(6815, 14188),
-(1005, 7828),
-(1005, 8364),
-(7828, 14067),
-(1005, 6717),
-(7828, 14190),
-(6717, 14190),
-(1005, 8371),
-(6717, 14189),
-(1006, 8837),
-(1006, 8828),
-(8837, 14065),
-(1006, 7292),
-(8837, 14191),
-(7292, 14191),
-(1006, 7828),
-(7292, 14190),
-(1007, 8463),
-(1007, 6565),
-(6565, 14192),
-(8463, 14192),
-(1007, 7959),
-(8463, 14181),
-(1007, 6798),
-(6565, 14138),
-(1008, 6535),
-(1008, 6450),
-(6450, 14193),
-(6535, 14193),
-(1008, 6273),
-(6535, 14194),
-(6273, 14194),
-(1008, 6455),
-(6273, 14195),
-(6455, 14195),
-(6455, 14192),
-(6450, 14192),
-(1009, 7476),
-(1009, 6355),
-(6355, 14196),
-(7476, 14196),
-(1009, 7133),
-(7476, 14197),
-(7133, 14197),
-(1009, 6535),
-(7133, 14194),
-(6355, 14193),
-(1010, 7975),
-(1010, 7379),
-(7379, 14198),
-(7975, 14198),
-(1010, 7471),
-(7975, 14199),
-(7471, 14199),
-(1010, 7476),
-(7471, 14197),
-(7379, 14196),
-(1011, 8425),
-(1011, 7877),
-(7877, 14200),
-(8425, 14200),
-(1011, 7641),
-(8425, 14201),
-(7641, 14201),
-(1011, 7975),
-(7641, 14199),
-(7877, 14198),
-(1012, 6703),
-(1012, 6273),
-(6703, 14194),
-(1012, 8281),
-(6703, 14202),
-(8281, 14202),
-(1012, 6797),
-(8281, 14203),
-(6797, 14203),
-(6797, 14195),
-(1013, 7133),
-(1013, 6703),
-(1013, 7691),
-(7691, 14197),
-(1013, 8200),
-(7691, 14204),
-(8200, 14204),
-(8200, 14202),
-(1014, 7471),
-(1014, 7691),
-(1014, 7269),
-(7269, 14199),
-(1014, 8138),
-(7269, 14205),
-(8138, 14205),
-(8138, 14204),
-(1015, 8425),
-(1015, 8719),
-(8719, 14201),
-(1015, 8633),
-(8633, 14200),
-(1015, 8577),
-(8633, 14206),
-(8577, 14206),
-(8577, 14207),
-(8719, 14207),
-(1016, 6406),
-(1016, 8577),
-(6406, 14206),
-(1016, 6970),
-(6406, 14186),
-(1016, 6300),
-(6300, 14187),
-(6300, 14207),
-(1017, 6065),
-(1017, 8488),
-(8488, 14208),
-(6065, 14208),
-(1017, 7043),
-(6065, 14185),
-(1017, 6406),
-(8488, 14206),
-(1018, 5060),
-(1018, 6065),
-(5060, 14208),
-(1018, 6297),
-(5060, 14209),
-(6297, 14209),
-(1018, 7126),
-(6297, 14184),
-(1019, 5158),
-(1019, 6297),
-(5158, 14209),
-(1019, 9604),
-(5158, 14210),
-(9604, 14210),
-(1019, 8809),
-(9604, 14183),
-(1020, 9533),
-(1020, 4907),
-(4907, 14211),
-(9533, 14211),
-(1020, 9243),
-(9533, 14182),
-(1020, 9604),
-(4907, 14210),
-(1021, 9214),
-(1021, 9533),
-(9214, 14211),
-(1021, 7599),
-(9214, 14145),
-(1021, 7620),
-(1022, 4907),
-(1022, 9214),
-(1022, 9127),
-(9127, 14210),
-(1022, 8513),
-(9127, 14146),
-(1023, 8633),
-(1023, 8488),
-(1023, 9109),
-(9109, 14200),
-(1023, 5071),
-(9109, 14212),
-(5071, 14212),
-(5071, 14208),
-(1024, 7877),
-(1024, 9109),
-(1024, 9026),
-(9026, 14198),
-(1024, 6084),
-(9026, 14213),
-(6084, 14213),
-(6084, 14212),
-(1025, 7379),
-(1025, 9026),
-(1025, 8600),
-(8600, 14196),
-(1025, 6171),
-(8600, 14214),
-(6171, 14214),
-(6171, 14213),
-(1026, 7151),
-(1026, 5621),
-(5621, 14141),
-(1026, 8400),
-(8400, 14140),
-(1026, 8086),
-(8400, 14215),
-(8086, 14215),
-(8086, 14193),
-(5621, 14193),
-(1027, 6908),
-(1027, 8400),
-(1027, 8980),
-(8980, 14144),
-(1027, 6324),
-(8980, 14216),
-(6324, 14216),
-(6324, 14215),
-(1028, 7252),
-(1028, 7369),
-(7252, 14146),
-(1028, 9760),
-(7252, 14217),
-(9760, 14217),
-(1028, 8980),
-(9760, 14216),
-(1029, 7252),
-(1029, 5890),
-(5890, 14217),
-(1029, 9127),
-(1029, 5158),
-(5890, 14209),
-(1030, 5071),
-(1030, 5060),
-(1030, 6409),
-(6409, 14212),
-(1030, 5890),
-(6409, 14217),
-(1031, 9760),
-(1031, 5986),
-(5986, 14216),
-(1031, 6409),
-(1031, 6084),
-(5986, 14213),
-(1032, 6324),
-(1032, 6597),
-(6597, 14215),
-(1032, 5986),
-(1032, 6171),
-(6597, 14214),
-(1033, 6355),
-(1033, 8600),
-(1033, 8086),
-(1033, 6597),
-(1034, 5620),
-(1034, 8138),
-(5620, 14205),
-(1034, 7292),
-(5620, 14190),
-(1034, 6075),
-(6075, 14191),
-(6075, 14204),
-(1035, 8837),
-(1035, 4925),
-(4925, 14191),
-(1035, 8830),
-(1035, 6563),
-(6563, 14064),
-(6563, 14218),
-(4925, 14218),
-(1036, 6075),
-(1036, 8200),
-(1036, 4925),
-(1036, 6669),
-(6669, 14218),
-(6669, 14202),
-(1037, 9587),
-(1037, 7314),
-(7314, 14219),
-(9587, 14219),
-(1037, 6563),
-(9587, 14218),
-(1037, 7698),
-(7314, 14175),
-(1038, 5619),
-(1038, 6417),
-(1038, 5472),
-(1038, 5383),
-(1039, 6605),
-(1039, 6830),
-(6830, 14138),
-(1039, 6910),
-(6910, 14137),
-(1039, 7558),
-(6910, 14142),
-(6830, 14141),
-(1040, 5539),
-(1040, 4807),
-(1040, 4642),
-(1040, 8504),
-(1041, 5717),
-(1041, 6202),
-(6202, 14153),
-(1041, 5981),
-(1041, 5450),
-(6202, 14152),
-(1042, 8175),
-(1042, 6910),
-(1042, 6202),
-(1042, 8691),
-(1043, 6450),
-(1043, 5621),
-(1043, 6565),
-(1043, 6830),
-(1044, 8463),
-(1044, 8563),
-(1044, 6455),
-(1044, 8595),
-(8595, 14195),
-(8595, 14179),
-(1045, 6797),
-(1045, 8595),
-(1045, 9639),
-(9639, 14203),
-(1045, 7798),
-(9639, 14177),
-(1046, 6764),
-(1046, 9587),
-(6764, 14219),
-(1046, 8281),
-(6764, 14203),
-(1046, 6669),
-(1047, 6764),
-(1047, 9639),
-(1047, 7314),
-(1047, 5596),
-(1048, 7269),
-(1048, 7665),
-(7665, 14205),
-(1048, 7641),
-(1048, 7015),
-(7015, 14201),
-(7015, 14220),
-(7665, 14220),
-(1049, 7249),
-(1049, 8719),
-(7249, 14207),
-(1049, 9414),
-(7249, 14221),
-(9414, 14221),
-(1049, 7015),
-(9414, 14220),
-(1050, 5092),
-(1050, 7665),
-(5092, 14220),
-(1050, 6717),
-(5092, 14189),
-(1050, 5620),
-(1051, 6815),
-(1051, 9360),
-(9360, 14188),
-(1051, 5092),
-(1051, 9414),
-(9360, 14221),
-(1052, 6300),
-(1052, 7249),
-(1052, 7869),
-(1052, 9360),
-(1053, 6277),
-(1053, 8326),
-(6277, 14122),
-(1053, 9928),
-(6277, 14222),
-(9928, 14222),
-(1053, 6534),
-(9928, 14223),
-(6534, 14223),
-(6534, 14123),
-(1054, 8107),
-(1054, 6277),
-(1054, 6274),
-(6274, 14121),
-(1054, 9825),
-(6274, 14224),
-(9825, 14224),
-(9825, 14222),
-(1055, 5629),
-(1055, 6274),
-(5629, 14121),
-(1055, 6692),
-(5629, 14119),
-(6692, 14119),
-(1055, 9046),
-(6692, 14225),
-(9046, 14225),
-(9046, 14224),
-(1056, 6663),
-(1056, 7118),
-(7118, 14117),
-(1056, 7383),
-(7383, 14115),
-(1056, 8860),
-(7383, 14226),
-(8860, 14226),
-(8860, 14227),
-(7118, 14227),
-(1057, 7868),
-(1057, 6017),
-(6017, 14228),
-(7868, 14228),
-(1057, 4977),
-(7868, 14113),
-(1057, 6536),
-(6017, 14124),
-(1058, 5649),
-(1058, 5566),
-(5649, 14126),
-(1058, 6017),
-(5649, 14228),
-(1058, 6625),
-(1059, 6164),
-(1059, 7383),
-(1059, 7868),
-(1059, 8614),
-(8614, 14228),
-(8614, 14226),
-(1060, 5924),
-(1060, 9052),
-(5924, 14125),
-(1060, 8395),
-(5924, 14229),
-(8395, 14229),
-(1060, 5649),
-(8395, 14228),
-(1061, 8614),
-(1061, 9819),
-(9819, 14226),
-(1061, 8395),
-(1061, 4986),
-(4986, 14229),
-(4986, 14230),
-(9819, 14230),
-(1062, 12727),
-(1062, 12588),
-(1062, 5298),
-(1062, 8450),
-(8450, 14101),
-(8450, 14231),
-(1063, 8450),
-(1063, 12655),
-(1063, 4897),
-(1063, 12795),
-(12795, 14102),
-(12795, 12951),
-(1064, 9610),
-(1064, 8770),
-(9610, 14105),
-(1064, 12606),
-(9610, 14232),
-(1064, 12795),
-(1065, 9831),
-(1065, 5084),
-(5084, 14109),
-(1065, 9528),
-(9528, 14108),
-(1065, 5551),
-(9528, 14233),
-(5551, 14233),
-(5551, 14234),
-(5084, 14234),
-(1066, 9397),
-(1066, 9528),
-(1066, 4677),
-(4677, 14112),
-(1067, 9883),
-(1067, 4677),
-(1067, 5779),
-(5779, 14114),
-(1068, 6076),
-(1068, 5779),
-(1068, 6548),
-(6548, 14116),
-(1069, 5611),
-(1069, 6548),
-(1069, 6225),
-(5611, 14118),
-(1070, 7839),
-(1070, 5235),
-(7839, 14123),
-(1070, 5786),
-(5786, 14120),
-(1071, 5551),
-(1071, 5658),
-(1074, 12617),
-(1074, 12735),
-(1074, 9227),
-(9227, 14245),
-(1074, 4695),
-(4695, 14172),
-(1075, 4695),
-(1075, 5430),
-(1075, 4608),
-(4608, 14173),
-(1076, 7839),
-(1076, 7759),
-(7759, 14123),
-(1076, 4608),
-(7759, 14173),
-(1077, 6534),
-(1077, 7759),
-(1077, 5628),
-(5628, 14223),
-(1077, 9529),
-(5628, 14068),
-(1091, 8142),
-(1091, 8040),
-(8040, 14066),
-(1091, 5628),
-(1091, 6953),
-(6953, 14223),
-(6953, 14256),
-(8040, 14256),
-(1092, 8558),
-(1092, 8733),
-(8733, 14062),
-(1092, 8040),
-(1092, 6261),
-(6261, 14256),
-(6261, 14257),
-(8733, 14257),
-(1093, 9712),
-(1093, 8994),
-(8994, 14063),
-(1093, 8733),
-(1093, 5657),
-(5657, 14257),
-(5657, 14258),
-(8994, 14258),
-(1094, 8994),
-(1094, 7110),
-(1094, 5751),
-(5751, 14258),
-(1094, 9490),
-(5751, 14259),
-(9490, 14259),
-(9490, 14174),
-(1095, 9223),
-(1095, 5489),
-(5489, 14260),
-(9223, 14260),
-(1095, 5334),
-(9223, 14176),
-(1095, 9490),
-(5489, 14259),
-(1096, 9223),
-(1096, 7803),
-(1096, 7908),
-(7908, 14260),
-(1096, 9673),
-(7908, 14261),
-(9673, 14261),
-(9673, 14178),
-(1097, 9673),
-(1097, 8336),
-(1097, 7992),
-(7992, 14261),
-(1097, 4743),
-(7992, 14262),
-(4743, 14262),
-(4743, 14180),
-(1098, 8023),
-(1098, 5686),
-(5686, 14131),
-(1098, 7374),
-(1098, 4743),
-(5686, 14262),
-(1099, 8440),
-(1099, 6987),
-(6987, 14263),
-(8440, 14263),
-(1099, 7551),
-(8440, 14264),
-(7551, 14264),
-(1099, 8860),
-(7551, 14227),
-(6987, 14226),
-(1100, 7475),
-(1100, 9819),
-(7475, 14230),
-(1100, 8069),
-(7475, 14265),
-(8069, 14265),
-(1100, 6987),
-(8069, 14263),
-(1101, 9015),
-(1101, 6738),
-(6738, 14266),
-(9015, 14266),
-(1101, 7193),
-(9015, 14267),
-(7193, 14267),
-(1101, 9046),
-(7193, 14224),
-(6738, 14225),
-(1102, 9825),
-(1102, 6111),
-(6111, 14222),
-(1102, 7193),
-(1102, 8750),
-(8750, 14267),
-(8750, 14268),
-(6111, 14268),
-(1103, 8517),
-(1103, 6111),
-(8517, 14268),
-(1103, 5853),
-(8517, 14269),
-(5853, 14269),
-(1103, 9928),
-(5853, 14223),
-(1104, 4756),
-(1104, 7791),
-(7791, 14270),
-(4756, 14270),
-(1104, 6894),
-(4756, 14271),
-(6894, 14271),
-(1104, 6261),
-(6894, 14257),
-(7791, 14256),
-(1105, 6604),
-(1105, 5165),
-(5165, 14272),
-(6604, 14272),
-(1105, 5657),
-(6604, 14258),
-(1105, 6894),
-(5165, 14271),
-(1106, 6511),
-(1106, 9126),
-(9126, 14273),
-(6511, 14273),
-(1106, 7697),
-(6511, 14130),
-(1106, 5686),
-(9126, 14262),
-(1107, 9592),
-(1107, 9686),
-(9686, 14274),
-(9592, 14274),
-(1107, 8514),
-(9592, 14128),
-(1107, 6511),
-(9686, 14273),
-(1108, 9216),
-(1108, 9843),
-(9843, 14125),
-(1108, 9592),
-(1108, 9769),
-(9769, 14274),
-(9769, 14275),
-(9843, 14275),
-(1109, 9686),
-(1109, 9769),
-(1109, 9835),
-(9835, 14273),
-(1109, 9516),
-(9835, 14276),
-(9516, 14276),
-(9516, 14275),
-(1110, 7992),
-(1110, 9126),
-(1110, 9057),
-(9057, 14261),
-(1110, 9835),
-(9057, 14276),
-(1111, 8970),
-(1111, 5918),
-(5918, 14277),
-(8970, 14277),
-(1111, 5751),
-(8970, 14259),
-(1111, 6604),
-(5918, 14272),
-(1112, 5489),
-(1112, 9051),
-(9051, 14260),
-(1112, 8970),
-(1112, 9330),
-(9330, 14277),
-(9330, 14278),
-(9051, 14278),
-(1113, 7908),
-(1113, 9057),
-(1113, 9051),
-(1113, 6510),
-(6510, 14278),
-(6510, 14276),
-(1114, 5924),
-(1114, 9065),
-(9065, 14229),
-(1114, 9843),
-(1114, 6601),
-(6601, 14275),
-(6601, 14279),
-(9065, 14279),
-(1115, 6601),
-(1115, 9423),
-(9423, 14279),
-(1115, 9516),
-(1115, 6510),
-(9423, 14278),
-(1116, 4986),
-(1116, 8940),
-(8940, 14230),
-(1116, 9065),
-(1116, 9847),
-(9847, 14279),
-(9847, 14280),
-(8940, 14280),
-(1117, 9330),
-(1117, 9423),
-(1117, 9469),
-(9469, 14277),
-(1117, 9847),
-(9469, 14280),
-(1118, 7475),
-(1118, 7696),
-(7696, 14265),
-(1118, 8940),
-(1118, 9591),
-(9591, 14280),
-(9591, 14281),
-(7696, 14281),
-(1119, 5918),
-(1119, 9469),
-(1119, 5544),
-(5544, 14272),
-(1119, 9591),
-(5544, 14281),
-(1120, 5165),
-(1120, 5544),
-(1120, 5294),
-(5294, 14271),
-(1120, 4998),
-(5294, 14282),
-(4998, 14282),
-(4998, 14281),
-(1121, 7856),
-(1121, 5077),
-(5077, 14283),
-(7856, 14283),
-(1121, 7696),
-(7856, 14265),
-(1121, 4998),
-(5077, 14282),
-(1122, 6787),
-(1122, 4833),
-(4833, 14284),
-(6787, 14284),
-(1122, 8069),
-(6787, 14263),
-(1122, 7856),
-(4833, 14283),
-(1123, 8440),
-(1123, 7851),
-(7851, 14264),
-(1123, 6787),
-(1123, 9949),
-(9949, 14284),
-(9949, 14285),
-(7851, 14285),
-(1124, 8710),
-(1124, 6783),
-(6783, 14286),
-(8710, 14286),
-(1124, 7183),
-(8710, 14287),
-(7183, 14287),
-(1124, 9015),
-(7183, 14267),
-(6783, 14266),
-(1125, 8750),
-(1125, 7040),
-(7040, 14268),
-(1125, 7183),
-(1125, 8969),
-(8969, 14287),
-(8969, 14288),
-(7040, 14288),
-(1126, 8517),
-(1126, 4673),
-(4673, 14269),
-(1126, 7040),
-(1126, 6056),
-(6056, 14288),
-(6056, 14270),
-(4673, 14270),
-(1127, 6953),
-(1127, 7791),
-(1127, 5853),
-(1127, 4673),
-(1128, 6479),
-(1128, 8469),
-(8469, 14289),
-(6479, 14289),
-(1128, 4756),
-(6479, 14271),
-(1128, 6578),
-(6578, 14270),
-(6578, 14290),
-(8469, 14290),
-(1129, 9786),
-(1129, 8550),
-(8550, 14291),
-(9786, 14291),
-(1129, 5294),
-(9786, 14282),
-(1129, 6479),
-(8550, 14289),
-(1130, 9540),
-(1130, 8027),
-(8027, 14292),
-(9540, 14292),
-(1130, 5077),
-(9540, 14283),
-(1130, 9786),
-(8027, 14291),
-(1131, 9263),
-(1131, 7949),
-(7949, 14293),
-(9263, 14293),
-(1131, 4833),
-(9263, 14284),
-(1131, 9540),
-(7949, 14292),
-(1132, 9355),
-(1132, 5488),
-(5488, 14294),
-(9355, 14294),
-(1132, 9949),
-(9355, 14285),
-(1132, 9263),
-(5488, 14293),
-(1133, 8710),
-(1133, 9664),
-(9664, 14287),
-(1133, 9439),
-(9439, 14286),
-(1133, 5656),
-(9439, 14295),
-(5656, 14295),
-(5656, 14296),
-(9664, 14296),
-(1134, 6260),
-(1134, 9664),
-(6260, 14296),
-(1134, 4894),
-(6260, 14297),
-(4894, 14297),
-(1134, 8969),
-(4894, 14288),
-(1135, 5220),
-(1135, 4894),
-(5220, 14297),
-(1135, 6578),
-(5220, 14290),
-(1135, 6056),
-(1136, 6260),
-(1136, 6521),
-(6521, 14297),
-(1136, 6335),
-(6335, 14296),
-(6335, 14298),
-(6521, 14298),
-(1137, 5488),
-(1137, 5284),
-(5284, 14294),
-(1137, 5798),
-(5798, 14293),
-(5798, 14298),
-(5284, 14298),
-(1138, 8027),
-(1138, 5616),
-(5616, 14292),
-(1138, 4795),
-(4795, 14291),
-(4795, 14298),
-(5616, 14298),
-(1139, 8469),
-(1139, 5148),
-(5148, 14289),
-(1139, 4641),
-(4641, 14290),
-(4641, 14298),
-(5148, 14298),
-(1140, 4646),
-(1140, 5056),
-(4646, 14109),
-(1140, 9666),
-(4646, 14107),
-(1140, 9916),
-(1141, 9427),
-(1141, 9495),
-(9427, 14107),
-(1141, 5374),
-(9427, 14299),
-(1141, 9610),
-(1142, 4646),
-(1142, 9427),
-(1142, 5084),
-(1142, 6405),
-(1200, 5656),
-(1200, 6335),
-(1200, 5484),
-(5484, 14295),
-(5484, 14298),
-(1201, 7949),
-(1201, 5798),
-(1201, 5616),
-(1202, 8550),
-(1202, 4795),
-(1202, 5148),
-(1203, 5220),
-(1203, 4641),
-(1203, 6521),
-(1361, 5629),
-(1361, 5987),
-(1361, 5471),
-(1361, 5722),
-(5722, 14120),
-(5722, 14118),
-(1362, 6692),
-(1362, 8693),
-(8693, 14225),
-(1362, 5812),
-(1362, 7118),
-(8693, 14227),
-(1363, 5611),
-(1363, 5722),
-(1363, 5786),
-(1366, 8693),
-(1366, 6738),
-(1366, 7551),
-(1366, 8148),
-(8148, 14264),
-(8148, 14266),
-(1367, 8637),
-(1367, 7851),
-(8637, 14285),
-(1367, 6783),
-(8637, 14286),
-(1367, 8148),
-(1368, 5750),
-(1368, 9355),
-(5750, 14294),
-(1368, 9439),
-(5750, 14295),
-(1368, 8637),
-(1370, 5750),
-(1370, 5484),
-(1370, 5284),
-(2259, 6942),
-(2259, 6078),
-(6078, 15431),
-(6942, 15431),
-(2259, 6863),
-(6942, 15432),
-(6863, 15432),
-(2259, 6416),
-(6863, 15433),
-(6416, 15433),
-(6416, 15434),
-(6078, 15434),
-(2260, 7933),
-(2260, 6155),
-(6155, 15435),
-(7933, 15435),
-(2260, 6401),
-(7933, 15436),
-(6401, 15436),
-(2260, 6942),
-(6401, 15432),
-(6155, 15431),
-(2261, 8096),
-(2261, 8010),
-(8010, 15437),
-(8096, 15437),
-(2261, 7922),
-(8096, 15438),
-(7922, 15438),
-(2261, 7933),
-(7922, 15436),
-(8010, 15435),
-(2262, 7590),
-(2262, 8163),
-(8163, 15439),
-(7590, 15439),
-(2262, 7726),
-(7590, 15440),
-(7726, 15440),
-(2262, 8096),
-(7726, 15438),
-(8163, 15437),
-(2263, 7678),
-(2263, 7590),
-(7678, 15439),
-(2263, 7089),
-(7678, 15441),
-(7089, 15441),
-(2263, 6931),
-(7089, 15442),
-(6931, 15442),
-(6931, 15440),
-(2264, 7167),
-(2264, 7089),
-(7167, 15441),
-(2264, 4659),
-(7167, 15443),
-(4659, 15443),
-(2264, 4800),
-(4659, 15444),
-(4800, 15444),
-(4800, 15442),
-(2265, 4745),
-(2265, 4659),
-(4745, 15443),
-(2265, 4823),
-(4745, 15445),
-(4823, 15445),
-(2265, 4647),
-(4823, 15446),
-(4647, 15446),
-(4647, 15444),
-(2266, 4905),
-(2266, 4823),
-(4905, 15445),
-(2266, 5825),
-(4905, 15447),
-(5825, 15447),
-(2266, 5647),
-(5825, 15448),
-(5647, 15448),
-(5647, 15446),
-(2267, 5736),
-(2267, 5825),
-(5736, 15447),
-(2267, 5311),
-(5736, 15449),
-(5311, 15449),
-(2267, 5469),
-(5311, 15450),
-(5469, 15450),
-(5469, 15448),
-(2268, 5232),
-(2268, 5311),
-(5232, 15449),
-(2268, 9505),
-(5232, 15451),
-(9505, 15451),
-(2268, 9304),
-(9505, 15452),
-(9304, 15452),
-(9304, 15450),
-(2269, 9675),
-(2269, 9413),
-(9413, 15453),
-(9675, 15453),
-(2269, 9829),
-(9675, 15454),
-(9829, 15454),
-(2269, 9505),
-(9829, 15452),
-(9413, 15451),
-(2270, 9144),
-(2270, 9585),
-(9585, 15455),
-(9144, 15455),
-(2270, 8922),
-(9144, 15456),
-(8922, 15456),
-(2270, 9675),
-(8922, 15454),
-(9585, 15453),
-(2271, 8642),
-(2271, 9060),
-(9060, 15457),
-(8642, 15457),
-(2271, 8792),
-(8642, 15458),
-(8792, 15458),
-(2271, 9144),
-(8792, 15456),
-(9060, 15455),
-(2272, 8801),
-(2272, 8537),
-(8537, 15459),
-(8801, 15459),
-(2272, 8619),
-(8801, 15460),
-(8619, 15460),
-(2272, 8642),
-(8619, 15458),
-(8537, 15457),
-(2273, 8973),
-(2273, 8708),
-(8708, 15461),
-(8973, 15461),
-(2273, 9133),
-(8973, 15462),
-(9133, 15462),
-(2273, 8801),
-(9133, 15460),
-(8708, 15459),
-(2274, 9837),
-(2274, 9668),
-(9668, 15463),
-(9837, 15463),
-(2274, 9588),
-(9837, 15464),
-(9588, 15464),
-(2274, 9323),
-(9588, 15465),
-(9323, 15465),
-(9323, 15466),
-(9668, 15466),
-(2275, 8866),
-(2275, 9837),
-(8866, 15463),
-(2275, 5478),
-(8866, 15467),
-(5478, 15467),
-(2275, 8953),
-(5478, 15468),
-(8953, 15468),
-(8953, 15464),
-(2276, 5915),
-(2276, 5643),
-(5643, 15469),
-(5915, 15469),
-(2276, 5478),
-(5915, 15468),
-(2276, 5303),
-(5303, 15467),
-(5303, 15470),
-(5643, 15470),
-(2277, 5160),
-(2277, 4982),
-(4982, 15471),
-(5160, 15471),
-(2277, 4912),
-(5160, 15472),
-(4912, 15472),
-(2277, 4658),
-(4912, 15473),
-(4658, 15473),
-(4658, 15474),
-(4982, 15474),
-(2278, 9927),
-(2278, 7510),
-(7510, 15475),
-(9927, 15475),
-(2278, 4912),
-(9927, 15473),
-(2278, 9660),
-(9660, 15472),
-(9660, 15476),
-(7510, 15476),
-(2279, 7673),
-(2279, 7516),
-(7516, 15477),
-(7673, 15477),
-(2279, 8388),
-(7673, 15478),
-(8388, 15478),
-(2279, 8007),
-(8388, 15479),
-(8007, 15479),
-(8007, 15480),
-(7516, 15480),
-(2280, 6493),
-(2280, 7428),
-(7428, 15481),
-(6493, 15481),
-(2280, 8458),
-(6493, 15482),
-(8458, 15482),
-(2280, 7673),
-(8458, 15478),
-(7428, 15477),
-(2281, 7009),
-(2281, 6588),
-(6588, 15483),
-(7009, 15483),
-(2281, 6835),
-(7009, 15484),
-(6835, 15484),
-(2281, 6493),
-(6835, 15482),
-(6588, 15481),
-(2282, 6160),
-(2282, 7079),
-(7079, 15485),
-(6160, 15485),
-(2282, 6999),
-(6160, 15486),
-(6999, 15486),
-(2282, 7009),
-(6999, 15484),
-(7079, 15483),
-(2283, 5979),
-(2283, 6232),
-(6232, 15487),
-(5979, 15487),
-(2283, 6457),
-(5979, 15488),
-(6457, 15488),
-(2283, 6160),
-(6457, 15486),
-(6232, 15485),
-(2284, 5809),
-(2284, 5978),
-(5978, 15489),
-(5809, 15489),
-(2284, 5724),
-(5809, 15490),
-(5724, 15490),
-(2284, 6328),
-(5724, 15491),
-(6328, 15491),
-(6328, 15492),
-(5978, 15492),
-(2285, 8747),
-(2285, 9269),
-(9269, 15493),
-(8747, 15493),
-(2285, 7915),
-(8747, 15475),
-(7915, 15475),
-(2285, 8388),
-(7915, 15479),
-(9269, 15478),
-(2286, 6780),
-(2286, 7182),
-(7182, 15494),
-(6780, 15494),
-(2286, 6678),
-(6780, 15495),
-(6678, 15495),
-(2286, 6952),
-(6678, 15496),
-(6952, 15496),
-(6952, 15497),
-(7182, 15497),
-(2287, 6864),
-(2287, 6678),
-(6864, 15495),
-(2287, 7777),
-(6864, 15498),
-(7777, 15498),
-(2287, 6773),
-(7777, 15499),
-(6773, 15499),
-(6773, 15496),
-(2288, 8538),
-(2288, 8156),
-(8156, 15500),
-(8538, 15500),
-(2288, 8393),
-(8538, 15501),
-(8393, 15501),
-(2288, 7777),
-(8393, 15499),
-(8156, 15498),
-(2289, 7434),
-(2289, 8310),
-(8310, 15502),
-(7434, 15502),
-(2289, 7594),
-(7434, 15503),
-(7594, 15503),
-(2289, 8538),
-(7594, 15501),
-(8310, 15500),
-(2290, 7356),
-(2290, 7597),
-(7597, 15504),
-(7356, 15504),
-(2290, 7434),
-(7356, 15503),
-(2290, 7898),
-(7898, 15502),
-(7898, 15505),
-(7597, 15505),
-(2291, 7345),
-(2291, 9717),
-(9717, 15506),
-(7345, 15506),
-(2291, 7597),
-(7345, 15504),
-(2291, 9887),
-(9887, 15505),
-(9887, 15507),
-(9717, 15507),
-(2292, 5202),
-(2292, 5027),
-(5027, 15508),
-(5202, 15508),
-(2292, 5436),
-(5202, 15509),
-(5436, 15509),
-(2292, 5353),
-(5436, 15510),
-(5353, 15510),
-(5353, 15511),
-(5027, 15511),
-(2293, 4954),
-(2293, 5512),
-(5512, 15512),
-(4954, 15512),
-(2293, 5027),
-(4954, 15508),
-(2293, 5350),
-(5350, 15511),
-(5350, 15513),
-(5512, 15513),
-(2294, 8921),
-(2294, 5512),
-(8921, 15513),
-(2294, 9018),
-(8921, 15514),
-(9018, 15514),
-(2294, 5347),
-(9018, 15515),
-(5347, 15515),
-(5347, 15512),
-(2295, 9585),
-(2295, 8829),
-(8829, 15455),
-(2295, 8618),
-(8618, 15453),
-(2295, 9893),
-(8618, 15516),
-(8829, 15517),
-(2296, 9060),
-(2296, 12799),
-(12799, 15457),
-(2296, 8829),
-(2296, 12638),
-(12799, 13006),
-(2297, 12779),
-(2297, 4451),
-(12779, 13007),
-(2297, 8537),
-(12779, 15459),
-(2297, 12799),
-(2298, 12744),
-(2298, 12590),
-(12744, 13008),
-(2298, 8566),
-(12744, 15466),
-(8566, 15466),
-(2298, 8213),
-(8566, 15461),
-(8213, 15461),
-(8213, 15518),
-(2299, 12776),
-(2299, 4500),
-(12776, 13009),
-(2299, 9668),
-(12776, 15463),
-(2299, 12744),
-(2300, 7013),
-(2300, 12631),
-(7013, 15519),
-(2300, 8866),
-(7013, 15467),
-(2300, 12776),
-(2301, 8769),
-(2301, 9178),
-(9178, 15520),
-(8769, 15520),
-(2301, 8792),
-(8769, 15456),
-(2301, 8684),
-(8684, 15458),
-(8684, 15521),
-(9178, 15521),
-(2302, 9277),
-(2302, 8938),
-(8938, 15522),
-(9277, 15522),
-(2302, 8684),
-(9277, 15521),
-(2302, 8619),
-(8938, 15460),
-(2303, 9842),
-(2303, 9404),
-(9404, 15462),
-(9842, 15462),
-(2303, 9667),
-(9842, 15465),
-(9667, 15465),
-(2303, 9795),
-(9667, 15523),
-(9795, 15523),
-(9795, 15524),
-(9404, 15524),
-(2304, 9588),
-(2304, 9667),
-(2304, 9400),
-(9400, 15464),
-(2304, 9369),
-(9400, 15525),
-(9369, 15525),
-(9369, 15523),
-(2305, 4622),
-(2305, 8953),
-(4622, 15468),
-(2305, 4944),
-(4622, 15526),
-(4944, 15526),
-(2305, 9400),
-(4944, 15525),
-(2306, 5275),
-(2306, 4634),
-(4634, 15469),
-(5275, 15469),
-(2306, 6582),
-(5275, 15474),
-(6582, 15474),
-(2306, 4777),
-(6582, 15527),
-(4777, 15527),
-(4777, 15528),
-(4634, 15528),
-(2307, 5694),
-(2307, 5189),
-(5189, 15529),
-(5694, 15529),
-(2307, 6582),
-(5694, 15527),
-(2307, 4658),
-(5189, 15473),
-(2308, 8747),
-(2308, 9927),
-(2308, 8567),
-(8567, 15493),
-(2308, 5189),
-(8567, 15529),
-(2309, 7293),
-(2309, 9733),
-(9733, 15530),
-(7293, 15530),
-(2309, 8922),
-(7293, 15454),
-(2309, 8769),
-(9733, 15520),
-(2310, 5347),
-(2310, 9947),
-(9947, 15512),
-(2310, 8244),
-(8244, 15515),
-(2310, 9733),
-(8244, 15530),
-(9947, 15520),
-(2311, 4954),
-(2311, 6425),
-(6425, 15508),
-(2311, 9947),
-(2311, 9178),
-(6425, 15521),
-(2312, 5202),
-(2312, 6686),
-(6686, 15509),
-(2312, 6425),
-(2312, 9277),
-(6686, 15522),
-(2313, 7345),
-(2313, 5588),
-(5588, 15504),
-(2313, 6016),
-(6016, 15506),
-(2313, 9795),
-(6016, 15524),
-(5588, 15523),
-(2314, 7356),
-(2314, 5282),
-(5282, 15503),
-(2314, 5588),
-(2314, 9369),
-(5282, 15525),
-(2315, 5282),
-(2315, 7594),
-(2315, 4944),
-(2315, 5727),
-(5727, 15526),
-(5727, 15501),
-(2335, 5064),
-(2335, 5643),
-(5064, 15470),
-(2335, 4982),
-(5064, 15471),
-(2335, 5275),
-(2336, 4930),
-(2336, 4634),
-(4930, 15528),
-(2336, 4622),
-(4930, 15526),
-(2336, 5915),
-(2337, 5727),
-(2337, 8393),
-(2337, 4930),
-(2337, 4911),
-(4911, 15528),
-(4911, 15499),
-(2338, 6773),
-(2338, 9318),
-(9318, 15496),
-(2338, 4911),
-(2338, 4777),
-(9318, 15527),
-(2339, 5694),
-(2339, 9318),
-(2339, 5289),
-(5289, 15529),
-(2339, 6952),
-(5289, 15497),
-(2340, 6393),
-(2340, 6089),
-(6089, 15538),
-(2340, 8618),
-(2340, 9413),
-(6089, 15451),
-(2341, 6089),
-(2341, 8074),
-(2341, 5232),
-(2341, 8314),
-(8314, 15449),
-(8314, 15539),
-(2342, 5736),
-(2342, 8314),
-(2342, 12780),
-(12780, 15447),
-(2342, 12620),
-(12780, 13043),
-(2343, 12643),
-(2343, 7677),
-(7677, 15540),
-(2343, 12780),
-(2343, 4905),
-(7677, 15445),
-(2344, 6486),
-(2344, 7765),
-(7765, 15541),
-(2344, 7677),
-(2344, 4745),
-(7765, 15443),
-(2345, 6059),
-(2345, 9432),
-(9432, 15542),
-(2345, 7765),
-(2345, 7167),
-(9432, 15441),
-(2346, 5970),
-(2346, 9523),
-(9523, 15543),
-(5970, 15543),
-(2346, 9432),
-(5970, 15542),
-(2346, 7678),
-(9523, 15439),
-(2347, 7238),
-(2347, 8588),
-(8588, 15544),
-(7238, 15544),
-(2347, 9523),
-(7238, 15543),
-(2347, 8163),
-(8588, 15437),
-(2348, 6416),
-(2348, 9267),
-(9267, 15434),
-(2348, 5020),
-(5020, 15433),
-(2348, 6392),
-(5020, 15545),
-(6392, 15545),
-(6392, 15546),
-(9267, 15546),
-(2349, 6392),
-(2349, 6390),
-(6390, 15546),
-(2349, 6441),
-(6441, 15545),
-(2349, 5527),
-(6441, 15547),
-(5527, 15547),
-(5527, 15548),
-(6390, 15548),
-(2350, 5527),
-(2350, 5879),
-(5879, 15548),
-(2350, 5609),
-(5609, 15547),
-(2350, 5369),
-(5609, 15549),
-(5369, 15549),
-(5369, 15550),
-(5879, 15550),
-(2351, 5432),
-(2351, 5369),
-(5432, 15549),
-(2351, 5213),
-(5432, 15551),
-(5213, 15551),
-(2351, 5365),
-(5213, 15552),
-(5365, 15552),
-(5365, 15550),
-(2352, 7898),
-(2352, 8387),
-(8387, 15505),
-(2352, 8988),
-(8988, 15502),
-(2352, 5213),
-(8988, 15552),
-(8387, 15551),
-(2353, 5013),
-(2353, 8188),
-(8188, 15553),
-(5013, 15553),
-(2353, 9829),
-(5013, 15452),
-(2353, 7293),
-(8188, 15530),
-(2354, 9304),
-(2354, 4594),
-(4594, 15450),
-(2354, 5013),
-(2354, 7080),
-(7080, 15553),
-(7080, 15554),
-(4594, 15554),
-(2355, 7008),
-(2355, 4594),
-(7008, 15554),
-(2355, 9848),
-(7008, 15555),
-(9848, 15555),
-(2355, 5469),
-(9848, 15448),
-(2356, 5647),
-(2356, 9527),
-(9527, 15446),
-(2356, 9848),
-(2356, 7582),
-(7582, 15555),
-(7582, 15556),
-(9527, 15556),
-(2357, 4647),
-(2357, 8571),
-(8571, 15444),
-(2357, 9527),
-(2357, 7838),
-(7838, 15556),
-(7838, 15557),
-(8571, 15557),
-(2358, 4800),
-(2358, 9008),
-(9008, 15442),
-(2358, 8571),
-(2358, 7423),
-(7423, 15557),
-(7423, 15558),
-(9008, 15558),
-(2359, 6931),
-(2359, 8089),
-(8089, 15440),
-(2359, 9008),
-(2359, 7337),
-(7337, 15558),
-(7337, 15559),
-(8089, 15559),
-(2360, 8089),
-(2360, 7726),
-(2360, 8525),
-(8525, 15559),
-(2360, 8470),
-(8525, 15560),
-(8470, 15560),
-(8470, 15438),
-(2361, 7922),
-(2361, 8258),
-(8258, 15436),
-(2361, 8470),
-(2361, 7509),
-(7509, 15560),
-(7509, 15561),
-(8258, 15561),
-(2362, 6401),
-(2362, 6333),
-(6333, 15432),
-(2362, 8258),
-(2362, 7761),
-(7761, 15561),
-(7761, 15562),
-(6333, 15562),
-(2363, 9822),
-(2363, 6105),
-(6105, 15563),
-(9822, 15563),
-(2363, 9887),
-(9822, 15507),
-(2363, 8387),
-(6105, 15551),
-(2364, 9399),
-(2364, 9741),
-(9741, 15564),
-(9399, 15564),
-(2364, 9472),
-(9399, 15563),
-(9472, 15563),
-(2364, 9212),
-(9472, 15565),
-(9212, 15565),
-(9212, 15566),
-(9741, 15566),
-(2365, 9458),
-(2365, 9044),
-(9044, 15567),
-(9458, 15567),
-(2365, 9741),
-(9458, 15564),
-(2365, 9208),
-(9208, 15566),
-(9208, 15568),
-(9044, 15568),
-(2366, 5133),
-(2366, 5537),
-(5537, 15569),
-(5133, 15569),
-(2366, 9044),
-(5133, 15567),
-(2366, 5377),
-(5377, 15568),
-(5377, 15570),
-(5537, 15570),
-(2367, 5465),
-(2367, 8696),
-(8696, 15571),
-(5465, 15571),
-(2367, 5537),
-(5465, 15569),
-(2367, 5535),
-(5535, 15570),
-(5535, 15572),
-(8696, 15572),
-(2368, 9212),
-(2368, 9923),
-(9923, 15566),
-(2368, 4991),
-(4991, 15565),
-(2368, 8536),
-(4991, 15573),
-(8536, 15573),
-(8536, 15574),
-(9923, 15574),
-(2369, 9923),
-(2369, 9208),
-(2369, 8623),
-(8623, 15574),
-(2369, 5642),
-(8623, 15575),
-(5642, 15575),
-(5642, 15568),
-(2370, 5642),
-(2370, 5377),
-(2370, 9744),
-(9744, 15575),
-(2370, 5212),
-(9744, 15576),
-(5212, 15576),
-(5212, 15570),
-(2371, 8768),
-(2371, 8696),
-(8768, 15572),
-(2371, 8858),
-(8768, 15577),
-(8858, 15577),
-(2371, 9190),
-(8858, 15578),
-(9190, 15578),
-(9190, 15571),
-(2372, 8858),
-(2372, 6965),
-(6965, 15578),
-(2372, 6021),
-(6021, 15577),
-(2372, 7423),
-(6021, 15558),
-(6965, 15557),
-(2373, 8947),
-(2373, 6873),
-(6873, 15579),
-(8947, 15579),
-(2373, 6965),
-(8947, 15578),
-(2373, 7838),
-(6873, 15556),
-(2374, 6873),
-(2374, 8088),
-(8088, 15579),
-(2374, 7582),
-(2374, 6794),
-(6794, 15555),
-(6794, 15580),
-(8088, 15580),
-(2375, 6794),
-(2375, 7837),
-(7837, 15580),
-(2375, 7008),
-(2375, 7694),
-(7694, 15554),
-(7694, 15581),
-(7837, 15581),
-(2376, 7921),
-(2376, 7325),
-(7325, 15582),
-(7921, 15582),
-(2376, 7694),
-(7921, 15581),
-(2376, 7080),
-(7325, 15553),
-(2377, 7325),
-(2377, 9376),
-(9376, 15582),
-(2377, 8188),
-(2377, 8244),
-(9376, 15515),
-(2378, 9376),
-(2378, 7921),
-(2378, 9018),
-(2378, 9293),
-(9293, 15514),
-(9293, 15581),
-(2379, 8947),
-(2379, 9190),
-(2379, 8151),
-(8151, 15579),
-(2379, 9441),
-(8151, 15583),
-(9441, 15583),
-(9441, 15571),
-(2380, 9441),
-(2380, 5465),
-(2380, 7757),
-(7757, 15583),
-(2380, 9958),
-(7757, 15584),
-(9958, 15584),
-(9958, 15569),
-(2381, 9958),
-(2381, 5133),
-(2381, 7507),
-(7507, 15584),
-(2381, 5004),
-(7507, 15585),
-(5004, 15585),
-(5004, 15567),
-(2382, 8695),
-(2382, 5353),
-(8695, 15510),
-(2382, 5933),
-(8695, 15564),
-(5933, 15564),
-(2382, 7057),
-(5933, 15586),
-(7057, 15586),
-(7057, 15511),
-(2383, 7057),
-(2383, 5350),
-(2383, 9657),
-(9657, 15586),
-(2383, 7300),
-(9657, 15587),
-(7300, 15587),
-(7300, 15513),
-(2384, 8921),
-(2384, 7390),
-(7390, 15514),
-(2384, 7300),
-(2384, 4733),
-(4733, 15587),
-(4733, 15588),
-(7390, 15588),
-(2385, 8468),
-(2385, 7390),
-(8468, 15588),
-(2385, 7837),
-(8468, 15580),
-(2385, 9293),
-(2386, 8088),
-(2386, 8151),
-(2386, 8468),
-(2386, 9317),
-(9317, 15588),
-(9317, 15583),
-(2387, 9220),
-(2387, 4733),
-(9220, 15587),
-(2387, 7757),
-(9220, 15584),
-(2387, 9317),
-(2388, 9571),
-(2388, 9657),
-(9571, 15586),
-(2388, 7507),
-(9571, 15585),
-(2388, 9220),
-(2389, 5004),
-(2389, 9458),
-(2389, 9571),
-(2389, 5933),
-(2390, 9744),
-(2390, 6813),
-(6813, 15576),
-(2390, 6868),
-(6868, 15575),
-(2390, 7761),
-(6868, 15562),
-(6813, 15561),
-(2391, 5700),
-(2391, 6333),
-(5700, 15562),
-(2391, 9691),
-(5700, 15589),
-(9691, 15589),
-(2391, 6863),
-(9691, 15433),
-(2392, 8623),
-(2392, 6868),
-(2392, 7442),
-(7442, 15574),
-(2392, 5700),
-(7442, 15589),
-(2393, 7958),
-(2393, 9922),
-(9922, 15590),
-(7958, 15590),
-(2393, 5020),
-(7958, 15545),
-(2393, 9691),
-(9922, 15589),
-(2394, 9323),
-(2394, 8566),
-(2394, 9842),
-(2394, 8973),
-(2395, 5111),
-(2395, 9717),
-(5111, 15507),
-(2395, 5436),
-(5111, 15510),
-(2395, 4846),
-(4846, 15509),
-(4846, 15506),
-(2396, 12779),
-(2396, 8708),
-(2396, 12637),
-(2396, 8213),
-(2397, 9180),
-(2397, 9404),
-(9180, 15524),
-(2397, 8938),
-(9180, 15522),
-(2397, 9133),
-(2398, 4846),
-(2398, 6016),
-(2398, 6686),
-(2398, 9180),
-(2399, 8695),
-(2399, 9399),
-(2399, 5111),
-(2399, 9822),
-(2400, 5432),
-(2400, 6105),
-(2400, 6622),
-(6622, 15549),
-(2400, 9472),
-(6622, 15565),
-(2401, 6622),
-(2401, 4991),
-(2401, 5609),
-(2401, 7550),
-(7550, 15547),
-(7550, 15573),
-(2402, 9922),
-(2402, 7202),
-(7202, 15590),
-(2402, 7442),
-(2402, 8536),
-(7202, 15573),
-(2403, 7550),
-(2403, 7202),
-(2403, 6441),
-(2403, 7958),
-(2404, 8261),
-(2404, 5212),
-(8261, 15576),
-(2404, 7613),
-(8261, 15591),
-(7613, 15591),
-(2404, 5535),
-(7613, 15572),
-(2405, 8768),
-(2405, 8036),
-(8036, 15577),
-(2405, 7613),
-(2405, 5721),
-(5721, 15591),
-(5721, 15592),
-(8036, 15592),
-(2406, 8261),
-(2406, 5893),
-(5893, 15591),
-(2406, 6813),
-(2406, 7509),
-(5893, 15560),
-(2407, 5808),
-(2407, 8525),
-(5808, 15559),
-(2407, 5721),
-(5808, 15592),
-(2407, 5893),
-(2408, 8036),
-(2408, 6021),
-(2408, 5808),
-(2408, 7337),
-(2409, 5724),
-(2409, 9562),
-(9562, 15491),
-(2409, 8929),
-(8929, 15490),
-(2409, 4888),
-(8929, 15593),
-(4888, 15593),
-(4888, 15594),
-(9562, 15594),
-(2410, 9562),
-(2410, 6328),
-(2410, 4966),
-(4966, 15594),
-(2410, 9821),
-(4966, 15595),
-(9821, 15595),
-(9821, 15492),
-(2411, 9821),
-(2411, 5807),
-(5807, 15492),
-(2411, 6749),
-(6749, 15595),
-(2411, 7603),
-(6749, 15596),
-(7603, 15596),
-(7603, 15488),
-(5807, 15488),
-(2412, 7316),
-(2412, 6999),
-(7316, 15486),
-(2412, 6569),
-(7316, 15597),
-(6569, 15597),
-(2412, 8064),
-(6569, 15598),
-(8064, 15598),
-(8064, 15484),
-(2413, 8966),
-(2413, 8433),
-(8433, 15599),
-(8966, 15599),
-(2413, 9269),
-(8966, 15493),
-(2413, 8458),
-(8433, 15482),
-(2414, 5289),
-(2414, 5652),
-(5652, 15497),
-(2414, 8567),
-(2414, 8966),
-(5652, 15599),
-(2415, 8064),
-(2415, 6835),
-(2415, 6650),
-(6650, 15598),
-(2415, 8433),
-(6650, 15599),
-(2416, 7182),
-(2416, 8873),
-(8873, 15494),
-(2416, 5652),
-(2416, 6389),
-(6389, 15599),
-(6389, 15600),
-(8873, 15600),
-(2417, 6478),
-(2417, 6650),
-(6478, 15598),
-(2417, 6138),
-(6478, 15601),
-(6138, 15601),
-(2417, 6389),
-(6138, 15600),
-(2418, 12629),
-(2418, 7013),
-(2418, 12807),
-(12807, 13019),
-(2418, 5303),
-(12807, 15470),
-(2419, 4405),
-(2419, 12807),
-(2419, 12811),
-(12811, 13020),
-(2419, 5064),
-(12811, 15471),
-(2420, 5160),
-(2420, 12814),
-(12814, 15472),
-(2420, 12811),
-(2420, 4311),
-(12814, 13022),
-(2421, 8280),
-(2421, 7516),
-(8280, 15480),
-(2421, 6222),
-(8280, 15602),
-(6222, 15602),
-(2421, 7561),
-(6222, 15603),
-(7561, 15603),
-(7561, 15477),
-(2422, 7561),
-(2422, 7428),
-(2422, 6276),
-(6276, 15481),
-(2423, 6276),
-(2423, 6588),
-(2423, 6044),
-(6044, 15483),
-(2424, 6044),
-(2424, 7079),
-(2424, 7146),
-(7146, 15485),
-(2425, 6876),
-(2425, 6232),
-(6876, 15487),
-(2425, 7146),
-(2426, 5809),
-(2426, 5508),
-(5508, 15490),
-(2426, 5265),
-(5265, 15489),
-(2427, 6820),
-(2427, 6222),
-(2430, 5970),
-(2430, 12634),
-(2430, 6464),
-(6464, 15543),
-(2430, 12821),
-(12821, 13047),
-(2431, 7238),
-(2431, 6464),
-(2431, 5418),
-(5418, 15544),
-(2432, 5508),
-(2432, 5418),
-(2432, 5032),
-(5032, 15544),
-(5032, 15490),
-(2433, 5032),
-(2433, 8929),
-(2433, 8588),
-(2433, 4679),
-(4679, 15437),
-(4679, 15593),
-(2447, 7936),
-(2447, 8010),
-(7936, 15435),
-(2447, 7706),
-(7936, 15622),
-(7706, 15622),
-(2447, 4679),
-(7706, 15593),
-(2448, 5997),
-(2448, 6155),
-(5997, 15431),
-(2448, 9583),
-(5997, 15623),
-(9583, 15623),
-(2448, 7936),
-(9583, 15622),
-(2449, 8242),
-(2449, 6078),
-(8242, 15434),
-(2449, 8799),
-(8242, 15624),
-(8799, 15624),
-(2449, 5997),
-(8799, 15623),
-(2450, 9267),
-(2450, 8242),
-(2450, 4845),
-(4845, 15546),
-(2450, 9059),
-(4845, 15625),
-(9059, 15625),
-(9059, 15624),
-(2451, 8636),
-(2451, 6975),
-(6975, 15626),
-(8636, 15626),
-(2451, 4845),
-(8636, 15625),
-(2451, 6390),
-(6975, 15548),
-(2452, 5879),
-(2452, 6975),
-(2452, 6729),
-(6729, 15550),
-(2452, 8552),
-(6729, 15627),
-(8552, 15627),
-(8552, 15626),
-(2453, 5365),
-(2453, 6729),
-(2453, 6380),
-(6380, 15552),
-(2453, 5638),
-(6380, 15628),
-(5638, 15628),
-(5638, 15627),
-(2454, 8021),
-(2454, 8310),
-(8021, 15500),
-(2454, 6380),
-(8021, 15628),
-(2454, 8988),
-(2455, 4978),
-(2455, 8798),
-(8798, 15629),
-(4978, 15629),
-(2455, 6569),
-(4978, 15598),
-(2455, 4747),
-(4747, 15597),
-(4747, 15630),
-(8798, 15630),
-(2456, 6478),
-(2456, 5634),
-(5634, 15601),
-(2456, 4978),
-(2456, 9054),
-(9054, 15629),
-(9054, 15631),
-(5634, 15631),
-(2457, 9749),
-(2457, 9757),
-(9757, 15632),
-(9749, 15632),
-(2457, 6749),
-(9749, 15596),
-(2457, 4815),
-(4815, 15595),
-(4815, 15633),
-(9757, 15633),
-(2458, 6576),
-(2458, 4966),
-(6576, 15594),
-(2458, 9140),
-(6576, 15634),
-(9140, 15634),
-(2458, 4815),
-(9140, 15633),
-(2459, 6576),
-(2459, 9225),
-(9225, 15634),
-(2459, 4888),
-(2459, 6701),
-(6701, 15593),
-(6701, 15635),
-(9225, 15635),
-(2460, 9875),
-(2460, 8103),
-(8103, 15636),
-(9875, 15636),
-(2460, 9583),
-(9875, 15622),
-(2460, 9781),
-(9781, 15623),
-(9781, 15637),
-(8103, 15637),
-(2461, 8173),
-(2461, 4684),
-(4684, 15638),
-(8173, 15638),
-(2461, 9781),
-(8173, 15637),
-(2461, 8799),
-(4684, 15624),
-(2462, 9194),
-(2462, 6594),
-(6594, 15639),
-(9194, 15639),
-(2462, 8021),
-(9194, 15628),
-(2462, 8156),
-(6594, 15498),
-(2463, 7352),
-(2463, 7836),
-(7836, 15640),
-(7352, 15640),
-(2463, 6594),
-(7352, 15639),
-(2463, 6864),
-(7836, 15495),
-(2464, 7820),
-(2464, 6780),
-(7820, 15494),
-(2464, 7773),
-(7820, 15641),
-(7773, 15641),
-(2464, 7836),
-(7773, 15640),
-(2465, 7773),
-(2465, 7352),
-(2465, 7177),
-(7177, 15641),
-(2465, 7515),
-(7177, 15642),
-(7515, 15642),
-(7515, 15639),
-(2466, 9194),
-(2466, 5638),
-(2466, 7515),
-(2466, 9452),
-(9452, 15642),
-(9452, 15627),
-(2467, 7925),
-(2467, 4604),
-(4604, 15643),
-(7925, 15643),
-(2467, 4684),
-(7925, 15638),
-(2467, 9059),
-(4604, 15625),
-(2468, 9886),
-(2468, 8636),
-(9886, 15626),
-(2468, 7023),
-(9886, 15644),
-(7023, 15644),
-(2468, 4604),
-(7023, 15643),
-(2469, 9452),
-(2469, 8552),
-(2469, 7096),
-(7096, 15642),
-(2469, 9886),
-(7096, 15644),
-(2470, 6724),
-(2470, 8873),
-(6724, 15600),
-(2470, 9504),
-(6724, 15645),
-(9504, 15645),
-(2470, 7820),
-(9504, 15641),
-(2471, 4744),
-(2471, 9504),
-(4744, 15645),
-(2471, 7096),
-(4744, 15644),
-(2471, 7177),
-(2472, 6823),
-(2472, 6138),
-(6823, 15601),
-(2472, 4820),
-(6823, 15646),
-(4820, 15646),
-(2472, 6724),
-(4820, 15645),
-(2473, 4744),
-(2473, 7023),
-(2473, 4820),
-(2473, 9828),
-(9828, 15646),
-(9828, 15643),
-(2474, 8035),
-(2474, 5634),
-(8035, 15631),
-(2474, 4904),
-(8035, 15647),
-(4904, 15647),
-(2474, 6823),
-(4904, 15646),
-(2475, 9828),
-(2475, 7925),
-(2475, 4904),
-(2475, 8816),
-(8816, 15647),
-(8816, 15638),
-(2476, 8816),
-(2476, 8173),
-(2476, 5308),
-(5308, 15647),
-(2476, 8882),
-(5308, 15648),
-(8882, 15648),
-(8882, 15637),
-(2477, 5735),
-(2477, 8205),
-(8205, 15649),
-(5735, 15649),
-(2477, 5308),
-(5735, 15648),
-(2477, 8035),
-(8205, 15631),
-(2478, 5157),
-(2478, 7129),
-(7129, 15650),
-(5157, 15650),
-(2478, 8205),
-(5157, 15649),
-(2478, 9054),
-(7129, 15629),
-(2479, 7205),
-(2479, 8798),
-(7205, 15630),
-(2479, 5231),
-(7205, 15651),
-(5231, 15651),
-(2479, 7129),
-(5231, 15650),
-(2480, 8106),
-(2480, 6799),
-(6799, 15652),
-(8106, 15652),
-(2480, 9757),
-(8106, 15632),
-(2480, 7527),
-(7527, 15633),
-(7527, 15653),
-(6799, 15653),
-(2481, 7606),
-(2481, 9140),
-(7606, 15634),
-(2481, 6882),
-(7606, 15654),
-(6882, 15654),
-(2481, 7527),
-(6882, 15653),
-(2482, 7687),
-(2482, 9225),
-(7687, 15635),
-(2482, 9262),
-(7687, 15636),
-(9262, 15636),
-(2482, 7606),
-(9262, 15654),
-(2483, 9875),
-(2483, 7706),
-(2483, 7687),
-(2483, 6701),
-(2484, 6008),
-(2484, 9709),
-(9709, 15655),
-(6008, 15655),
-(2484, 9078),
-(6008, 15656),
-(9078, 15656),
-(2484, 8103),
-(9078, 15636),
-(9709, 15637),
-(2485, 6253),
-(2485, 5042),
-(5042, 15657),
-(6253, 15657),
-(2485, 9709),
-(6253, 15655),
-(2485, 8882),
-(5042, 15648),
-(2486, 5842),
-(2486, 9811),
-(9811, 15658),
-(5842, 15658),
-(2486, 5042),
-(5842, 15657),
-(2486, 5735),
-(9811, 15649),
-(2487, 5930),
-(2487, 9911),
-(9911, 15659),
-(5930, 15659),
-(2487, 9811),
-(5930, 15658),
-(2487, 5157),
-(9911, 15650),
-(2488, 8182),
-(2488, 7046),
-(7046, 15660),
-(8182, 15660),
-(2488, 9911),
-(8182, 15659),
-(2488, 5231),
-(7046, 15651),
-(2489, 6620),
-(2489, 6799),
-(6620, 15653),
-(2489, 6344),
-(6620, 15661),
-(6344, 15661),
-(2489, 7381),
-(6344, 15662),
-(7381, 15662),
-(7381, 15652),
-(2490, 6620),
-(2490, 6430),
-(6430, 15661),
-(2490, 6882),
-(2490, 7636),
-(7636, 15654),
-(7636, 15663),
-(6430, 15663),
-(2491, 7636),
-(2491, 7953),
-(7953, 15663),
-(2491, 9262),
-(2491, 9078),
-(7953, 15656),
-(2492, 6520),
-(2492, 6430),
-(6520, 15663),
-(2492, 6166),
-(6520, 15664),
-(6166, 15664),
-(6166, 15661),
-(2493, 6322),
-(2493, 8182),
-(6322, 15660),
-(2493, 5824),
-(6322, 15664),
-(5824, 15664),
-(5824, 15659),
-(2494, 8192),
-(2494, 5842),
-(8192, 15658),
-(2494, 8344),
-(8192, 15664),
-(8344, 15664),
-(8344, 15657),
-(2495, 8051),
-(2495, 6008),
-(8051, 15655),
-(2495, 7874),
-(8051, 15664),
-(7874, 15664),
-(7874, 15656),
-(2496, 8007),
-(2496, 7347),
-(7347, 15480),
-(2496, 7915),
-(2496, 7510),
-(7347, 15476),
-(2497, 9660),
-(2497, 7769),
-(7769, 15476),
-(2497, 12814),
-(2497, 12597),
-(7769, 15665),
-(2498, 7769),
-(2498, 7347),
-(2498, 6217),
-(2498, 8280),
-(2556, 6166),
-(2556, 6344),
-(2556, 6666),
-(6666, 15664),
-(6666, 15662),
-(2557, 5824),
-(2557, 5930),
-(2557, 8192),
-(2558, 8344),
-(2558, 6253),
-(2558, 8051),
-(2559, 7874),
-(2559, 7953),
-(2559, 6520),
-(2735, 5979),
-(2735, 5807),
-(2735, 6072),
-(6072, 15487),
-(2735, 5978),
-(6072, 15489),
-(2736, 6483),
-(2736, 7603),
-(6483, 15596),
-(2736, 7316),
-(6483, 15597),
-(2736, 6457),
-(2737, 6876),
-(2737, 5265),
-(2737, 6072),
-(2740, 9749),
-(2740, 6483),
-(2740, 8777),
-(8777, 15632),
-(2740, 4747),
-(8777, 15630),
-(2741, 7205),
-(2741, 6342),
-(6342, 15651),
-(2741, 8777),
-(2741, 8106),
-(6342, 15652),
-(2742, 7046),
-(2742, 6177),
-(6177, 15660),
-(2742, 6342),
-(2742, 7381),
-(6177, 15662),
-(2744, 6666),
-(2744, 6177),
-(2744, 6322),
-    }
+    return _load_indices('ears')
 
 
 def get_half_indices():
-    return {
-(14431, 14495),
-(8781, 13212),
-(8781, 13213),
-(5496, 13418),
-(5496, 13419),
-(8863, 13425),
-(8863, 13428),
-(8941, 13429),
-(8941, 13425),
-(6429, 13453),
-(6429, 13454),
-(7029, 13456),
-(7029, 13457),
-(9798, 13509),
-(9798, 13510),
-(6935, 13562),
-(6935, 13565),
-(6011, 13457),
-(6011, 13454),
-(7119, 13679),
-(7119, 13680),
-(7536, 13682),
-(7536, 13683),
-(8624, 13453),
-(8624, 13688),
-(5669, 13692),
-(5669, 13693),
-(5946, 13697),
-(5946, 13692),
-(6862, 13812),
-(6862, 13813),
-(6574, 13813),
-(6574, 13816),
-(5225, 13816),
-(5225, 13818),
-(5143, 13818),
-(5143, 13821),
-(9752, 13822),
-(9752, 13821),
-(9747, 13824),
-(9747, 13822),
-(5054, 13829),
-(5054, 13830),
-(7477, 13838),
-(7477, 13812),
-(6771, 13929),
-(6771, 13697),
-(4989, 13419),
-(4989, 13944),
-(7927, 13428),
-(7927, 13688),
-(8288, 13213),
-(8288, 13418),
-(7357, 14018),
-(7357, 13565),
-(7346, 13429),
-(7346, 13212),
-(5287, 14037),
-(5287, 14038),
-(6661, 13824),
-(6661, 14161),
-(9634, 14038),
-(9634, 13838),
-(9740, 14161),
-(9740, 13929),
-(6560, 13944),
-(6560, 14037),
-(7584, 13679),
-(7584, 14304),
-(6677, 14305),
-(6677, 14306),
-(9711, 13680),
-(9711, 14307),
-(7983, 13683),
-(7983, 14308),
-(7094, 14308),
-(7094, 14309),
-(6770, 14309),
-(6770, 14306),
-(6241, 14307),
-(6241, 14334),
-(7227, 13682),
-(7227, 14334),
-(8324, 14352),
-(8324, 14353),
-(5685, 14353),
-(5685, 14305),
-(9902, 14361),
-(9902, 14352),
-(6707, 14362),
-(6707, 14361),
-(9032, 14367),
-(9032, 14304),
-(8791, 13829),
-(8791, 14382),
-(7900, 14403),
-(7900, 14404),
-(9014, 14404),
-(9014, 14408),
-(7782, 14382),
-(7782, 14403),
-(5575, 14408),
-(5575, 14421),
-(6959, 14421),
-(6959, 14431),
-(4672, 14472),
-(4672, 14367),
-(7045, 14473),
-(7045, 14472),
-(7635, 14474),
-(7635, 14473),
-(5115, 14495),
-(5115, 14496),
-(5859, 14496),
-(5859, 14474),
-(7747, 13693),
-(7747, 13830),
-(4617, 13510),
-(4617, 13456),
-(5538, 13562),
-(5538, 13509),
-(11629, 16026),
-(11629, 16027),
-(10754, 16038),
-(10754, 16039),
-(11704, 16026),
-(11704, 16064),
-(12416, 16027),
-(12416, 16038),
-(11368, 16064),
-(11368, 16209),
-(11096, 16210),
-(11096, 16211),
-(10330, 16214),
-(10330, 16217),
-(10344, 16217),
-(10344, 16219),
-(10497, 16219),
-(10497, 16221),
-(10805, 16222),
-(10805, 16223),
-(12459, 16231),
-(12459, 16221),
-(11673, 16245),
-(11673, 16231),
-(10151, 16311),
-(10151, 16245),
-(11520, 16312),
-(11520, 16311),
-(11682, 16313),
-(11682, 16314),
-(11234, 16315),
-(11234, 16316),
-(12326, 16335),
-(12326, 16336),
-(12275, 16393),
-(12275, 16394),
-(11716, 16394),
-(11716, 16335),
-(10235, 16397),
-(10235, 16315),
-(11661, 16336),
-(11661, 16397),
-(11642, 16402),
-(11642, 16393),
-(10569, 16403),
-(10569, 16402),
-(11831, 16418),
-(11831, 16419),
-(12565, 16442),
-(12565, 16418),
-(11103, 16210),
-(11103, 16214),
-(12022, 16483),
-(12022, 16403),
-(10410, 16508),
-(10410, 16509),
-(12908, 16039),
-(12908, 14018),
-(12064, 16562),
-(12064, 16312),
-(11794, 16314),
-(11794, 16562),
-(11489, 16316),
-(11489, 16313),
-(10585, 16569),
-(10585, 16570),
-(11384, 16575),
-(11384, 16569),
-(10828, 16570),
-(10828, 16576),
-(11437, 16508),
-(11437, 16576),
-(12406, 16579),
-(12406, 16509),
-(12041, 16581),
-(12041, 16222),
-(11849, 16223),
-(11849, 16582),
-(12160, 16582),
-(12160, 16585),
-(10214, 16419),
-(10214, 16592),
-(11566, 16592),
-(11566, 16483),
-(12047, 16609),
-(12047, 16610),
-(11255, 16612),
-(11255, 16609),
-(12893, 16614),
-(12893, 14362),
-(10288, 16610),
-(10288, 16575),
-(10971, 16442),
-(10971, 16625),
-(11852, 16612),
-(11852, 16614),
-(12087, 16579),
-(12087, 16638),
-(11813, 16638),
-(11813, 16581),
-(10953, 16211),
-(10953, 16209),
-    }
+    return _load_indices('half')
+
 
 def get_jaw_indices():
-    return {
-(513, 6214),
-(513, 9784),
-(9784, 13647),
-(6214, 13647),
-(513, 6826),
-(6826, 13648),
-(9784, 13648),
-(518, 8815),
-(518, 6124),
-(6124, 13656),
-(8815, 13656),
-(518, 5880),
-(8815, 13657),
-(5880, 13657),
-(519, 5880),
-(519, 9248),
-(9248, 13657),
-(519, 6136),
-(9248, 13658),
-(6136, 13658),
-(520, 6136),
-(520, 9336),
-(9336, 13658),
-(520, 5310),
-(9336, 13659),
-(5310, 13659),
-(521, 5310),
-(521, 4993),
-(4993, 13659),
-(521, 6826),
-(4993, 13648),
-(522, 5057),
-(522, 8489),
-(5057, 13660),
-(8489, 13660),
-(522, 5473),
-(8489, 13661),
-(5473, 13661),
-(523, 7335),
-(523, 8900),
-(8900, 13662),
-(7335, 13662),
-(523, 5473),
-(8900, 13661),
-(524, 5899),
-(524, 9784),
-(5899, 13647),
-(524, 5546),
-(5546, 13648),
-(734, 7335),
-(734, 8037),
-(8037, 13662),
-(734, 9933),
-(8037, 13950),
-(9933, 13950),
-(815, 5057),
-(815, 5972),
-(5972, 13660),
-(815, 6214),
-(5972, 13647),
-(1216, 7130),
-(1216, 6124),
-(7130, 13656),
-(1217, 7130),
-(1217, 8815),
-(1217, 7518),
-(7518, 13657),
-(1218, 7518),
-(1218, 9248),
-(1218, 7926),
-(7926, 13658),
-(1219, 7926),
-(1219, 9336),
-(1219, 7681),
-(7681, 13659),
-(1220, 7681),
-(1220, 4993),
-(1220, 5546),
-(1221, 5899),
-(1221, 5972),
-(1221, 8373),
-(8373, 13660),
-(1222, 8457),
-(1222, 8900),
-(8457, 13661),
-(1222, 8237),
-(8237, 13662),
-(1227, 8237),
-(1227, 8037),
-(1227, 6547),
-(6547, 13950),
-(1228, 8373),
-(1228, 8489),
-(1228, 8457),
-(1234, 9933),
-(1234, 6752),
-(6752, 13950),
-(1234, 9233),
-(6752, 14335),
-(9233, 14335),
-(1237, 6547),
-(1237, 5338),
-(1237, 6752),
-(5338, 14335),
-(1258, 6249),
-(1258, 9681),
-(6249, 14340),
-(9681, 14340),
-(1258, 9765),
-(9681, 14341),
-(9765, 14341),
-(1259, 5053),
-(1259, 4663),
-(1259, 4748),
-(4663, 14345),
-(4748, 14345),
-(4748, 14346),
-(5053, 14346),
-(1260, 6249),
-(1260, 8251),
-(1260, 9396),
-(8251, 14348),
-(9396, 14348),
-(9396, 14340),
-(1262, 5338),
-(1262, 7751),
-(1262, 5345),
-(7751, 14351),
-(5345, 14351),
-(5345, 14335),
-(1263, 8324),
-(1263, 9765),
-(1263, 4838),
-(4838, 14341),
-(4838, 14353),
-(8324, 14353),
-(1266, 8251),
-(1266, 5053),
-(1266, 8392),
-(8392, 14346),
-(8392, 14348),
-(1267, 4663),
-(1267, 8165),
-(1267, 9685),
-(8165, 14351),
-(9685, 14351),
-(9685, 14345),
-(1268, 9084),
-(1268, 9681),
-(9084, 14340),
-(1268, 7431),
-(7431, 14341),
-(1269, 4748),
-(1269, 6163),
-(6163, 14346),
-(1269, 7083),
-(7083, 14345),
-(1270, 9084),
-(1270, 9396),
-(1270, 8228),
-(8228, 14348),
-(1271, 5345),
-(1271, 9233),
-(1271, 8165),
-(1272, 4838),
-(1272, 5685),
-(5685, 14353),
-(1272, 7431),
-(1273, 8392),
-(1273, 8228),
-(1273, 6163),
-(1274, 9685),
-(1274, 7083),
-(1274, 7751),
-(1869, 7833),
-(1869, 9581),
-(9581, 15030),
-(7833, 15030),
-(1869, 6688),
-(7833, 15031),
-(6688, 15031),
-(1874, 7024),
-(1874, 5218),
-(5218, 15038),
-(7024, 15038),
-(1874, 6948),
-(6948, 15039),
-(5218, 15039),
-(1875, 6948),
-(1875, 6496),
-(1875, 5290),
-(6496, 15040),
-(5290, 15040),
-(5290, 15039),
-(1876, 6496),
-(1876, 6248),
-(1876, 5046),
-(6248, 15041),
-(5046, 15041),
-(5046, 15040),
-(1877, 6248),
-(1877, 6688),
-(1877, 6725),
-(6725, 15031),
-(6725, 15041),
-(1878, 8269),
-(1878, 7353),
-(1878, 8887),
-(7353, 15042),
-(8887, 15042),
-(8887, 15043),
-(8269, 15043),
-(1879, 9148),
-(1879, 5816),
-(5816, 15044),
-(9148, 15044),
-(1879, 7353),
-(9148, 15042),
-(1880, 6653),
-(1880, 7068),
-(1880, 7833),
-(7068, 15031),
-(6653, 15030),
-(2090, 5816),
-(2090, 4794),
-(2090, 7947),
-(4794, 15320),
-(7947, 15320),
-(7947, 15044),
-(2171, 6758),
-(2171, 8269),
-(6758, 15043),
-(2171, 9581),
-(6758, 15030),
-(2572, 9111),
-(2572, 7024),
-(9111, 15038),
-(2573, 5218),
-(2573, 9111),
-(2573, 9087),
-(9087, 15039),
-(2574, 5290),
-(2574, 9087),
-(2574, 9558),
-(9558, 15040),
-(2575, 5046),
-(2575, 9558),
-(2575, 9282),
-(9282, 15041),
-(2576, 6725),
-(2576, 9282),
-(2576, 7068),
-(2577, 6758),
-(2577, 6653),
-(2577, 8842),
-(8842, 15043),
-(2578, 9148),
-(2578, 8847),
-(8847, 15042),
-(2578, 8606),
-(8606, 15044),
-(2583, 7947),
-(2583, 8606),
-(2583, 6516),
-(6516, 15320),
-(2584, 8887),
-(2584, 8842),
-(2584, 8847),
-(2590, 4794),
-(2590, 9662),
-(2590, 6685),
-(9662, 15695),
-(6685, 15695),
-(6685, 15320),
-(2593, 6516),
-(2593, 6685),
-(2593, 7725),
-(7725, 15695),
-(2614, 8158),
-(2614, 7082),
-(2614, 7166),
-(7082, 15700),
-(7166, 15700),
-(7166, 15701),
-(8158, 15701),
-(2615, 7676),
-(2615, 7427),
-(7676, 15703),
-(7427, 15703),
-(2615, 6861),
-(7427, 15704),
-(6861, 15704),
-(2616, 8158),
-(2616, 7526),
-(7526, 15701),
-(2616, 6662),
-(7526, 15706),
-(6662, 15706),
-(2618, 7725),
-(2618, 8194),
-(8194, 15695),
-(2618, 8694),
-(8194, 15710),
-(8694, 15710),
-(2619, 8324),
-(2619, 7918),
-(7918, 14353),
-(2619, 7082),
-(7918, 15700),
-(2622, 6662),
-(2622, 7172),
-(7172, 15706),
-(2622, 7676),
-(7172, 15703),
-(2623, 6861),
-(2623, 9679),
-(9679, 15704),
-(2623, 5026),
-(9679, 15710),
-(5026, 15710),
-(2624, 7166),
-(2624, 4650),
-(4650, 15701),
-(2624, 4910),
-(4910, 15700),
-(2625, 9906),
-(2625, 7427),
-(9906, 15703),
-(2625, 5442),
-(5442, 15704),
-(2626, 4650),
-(2626, 7116),
-(2626, 7526),
-(7116, 15706),
-(2627, 9662),
-(2627, 8194),
-(2627, 5026),
-(2628, 5685),
-(2628, 7918),
-(2628, 4910),
-(2629, 7116),
-(2629, 7172),
-(2629, 9906),
-(2630, 5442),
-(2630, 9679),
-(2630, 8694),
-        }
+    return _load_indices('jaw')
 
 
 def get_jaw_indices2():
-    return {
-(6434, 13543),
-(6434, 13546),
-(8766, 13547),
-(8766, 13550),
-(9488, 13550),
-(9488, 13552),
-(9659, 13552),
-(9659, 13554),
-(7845, 13554),
-(7845, 13556),
-(7351, 13557),
-(7351, 13560),
-(9784, 13647),
-(9784, 13648),
-(8839, 13649),
-(8839, 13543),
-(7267, 13557),
-(7267, 13556),
-(8815, 13656),
-(8815, 13657),
-(9248, 13657),
-(9248, 13658),
-(9336, 13658),
-(9336, 13659),
-(4993, 13659),
-(4993, 13648),
-(8489, 13660),
-(8489, 13661),
-(8900, 13662),
-(8900, 13661),
-(6002, 13649),
-(6002, 13560),
-(5306, 13705),
-(5306, 13547),
-(8539, 13811),
-(8539, 13672),
-(8037, 13662),
-(8037, 13950),
-(5972, 13660),
-(5972, 13647),
-(9453, 13811),
-(9453, 13705),
-(6752, 13950),
-(6752, 14335),
-(5346, 13546),
-(5346, 14337),
-(9681, 14340),
-(9681, 14341),
-(4748, 14345),
-(4748, 14346),
-(9396, 14348),
-(9396, 14340),
-(7940, 14349),
-(7940, 14350),
-(5345, 14351),
-(5345, 14335),
-(4838, 14341),
-(4838, 14353),
-(7850, 14354),
-(7850, 14355),
-(7592, 14356),
-(7592, 14354),
-(8392, 14346),
-(8392, 14348),
-(9685, 14351),
-(9685, 14345),
-(7790, 14337),
-(7790, 14358),
-(5516, 14358),
-(5516, 14355),
-(8235, 14350),
-(8235, 14356),
-(5037, 14361),
-(5037, 14349),
-(9596, 14928),
-(9596, 14929),
-(5245, 14932),
-(5245, 14933),
-(9683, 14933),
-(9683, 14936),
-(8942, 14936),
-(8942, 14938),
-(8793, 14938),
-(8793, 14940),
-(8407, 14942),
-(8407, 14943),
-(7833, 15030),
-(7833, 15031),
-(7226, 15032),
-(7226, 14928),
-(8593, 14942),
-(8593, 14940),
-(5218, 15038),
-(5218, 15039),
-(5290, 15040),
-(5290, 15039),
-(5046, 15041),
-(5046, 15040),
-(6725, 15031),
-(6725, 15041),
-(8887, 15042),
-(8887, 15043),
-(9148, 15044),
-(9148, 15042),
-(6427, 15032),
-(6427, 14943),
-(9417, 15081),
-(9417, 14932),
-(9730, 15054),
-(9730, 15188),
-(7947, 15320),
-(7947, 15044),
-(6758, 15043),
-(6758, 15030),
-(5785, 15081),
-(5785, 15188),
-(6685, 15695),
-(6685, 15320),
-(9836, 14929),
-(9836, 15696),
-(7166, 15700),
-(7166, 15701),
-(7427, 15703),
-(7427, 15704),
-(7526, 15701),
-(7526, 15706),
-(5146, 15708),
-(5146, 15709),
-(8194, 15695),
-(8194, 15710),
-(7918, 14353),
-(7918, 15700),
-(5385, 15711),
-(5385, 15712),
-(6144, 15712),
-(6144, 15713),
-(7172, 15706),
-(7172, 15703),
-(9679, 15704),
-(9679, 15710),
-(8870, 15696),
-(8870, 15715),
-(5100, 15715),
-(5100, 15711),
-(5451, 15713),
-(5451, 15708),
-(7792, 14361),
-(7792, 15709),
-        }
+    return _load_indices('jaw2')
 
 
 def get_bodybuilder_highlight_indices():
-    return []
+    return _load_indices('bodybuilder_highlight')
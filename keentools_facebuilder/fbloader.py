@@ -17,26 +17,90 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import bpy
+import hashlib
 import logging
 import math
+import time
 
 import numpy as np
 
 from .viewport import FBViewport
 from .utils import attrs, coords, cameras
 from .utils.other import FBStopShaderTimer, restore_ui_elements
+from .utils.undo import FBUndoHistory
+from .utils.template_cache import FBTemplateCache, FBTopologyCache
+from .utils.vertex_map import build_vertex_map
+from .utils.expression_cache import FBExpressionCache
 from .utils.exif_reader import update_image_groups, reload_all_camera_exif
 
 from .builder import UniBuilder
+from .utils.shaders import FBShaderRegistry
 from .config import (Config, get_main_settings, get_operators,
                      BuilderType, ErrorType)
 import keentools_facebuilder.blender_independent_packages.pykeentools_loader as pkt
 
 
+def _matrix_key(mat):
+    return tuple(tuple(row) for row in mat)
+
+
 class FBLoader:
     # Builder selection: FaceBuilder or BodyBuilder
     builder_instance = None
     _viewport = FBViewport()
+    # Incremented when builder state (pins, cameras, geometry) may change
+    _builder_revision = 0
+    # Solution placed on camera objects: camobj name: (model_mat, head_mat)
+    _placed_cameras = {}
+    # Model matrices written to camera properties: camobj name: bytes
+    _saved_model_mats = {}
+    # Serial digest, builder instance and revision of the state
+    # the builder holds
+    _loaded_state = None
+    _deserialize_stats = {'done': 0, 'avoided': 0}
+
+    @classmethod
+    def builder_revision(cls):
+        return cls._builder_revision
+
+    @classmethod
+    def inc_builder_revision(cls):
+        cls._builder_revision += 1
+        FBExpressionCache.set_state_key(None)
+
+    @staticmethod
+    def _serial_digest(serial_str):
+        return hashlib.sha1(serial_str.encode()).digest()
+
+    @classmethod
+    def _set_loaded_state(cls, serial_str):
+        """ Builder holds the serial state until next revision change """
+        cls._loaded_state = cls._builder_state(serial_str)
+        # Masks of a new builder object can differ from cached ones
+        FBExpressionCache.set_state_key(cls._loaded_state[:2])
+
+    @classmethod
+    def _builder_state(cls, serial_str):
+        # Builder object can be replaced without revision change,
+        # e.g. by version sync, so its instance is a part of the state
+        return (cls._serial_digest(serial_str),
+                cls.builder().get_instance_num(), cls._builder_revision)
+
+    @classmethod
+    def deserialize_stats(cls):
+        return dict(cls._deserialize_stats)
+
+    @classmethod
+    def clear_placed_cameras(cls):
+        """ Should be called when camera model_mat properties
+        can be written outside of FBLoader """
+        cls._placed_cameras = {}
+        cls._saved_model_mats = {}
+
+    @classmethod
+    def _save_model_mat(cls, cam, model_mat):
+        cam.set_model_mat(model_mat)
+        cls._saved_model_mats[cam.camobj.name] = model_mat.tobytes()
 
     @classmethod
     def viewport(cls):
@@ -66,6 +130,10 @@ class FBLoader:
     @classmethod
     def new_builder(cls, builder_type=BuilderType.NoneBuilder,
                     ver=Config.unknown_mod_ver):
+        cls.inc_builder_revision()
+        cls.clear_placed_cameras()
+        cls.viewport().clear_pin_tables()
+        FBExpressionCache.set_masks(None)
         return cls.builder().new_builder(builder_type, ver)
 
     @classmethod
@@ -110,6 +178,7 @@ class FBLoader:
 
         cls.update_head_camera_focals(head)
         coords.update_head_mesh_neutral(cls.get_builder(), headobj)
+        vp.wireframer().mesh_outdated = False
         logger.debug("SAVE PINMODE STATE")
 
     @classmethod
@@ -120,9 +189,17 @@ class FBLoader:
         headobj = head.headobj
 
         cls.save_pinmode_state(headnum)
+        # Camera properties can be changed by anything out of pinmode
+        cls.clear_placed_cameras()
 
         vp = cls.viewport()
         vp.unregister_handlers()
+        logger.debug("MODAL BATCH REBUILDS: {}".format(vp.rebuild_counters()))
+        vp.reset_rebuild_counters()
+        vp.clear_residuals_data()
+        logger.debug("SHADER COMPILES: {}".format(FBShaderRegistry.stats()))
+        logger.debug("EXPRESSION CACHE: {}".format(FBExpressionCache.stats()))
+        logger.debug("DESERIALIZE: {}".format(cls.deserialize_stats()))
 
         FBStopShaderTimer.stop()
         logger.debug("STOPPER STOP")
@@ -132,6 +209,12 @@ class FBLoader:
         cameras.show_all_cameras(headnum)
         headobj.hide_set(False)
         settings.pinmode = False
+
+        # Pinmode history result goes to Blender undo as one step
+        if FBUndoHistory.is_changed():
+            from .utils import manipulate
+            manipulate.push_head_in_undo_history(head, 'Pin Mode End.')
+        FBUndoHistory.clear()
         logger.debug("OUT PINMODE")
 
     @classmethod
@@ -140,7 +223,9 @@ class FBLoader:
         settings = get_main_settings()
         head = settings.get_head(headnum)
         # Save block
-        head.set_serial_str(fb.serialize())
+        serial_str = fb.serialize()
+        head.set_serial_str(serial_str)
+        cls._set_loaded_state(serial_str)
 
     @classmethod
     def save_fb_on_headobj(cls, headnum):
@@ -148,7 +233,9 @@ class FBLoader:
         settings = get_main_settings()
         head = settings.get_head(headnum)
 
-        head.set_serial_str(fb.serialize())
+        serial_str = fb.serialize()
+        head.set_serial_str(serial_str)
+        cls._set_loaded_state(serial_str)
 
         head.save_images_src()
         head.save_cam_settings()
@@ -163,7 +250,7 @@ class FBLoader:
         cam = head.get_camera(camnum)
 
         if cam is not None:
-            cam.set_model_mat(fb.model_mat(cam.get_keyframe()))
+            cls._save_model_mat(cam, fb.model_mat(cam.get_keyframe()))
 
         cls.save_fb_on_headobj(headnum)
 
@@ -174,11 +261,22 @@ class FBLoader:
         head = settings.get_head(headnum)
         coords.update_head_mesh(settings, fb, head)
 
+    @classmethod
+    def write_deferred_mesh(cls, headnum):
+        """ Blender mesh update postponed while pin dragging """
+        wireframer = cls.viewport().wireframer()
+        if not wireframer.mesh_outdated:
+            return
+        settings = get_main_settings()
+        head = settings.get_head(headnum)
+        if head is not None:
+            coords.update_head_mesh(settings, cls.get_builder(), head)
+        wireframer.mesh_outdated = False
+
     @classmethod
     def shader_update(cls, headobj):
         cls.viewport().wireframer().init_geom_data(headobj)
-        cls.viewport().wireframer().init_edge_indices(headobj)
-        cls.viewport().wireframer().create_batches()
+        cls.viewport().wireframer().update_batches_positions()
 
     @classmethod
     def fb_redraw(cls, headnum, camnum):
@@ -199,8 +297,9 @@ class FBLoader:
         cls.shader_update(headobj)
 
     @classmethod
-    def rigidity_setup(cls):
-        fb = cls.get_builder()
+    def rigidity_setup(cls, fb=None):
+        if fb is None:
+            fb = cls.get_builder()
         settings = get_main_settings()
         if FBLoader.get_builder_type() == BuilderType.FaceBuilder:
             fb.set_shape_rigidity(settings.shape_rigidity)
@@ -213,11 +312,25 @@ class FBLoader:
         head = settings.get_head(headnum)
         headobj = head.headobj
 
+        logger = logging.getLogger(__name__)
+        head_mat = _matrix_key(headobj.matrix_world)
+        updated = 0
         for i, cam in enumerate(head.cameras):
             if cam.has_pins():
                 kid = cam.get_keyframe()
+                model_mat = fb.model_mat(kid)
+                model_key = model_mat.tobytes()
+                # Unchanged solutions are skipped
+                if cls._placed_cameras.get(cam.camobj.name) == \
+                        (model_key, head_mat) and \
+                        cls._saved_model_mats.get(cam.camobj.name) == \
+                        model_key:
+                    continue
                 cls.place_cameraobj(kid, cam.camobj, headobj)
-                cam.set_model_mat(fb.model_mat(kid))
+                cls._save_model_mat(cam, model_mat)
+                updated += 1
+        logger.debug("CAMERA POSITIONS UPDATED: {} of {}".format(
+            updated, len(head.cameras)))
 
     @classmethod
     def update_all_camera_focals(cls, headnum):
@@ -232,7 +345,10 @@ class FBLoader:
                 focal = coords.focal_by_projection_matrix(
                     proj_mat, Config.default_sensor_width)
 
-                cam.focal = focal * cam.compensate_view_scale()
+                focal *= cam.compensate_view_scale()
+                # Property update callback is heavy, so skip same values
+                if abs(cam.focal - focal) > Config.focal_update_tolerance:
+                    cam.focal = focal
 
     @classmethod
     def update_camera_projection(cls, headnum, camnum):
@@ -245,6 +361,7 @@ class FBLoader:
         kid = camera.get_keyframe()
         fb.update_projection_mat(kid, projection)
         fb.update_image_size(kid, camera.get_oriented_image_size())
+        cls.inc_builder_revision()
 
     @classmethod
     def center_geo_camera_projection(cls, headnum, camnum):
@@ -256,17 +373,18 @@ class FBLoader:
         projection = camera.get_projection_matrix()
         fb.set_centered_geo_keyframe(camera.get_keyframe(), projection,
                                      camera.get_oriented_image_size())
+        cls.inc_builder_revision()
 
     # --------------------
     @classmethod
     def place_cameraobj(cls, keyframe, camobj, headobj):
         fb = cls.get_builder()
-        mat = coords.calc_model_mat(
-            fb.model_mat(keyframe),
-            headobj.matrix_world
-        )
+        model_mat = fb.model_mat(keyframe)
+        mat = coords.calc_model_mat(model_mat, headobj.matrix_world)
         if mat is not None:
             camobj.matrix_world = mat
+            cls._placed_cameras[camobj.name] = (
+                model_mat.tobytes(), _matrix_key(headobj.matrix_world))
 
     @classmethod
     def set_camera_projection(cls, fl, sw, rx, ry,
@@ -285,6 +403,7 @@ class FBLoader:
             near_clip, far_clip)
 
         fb = cls.get_builder()
+        cls.inc_builder_revision()
         fb.set_projection_mat(projection)
 
     @classmethod
@@ -308,9 +427,9 @@ class FBLoader:
             return max(kfs) + 1
         return 1
 
-    @classmethod
-    def get_builder_mesh(cls, builder, mesh_name='keentools_mesh',
-                         masks=(), uv_set='uv0', keyframe=None):
+    @staticmethod
+    def _select_mesh_parts(builder, masks=(), uv_set='uv0'):
+        FBExpressionCache.set_masks(masks)
         for i, m in enumerate(masks):
             builder.set_mask(i, m)
 
@@ -324,12 +443,142 @@ class FBLoader:
         if uv_set == 'uv3':
             builder.select_uv_set(3)
 
+    @classmethod
+    def _builder_geo_mesh(cls, builder, masks=(), uv_set='uv0',
+                          keyframe=None):
+        cls._select_mesh_parts(builder, masks, uv_set)
         if keyframe is not None:
             geo = builder.applied_args_model_at(keyframe)
         else:
             geo = builder.applied_args_model()
-        me = geo.mesh(0)
+        return geo.mesh(0)
+
+    @classmethod
+    def get_builder_mesh(cls, builder, mesh_name='keentools_mesh',
+                         masks=(), uv_set='uv0', keyframe=None, bulk=True):
+        me = cls._builder_geo_mesh(builder, masks, uv_set, keyframe)
+
+        if bulk:
+            mesh = cls.mesh_from_arrays(
+                cls._mesh_arrays(me, cls._builder_vertices(
+                    builder, keyframe, cached=False)), mesh_name)
+        else:
+            mesh = cls._create_mesh_from_pydata(me, mesh_name)
+
+        # Warning! our autosmooth settings work on Shading Flat!
+        # mesh.use_auto_smooth = True
+        # mesh.auto_smooth_angle = math.pi
 
+        return mesh
+
+    @classmethod
+    def get_masked_mesh(cls, mesh_name='keentools_mesh', masks=(),
+                        uv_set='uv0', keyframe=None):
+        """ Current builder mesh. Masked topology is cached, so only
+        positions are taken from builder when it's known """
+        logger = logging.getLogger(__name__)
+        builder = cls.get_builder()
+        key = FBTopologyCache.make_key(cls.get_builder_type(),
+                                       cls.get_builder_version(),
+                                       masks, uv_set)
+        topology = FBTopologyCache.get(key)
+        if topology is None:
+            me = cls._builder_geo_mesh(builder, masks, uv_set, keyframe)
+            builder_vertices = cls._builder_vertices(builder, keyframe)
+            arrays = cls._mesh_arrays(me, builder_vertices)
+            vertex_map = build_vertex_map(
+                arrays['vertices'],
+                coords.builder_to_object_space(builder_vertices))
+            FBTopologyCache.put(key, arrays, vertex_map)
+            logger.debug('MASKED TOPOLOGY CACHED: {} VERTEX MAP: {}'.format(
+                key, vertex_map is not None))
+            return cls.mesh_from_arrays(arrays, mesh_name)
+
+        if topology['vertex_map'] is not None:
+            cls._select_mesh_parts(builder, masks, uv_set)
+            vertices = coords.builder_to_object_space(
+                cls._builder_vertices(builder, keyframe)[
+                    topology['vertex_map']])
+        else:
+            me = cls._builder_geo_mesh(builder, masks, uv_set, keyframe)
+            vertices = coords.builder_to_object_space(cls._mesh_points(
+                me, cls._builder_vertices(builder, keyframe)))
+        return cls.mesh_from_arrays(dict(topology, vertices=vertices),
+                                    mesh_name)
+
+    @staticmethod
+    def _builder_vertices(builder, keyframe=None, cached=True):
+        if keyframe is None:
+            return builder.applied_args_vertices()
+        if cached:
+            return FBExpressionCache.vertices_at(builder, keyframe)
+        return builder.applied_args_model_vertices_at(keyframe)
+
+    @staticmethod
+    def _mesh_points(me, builder_vertices=None):
+        """ Builder vertices are the mesh points when mesh isn't masked.
+        Otherwise points are read one by one """
+        v_count = me.points_count()
+        if builder_vertices is not None and len(builder_vertices) == v_count:
+            return np.asarray(builder_vertices, dtype=np.float32)
+        return np.array([me.point(i) for i in range(v_count)],
+                        dtype=np.float32).reshape((-1, 3))
+
+    @classmethod
+    def _mesh_arrays(cls, me, builder_vertices=None):
+        """ Flat arrays of pykeentools mesh in Blender axes.
+        pykeentools mesh has no bulk getters for faces and UVs,
+        so they are read one by one """
+        f_count = me.faces_count()
+
+        vertices = cls._mesh_points(me, builder_vertices)
+
+        face_sizes = np.array([me.face_size(i) for i in range(f_count)],
+                              dtype=np.int32)
+        loop_vertices = np.array(
+            [me.face_point(i, j) for i in range(f_count)
+             for j in range(face_sizes[i])], dtype=np.int32)
+
+        uvs = np.zeros((len(loop_vertices), 2), dtype=np.float32)
+        uvs_count = min(me.uvs_count(), len(loop_vertices))
+        if uvs_count > 0:
+            uvs[:uvs_count] = [me.uv(i) for i in range(uvs_count)]
+
+        return {'vertices': coords.builder_to_object_space(vertices),
+                'face_sizes': face_sizes,
+                'loop_vertices': loop_vertices,
+                'uvs': uvs}
+
+    @staticmethod
+    def mesh_from_arrays(arrays, mesh_name):
+        """ Mesh is filled from flat arrays by foreach_set """
+        vertices = arrays['vertices']
+        face_sizes = arrays['face_sizes']
+        loop_vertices = arrays['loop_vertices']
+        f_count = len(face_sizes)
+        loop_starts = np.zeros(f_count, dtype=np.int32)
+        np.cumsum(face_sizes[:-1], out=loop_starts[1:])
+
+        mesh = bpy.data.meshes.new(mesh_name)
+        mesh.vertices.add(len(vertices))
+        mesh.vertices.foreach_set('co', vertices.ravel())
+        mesh.loops.add(len(loop_vertices))
+        mesh.loops.foreach_set('vertex_index', loop_vertices)
+        mesh.polygons.add(f_count)
+        mesh.polygons.foreach_set('loop_start', loop_starts)
+        mesh.polygons.foreach_set('loop_total', face_sizes)
+        # Simple Shade Smooth analog
+        mesh.polygons.foreach_set('use_smooth', np.ones(f_count, dtype=bool))
+
+        uvtex = mesh.uv_layers.new()
+        uvtex.data.foreach_set('uv', arrays['uvs'].ravel())
+
+        mesh.update(calc_edges=True)
+        return mesh
+
+    @staticmethod
+    def _create_mesh_from_pydata(me, mesh_name):
+        """ Element by element mesh creation. Kept for comparison """
         v_count = me.points_count()
         vertices = []
         for i in range(0, v_count):
@@ -373,34 +622,44 @@ class FBLoader:
             uvmap[i].uv = me.uv(i)
 
         mesh.update()
-
-        # Warning! our autosmooth settings work on Shading Flat!
-        # mesh.use_auto_smooth = True
-        # mesh.auto_smooth_angle = math.pi
-
         return mesh
 
     @classmethod
     def universal_mesh_loader(cls, builder_type, mesh_name='keentools_mesh',
                               masks=(), uv_set='uv0'):
-        stored_builder_type = FBLoader.get_builder_type()
-        stored_builder_version = FBLoader.get_builder_version()
-        builder = cls.new_builder(builder_type, Config.unknown_mod_ver)
-
-        mesh = cls.get_builder_mesh(builder, mesh_name, masks, uv_set,
-                                    keyframe=None)
-        # Restore builder
-        cls.new_builder(stored_builder_type, stored_builder_version)
-        return mesh
+        """ Template mesh of the latest model. Builders are created
+        only when the template isn't cached yet """
+        key = FBTemplateCache.make_key(builder_type, Config.unknown_mod_ver,
+                                       masks, uv_set)
+        arrays = FBTemplateCache.get(key)
+        if arrays is None:
+            stored_builder_type = FBLoader.get_builder_type()
+            stored_builder_version = FBLoader.get_builder_version()
+            builder = cls.new_builder(builder_type, Config.unknown_mod_ver)
+            me = cls._builder_geo_mesh(builder, masks, uv_set)
+            arrays = cls._mesh_arrays(me, builder.applied_args_vertices())
+            # Restore builder
+            cls.new_builder(stored_builder_type, stored_builder_version)
+            FBTemplateCache.put(key, arrays)
+        return cls.mesh_from_arrays(arrays, mesh_name)
 
     @classmethod
     def load_model_from_head(cls, head):
+        serial_str = head.get_serial_str()
+        if cls._loaded_state == cls._builder_state(serial_str):
+            # Builder hasn't been changed since this state was loaded/saved
+            cls._deserialize_stats['avoided'] += 1
+            return True
         fb = cls.get_builder()
-        if not fb.deserialize(head.get_serial_str()):
+        cls.inc_builder_revision()
+        cls.clear_placed_cameras()
+        cls.viewport().clear_pin_tables()
+        if not fb.deserialize(serial_str):
             logger = logging.getLogger(__name__)
-            logger.warning('DESERIALIZE ERROR: {}'.format(
-                head.get_serial_str()))
+            logger.warning('DESERIALIZE ERROR: {}'.format(serial_str))
             return False
+        cls._deserialize_stats['done'] += 1
+        cls._set_loaded_state(serial_str)
         return True
 
     @classmethod
@@ -465,15 +724,8 @@ class FBLoader:
         return focal
 
     @classmethod
-    def solve(cls, headnum, camnum):
-        def _exception_handling(headnum, msg, license_err=True):
-            logger = logging.getLogger(__name__)
-            logger.error(msg)
-            if settings.pinmode:
-                settings.force_out_pinmode = True
-                settings.license_error = license_err
-                cls.out_pinmode(headnum)
-
+    def prepare_solve(cls, fb, headnum, camnum):
+        """ Solver options setup for builder, returns solved keyframe """
         def _unfix_all(fb, head):
             for cam in head.cameras:
                 fb.set_focal_length_fixed_at(cam.get_keyframe(), False)
@@ -533,39 +785,77 @@ class FBLoader:
                         head.manual_estimation_mode)
             return mode
 
-        def _update_camera_focal_post():
-            focal = cls.get_keyframe_focal(kid)
-            camera.camobj.data.lens = focal
-            camera.focal = focal
-
         settings = get_main_settings()
         head = settings.get_head(headnum)
         camera = head.get_camera(camnum)
         kid = camera.get_keyframe()
-        fb = cls.get_builder()
 
-        cls.rigidity_setup()
+        cls.rigidity_setup(fb)
         fb.set_use_emotions(head.should_use_emotions())
 
         mode = _auto_focal_estimation_mode_and_fixes()
         fb.set_focal_length_estimation_mode(mode)
+        return kid
+
+    @classmethod
+    def handle_solve_exception(cls, headnum, err):
+        settings = get_main_settings()
+        if isinstance(err, pkt.module().UnlicensedException):
+            msg = 'SOLVE LICENSE EXCEPTION'
+            license_err = True
+        elif isinstance(err, pkt.module().InvalidArgumentException):
+            msg = 'SOLVE NO KEYFRAME EXCEPTION'
+            license_err = False
+        else:
+            msg = 'SOLVE UNKNOWN EXCEPTION: {}'.format(str(err))
+            license_err = False
 
+        logger = logging.getLogger(__name__)
+        logger.error(msg)
+        if settings.pinmode:
+            settings.force_out_pinmode = True
+            settings.license_error = license_err
+            cls.out_pinmode(headnum)
+
+    @classmethod
+    def update_camera_focal_post(cls, headnum, camnum, lens_only=False):
+        """ Focal property update saves builder, so it's skipped during
+        drag. Drag end writes focals by update_all_camera_focals """
+        settings = get_main_settings()
+        camera = settings.get_camera(headnum, camnum)
+        focal = cls.get_keyframe_focal(camera.get_keyframe())
+        camera.camobj.data.lens = focal
+        if lens_only:
+            return
+        if abs(camera.focal - focal) > Config.focal_update_tolerance:
+            camera.focal = focal
+
+    @classmethod
+    def setup_preview_solve(cls, fb):
+        """ Interactive tier: current focals are kept, no expressions """
+        fb.set_use_emotions(False)
+        fb.set_focal_length_estimation_mode('FB_FIXED_FOCAL_LENGTH_ALL_FRAMES')
+
+    @classmethod
+    def solve(cls, headnum, camnum, preview=False, lens_only=False):
+        logger = logging.getLogger(__name__)
+        fb = cls.get_builder()
+        kid = cls.prepare_solve(fb, headnum, camnum)
+        if preview:
+            cls.setup_preview_solve(fb)
+        cls.inc_builder_revision()
+
+        start_time = time.perf_counter()
         try:
             fb.solve_for_current_pins(kid)
-        except pkt.module().UnlicensedException:
-            _exception_handling(headnum, 'SOLVE LICENSE EXCEPTION')
-            return False
-        except pkt.module().InvalidArgumentException:
-            _exception_handling(headnum, 'SOLVE NO KEYFRAME EXCEPTION',
-                                license_err=False)
-            return False
         except Exception as err:
-            _exception_handling(headnum,
-                                'SOLVE UNKNOWN EXCEPTION: {}'.format(str(err)),
-                                license_err=False)
+            cls.handle_solve_exception(headnum, err)
             return False
+        logger.debug("{} SOLVE: {:.4f} sec.".format(
+            'PREVIEW' if preview else 'FULL',
+            time.perf_counter() - start_time))
 
-        _update_camera_focal_post()
+        cls.update_camera_focal_post(headnum, camnum, lens_only=lens_only)
         return True
 
     @classmethod
@@ -602,8 +892,11 @@ class FBLoader:
                 pin = fb.pin(kid, i)
                 x, y = pin.img_pos
                 fb.move_pin(kid, i, (x + dx, y + dy))
+        cls.inc_builder_revision()
         # Save info
-        head.set_serial_str(fb.serialize())
+        serial_str = fb.serialize()
+        head.set_serial_str(serial_str)
+        cls._set_loaded_state(serial_str)
 
         focal = head.focal * Config.default_sensor_width / sensor_width
         head.reset_sensor_size()
@@ -694,6 +987,7 @@ class FBLoader:
         camera.set_keyframe(kid)
         projection = camera.get_projection_matrix()
 
+        cls.inc_builder_revision()
         fb.set_centered_geo_keyframe(kid, projection,
                                      camera.get_oriented_image_size())
 
@@ -711,3 +711,5 @@ class FB_PT_PinSettingsPanel(Panel):
         box = layout.box()
         box.prop(settings, 'pin_size', slider=True)
         box.prop(settings, 'pin_sensitivity', slider=True)
+        box.prop(settings, 'coalesce_pin_moves')
+        box.prop(settings, 'async_pin_solve')
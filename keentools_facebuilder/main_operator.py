@@ -192,6 +192,7 @@ class FB_OT_Unmorph(Operator):
         manipulate.push_head_in_undo_history(
             settings.get_head(headnum), 'Before Reset')
 
+        FBLoader.inc_builder_revision()
         fb.unmorph()
 
         for i, camera in enumerate(head.cameras):
@@ -239,6 +240,7 @@ class FB_OT_RemovePins(Operator):
         manipulate.push_head_in_undo_history(
             settings.get_head(headnum), 'Before Remove pins')
 
+        FBLoader.inc_builder_revision()
         fb.remove_pins(kid)
         FBLoader.solve(headnum, camnum)  # is it needed?
 
@@ -347,6 +349,8 @@ class FB_OT_DeleteCamera(Operator):
         kid = camera.get_keyframe()
         fb = FBLoader.get_builder()
         fb.remove_keyframe(kid)
+        FBLoader.inc_builder_revision()
+        FBLoader.viewport().clear_pin_tables()
 
         head = settings.get_head(headnum)
         camera.delete_cam_image()
@@ -650,6 +654,7 @@ class FB_OT_ResetExpression(Operator):
 
         FBLoader.load_model(self.headnum)
         fb = FBLoader.get_builder()
+        FBLoader.inc_builder_revision()
         fb.reset_to_neutral_emotions(
             head.get_keyframe(settings.current_camnum))
 
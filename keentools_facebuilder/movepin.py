@@ -17,12 +17,16 @@
 # ##### END GPL LICENSE BLOCK #####
 
 import logging
+import time
 
 import bpy
 
-from .utils import cameras, manipulate, coords
+from .utils import cameras, coords
+from .utils.other import FBPinDragStats, force_ui_redraw
+from .utils.undo import FBUndoHistory
 from .fbloader import FBLoader
-from .config import Config, get_main_settings
+from .async_solver import FBAsyncSolver
+from .config import Config, get_main_settings, get_addon_preferences
 
 from functools import wraps
 
@@ -43,6 +47,54 @@ def profile_this(fn):
     return wrapped
 
 
+class FBDragState:
+    """ Pin drag state kept in memory, builder is serialized on drag end """
+    _start_serial_str = ''
+    _start_model_mat = ''
+    _start_focals = ()
+    _moved = False
+    # Solved by interactive tier, so full solve is needed on release
+    _preview_solved = False
+
+    @classmethod
+    def start(cls, head, cam):
+        # Previous state for undo history is captured once
+        cls._start_serial_str = head.get_serial_str()
+        cls._start_model_mat = cam.model_mat
+        cls._start_focals = tuple(c.focal for c in head.cameras)
+        cls._moved = False
+        cls._preview_solved = False
+
+    @classmethod
+    def set_moved(cls):
+        cls._moved = True
+
+    @classmethod
+    def is_moved(cls):
+        return cls._moved
+
+    @classmethod
+    def set_preview_solved(cls, value=True):
+        cls._preview_solved = value
+
+    @classmethod
+    def is_preview_solved(cls):
+        return cls._preview_solved
+
+    @classmethod
+    def start_state(cls):
+        return cls._start_serial_str, cls._start_model_mat, \
+            cls._start_focals
+
+    @classmethod
+    def reset(cls):
+        cls._start_serial_str = ''
+        cls._start_model_mat = ''
+        cls._start_focals = ()
+        cls._moved = False
+        cls._preview_solved = False
+
+
 class FB_OT_MovePin(bpy.types.Operator):
     """ On Screen Face Builder MovePin Operator """
     bl_idname = Config.fb_movepin_idname
@@ -57,6 +109,12 @@ class FB_OT_MovePin(bpy.types.Operator):
     pinx: bpy.props.FloatProperty(default=0)
     piny: bpy.props.FloatProperty(default=0)
 
+    # Mouse move coalescing: only the latest move is solved on timer event
+    _move_timer = None
+    _pending_move = None
+    # Solve on worker thread while dragging
+    _async_solve = False
+
     # Headnum & camnum unstable because of Blender operator params may changing
     # Possible we need store initial values, but unsure
     # So created some getter functions
@@ -75,6 +133,7 @@ class FB_OT_MovePin(bpy.types.Operator):
 
         x, y = coords.get_image_space_coord(mouse_x, mouse_y, context)
 
+        FBLoader.inc_builder_revision()
         pin = FBLoader.get_builder().add_pin(
             kid, (coords.image_space_to_frame(x, y))
         )
@@ -82,11 +141,15 @@ class FB_OT_MovePin(bpy.types.Operator):
             logger.debug("ADD PIN")
             vp = FBLoader.viewport()
             vp.pins().add_pin((x, y))
+            vp.clear_pin_tables()
             vp.pins().set_current_pin_num_to_last()
             FBLoader.update_pins_count(headnum, camnum)
-
-            manipulate.push_neutral_head_in_undo_history(
-                settings.get_head(headnum), kid, 'New Pin.')
+            # History reads head serial, so new pin is saved first
+            FBLoader.save_only(headnum)
+            FBUndoHistory.push(headnum, 'New Pin.')
+            # Drag of the new pin starts from the state with it
+            head = settings.get_head(headnum)
+            FBDragState.start(head, head.get_camera(camnum))
         else:
             logger.debug("MISS MODEL")
             FBLoader.viewport().pins().reset_current_pin()
@@ -108,16 +171,13 @@ class FB_OT_MovePin(bpy.types.Operator):
         if cam is None:
             return {'CANCELLED'}
 
-        # Init old state values
-        head.tmp_serial_str = ''
-        cam.tmp_model_mat = ''
-
         vp = FBLoader.viewport()
         vp.update_view_relative_pixel_size(context)
 
         FBLoader.load_model(headnum)
         FBLoader.place_camera(headnum, camnum)
         FBLoader.load_pins(headnum, camnum)
+        FBDragState.start(head, cam)
 
         vp.create_batch_2d(context)
         vp.register_handlers(args, context)
@@ -126,51 +186,29 @@ class FB_OT_MovePin(bpy.types.Operator):
         x, y = coords.get_image_space_coord(mouse_x, mouse_y, context)
         vp.pins().set_current_pin((x, y))
 
-        nearest, dist2 = coords.nearest_point(x, y, vp.pins().arr())
+        nearest, dist2 = vp.pins().nearest_pin(x, y, vp.tolerance_dist())
 
-        if nearest >= 0 and dist2 < vp.tolerance_dist2():
+        if nearest >= 0:
             vp.pins().set_current_pin_num(nearest)
         else:
             return self._new_pin(context, mouse_x, mouse_y)
 
     def _push_previous_state(self):
-        logger = logging.getLogger(__name__)
+        """ Drag start state goes to history as is, builder isn't
+        reloaded. Current state is serialized by fb_save only """
         settings = get_main_settings()
         headnum = self.get_headnum()
         camnum = self.get_camnum()
         head = settings.get_head(headnum)
-        cam = head.get_camera(camnum)
-        kid = cam.get_keyframe()
 
-        fb = FBLoader.get_builder()
-        # Save state to vars
-        serial_str = head.serial_str
-        model_mat = cam.model_mat
-
-        # Prepare previous state to push in history
-        if head.tmp_serial_str != '':
-            cam.model_mat = cam.tmp_model_mat
-            head.set_serial_str(head.get_tmp_serial_str())
-
-            if not fb.deserialize(head.get_serial_str()):
-                logger.warning('DESERIALIZE ERROR: ', head.get_serial_str())
-
-            FBLoader.update_all_camera_positions(headnum)
-            # ---------
-            # PUSH Previous
-            manipulate.push_neutral_head_in_undo_history(head, kid, 'Move Pin.')
-            # ---------
-            # Restore last position
-            head.set_serial_str(serial_str)
-            cam.model_mat = model_mat
-
-            if not fb.deserialize(head.get_serial_str()):
-                logger.warning("DESERIALIZE ERROR: {}", head.get_serial_str())
-        else:
-            # There was only one click
-            # Save current state
-            head.set_serial_str(fb.serialize())
-            cam.set_model_mat(fb.model_mat(kid))
+        if FBDragState.is_moved():
+            start_serial_str, start_model_mat, start_focals = \
+                FBDragState.start_state()
+            model_mats = [c.model_mat for c in head.cameras]
+            model_mats[camnum] = start_model_mat
+            FBUndoHistory.push(headnum, 'Move Pin.',
+                               start_serial_str, model_mats, start_focals)
+        FBDragState.reset()
 
     def on_left_mouse_release(self, context, mouse_x, mouse_y):
         settings = get_main_settings()
@@ -184,9 +222,15 @@ class FB_OT_MovePin(bpy.types.Operator):
         pins = vp.pins()
         if pins.current_pin() is not None:
             # Move current 2D-pin
-            pins.arr()[pins.current_pin_num()] = (x, y)
+            pins.move_pin(pins.current_pin_num(), (x, y))
 
         pins.reset_current_pin()
+
+        if FBDragState.is_preview_solved():
+            # Final pin position gets full quality solve
+            if FBLoader.solve(headnum, camnum):
+                self._update_solved_state(headnum, camnum)
+        FBLoader.write_deferred_mesh(headnum)
         FBLoader.update_head_camera_focals(head)
 
         self._push_previous_state()
@@ -195,10 +239,7 @@ class FB_OT_MovePin(bpy.types.Operator):
         FBLoader.update_all_camera_positions(headnum)
         FBLoader.update_all_camera_focals(headnum)
         FBLoader.fb_save(headnum, camnum)
-        # ---------
-        # PUSH Last
-        manipulate.push_neutral_head_in_undo_history(head, kid, 'Pin Result.')
-        # ---------
+        FBUndoHistory.push(headnum, 'Pin Result.')
 
         # Load 3D pins
         vp.update_surface_points(fb, head.headobj, kid)
@@ -211,54 +252,80 @@ class FB_OT_MovePin(bpy.types.Operator):
         pins = FBLoader.viewport().pins()
         pins.set_current_pin((x, y))
         pin_idx = pins.current_pin_num()
-        pins.arr()[pin_idx] = (x, y)
-        fb.move_pin(kid, pin_idx, coords.image_space_to_frame(x, y))
-
-    def on_mouse_move(self, context, mouse_x, mouse_y):
+        pins.move_pin(pin_idx, (x, y))
+        FBLoader.inc_builder_revision()
+        pin_pos = coords.image_space_to_frame(x, y)
+        fb.move_pin(kid, pin_idx, pin_pos)
+        return pin_idx, pin_pos
 
+    def on_mouse_move(self, context, mouse_x, mouse_y, received_time=None):
         settings = get_main_settings()
         headnum = self.get_headnum()
         camnum = self.get_camnum()
-        head = settings.get_head(headnum)
-        headobj = head.headobj
-        cam = head.get_camera(camnum)
-        camobj = cam.camobj
         kid = settings.get_keyframe(headnum, camnum)
 
-        self._pin_drag(kid, context, mouse_x, mouse_y)
+        pin_idx, pin_pos = self._pin_drag(kid, context, mouse_x, mouse_y)
 
-        if not FBLoader.solve(headnum, camnum):
-            logger = logging.getLogger(__name__)
-            logger.error("MOVE PIN PROBLEM")
-            return {'FINISHED'}
+        preview = get_addon_preferences().preview_pin_solve
+        if preview:
+            FBDragState.set_preview_solved()
 
-        fb = FBLoader.get_builder()
-        # --------------
-        # Pin lag solve
-        # --------------
-        head = settings.get_head(headnum)
-        # Store in tmp previous state
-        head.tmp_serial_str = head.serial_str
-        cam.tmp_model_mat = cam.model_mat
-        # Save current state
-        head.set_serial_str(fb.serialize())
-        cam.set_model_mat(fb.model_mat(kid))
-        # --------------
-
-        FBLoader.place_cameraobj(kid, camobj, headobj)
-        coords.update_head_mesh(settings, fb, head)
+        if self._async_solve:
+            FBAsyncSolver.request(headnum, camnum, kid, pin_idx, pin_pos,
+                                  self._on_async_result,
+                                  received_time=received_time)
+        else:
+            if not FBLoader.solve(headnum, camnum, preview=preview,
+                                  lens_only=True):
+                logger = logging.getLogger(__name__)
+                logger.error("MOVE PIN PROBLEM")
+                return {'FINISHED'}
+            self._update_solved_state(headnum, camnum)
 
-        FBLoader.viewport().wireframer().init_geom_data(headobj)
-        FBLoader.viewport().wireframer().create_batches()
         FBLoader.viewport().create_batch_2d(context)
         # Try to redraw
         if not bpy.app.background:
             context.area.tag_redraw()
 
+        return self.on_default_modal()
+
+    @staticmethod
+    def _update_solved_state(headnum, camnum):
+        settings = get_main_settings()
+        head = settings.get_head(headnum)
+        headobj = head.headobj
+        cam = head.get_camera(camnum)
+        camobj = cam.camobj
+        kid = cam.get_keyframe()
+
+        fb = FBLoader.get_builder()
+        # Builder state is serialized on drag end only
+        FBDragState.set_moved()
+
+        FBLoader.place_cameraobj(kid, camobj, headobj)
+
+        # Hidden head mesh is updated on drag end, drawers get geometry now
+        geom = coords.head_mesh_geom(settings, fb, head)
+        wireframer = FBLoader.viewport().wireframer()
+        if geom is not None and \
+                len(geom) == wireframer.topology_counts[0]:
+            wireframer.set_builder_vertices(geom)
+            wireframer.set_object_matrix(headobj.matrix_world)
+        else:
+            coords.update_head_mesh(settings, fb, head)
+            wireframer.init_geom_data(headobj)
+        wireframer.update_batches_positions()
+
         # Load 3D pins
         FBLoader.viewport().update_surface_points(fb, headobj, kid)
 
-        return self.on_default_modal()
+    @staticmethod
+    def _on_async_result(headnum, camnum, received_time=None):
+        FB_OT_MovePin._update_solved_state(headnum, camnum)
+        force_ui_redraw('VIEW_3D')
+        # Event is handled only when its solve result is shown
+        if received_time is not None:
+            FBPinDragStats.add_solved(time.perf_counter() - received_time)
 
     @staticmethod
     def on_default_modal():
@@ -284,6 +351,34 @@ class FB_OT_MovePin(bpy.types.Operator):
             self.on_left_mouse_release(context, self.pinx, self.piny)
         return {"FINISHED"}
 
+    def _start_move_coalescing(self, context):
+        self._pending_move = None
+        self._move_timer = None
+        FBPinDragStats.start()
+        if bpy.app.background or not get_main_settings().coalesce_pin_moves:
+            return
+        self._move_timer = context.window_manager.event_timer_add(
+            Config.pin_move_solve_interval, window=context.window)
+
+    def _stop_move_coalescing(self, context):
+        if self._move_timer is not None:
+            context.window_manager.event_timer_remove(self._move_timer)
+            self._move_timer = None
+        self._pending_move = None
+
+    def _solve_move(self, context, mouse_x, mouse_y, received_time):
+        ret = self.on_mouse_move(context, mouse_x, mouse_y, received_time)
+        if not self._async_solve:
+            FBPinDragStats.add_solved(time.perf_counter() - received_time)
+        return ret
+
+    def _flush_pending_move(self, context):
+        if self._pending_move is None:
+            return self.on_default_modal()
+        mouse_x, mouse_y, received_time = self._pending_move
+        self._pending_move = None
+        return self._solve_move(context, mouse_x, mouse_y, received_time)
+
     @profile_this
     def invoke(self, context, event):
         logger = logging.getLogger(__name__)
@@ -292,23 +387,89 @@ class FB_OT_MovePin(bpy.types.Operator):
         if ret in {'CANCELLED', 'FINISHED'}:
             return ret
         FBLoader.viewport().create_batch_2d(context)
+        self._start_move_coalescing(context)
+        self._async_solve = get_main_settings().async_pin_solve \
+            and not bpy.app.background
+        FBAsyncSolver.reset_stats()
+        if self._async_solve:
+            self._async_solve = FBAsyncSolver.start(
+                self.get_headnum(), self.get_camnum(),
+                preview=get_addon_preferences().preview_pin_solve)
         context.window_manager.modal_handler_add(self)
         logger.debug("START PIN MOVING")
         return {"RUNNING_MODAL"}
 
     @profile_this
     def modal(self, context, event):
+        ret = self._modal_event(context, event)
+        if ret != {'RUNNING_MODAL'}:
+            self._stop_move_coalescing(context)
+            self._stop_async_solve()
+            self._save_interrupted_drag()
+            FBPinDragStats.finish()
+        return ret
+
+    def _save_interrupted_drag(self):
+        """ Drag finished without release, so its result isn't saved yet """
+        if not FBDragState.is_moved():
+            return
+        settings = get_main_settings()
+        headnum = self.get_headnum()
+        camnum = self.get_camnum()
+        if settings.get_head(headnum) is not None:
+            if FBDragState.is_preview_solved() and settings.pinmode \
+                    and FBLoader.solve(headnum, camnum):
+                self._update_solved_state(headnum, camnum)
+            FBLoader.write_deferred_mesh(headnum)
+            # Only lens was changed while dragging
+            FBLoader.update_all_camera_focals(headnum)
+            FBLoader.fb_save(headnum, camnum)
+        FBDragState.reset()
+
+    def _release_pin_drag(self, context, mouse_x, mouse_y):
+        """ Latest position without solving: release makes full solve """
+        kid = get_main_settings().get_keyframe(self.get_headnum(),
+                                               self.get_camnum())
+        self._pin_drag(kid, context, mouse_x, mouse_y)
+        FBDragState.set_moved()
+        FBDragState.set_preview_solved()
+
+    def _stop_async_solve(self):
+        logger = logging.getLogger(__name__)
+        if not self._async_solve:
+            return
+        FBAsyncSolver.cancel()
+        self._async_solve = False
+        logger.debug("ASYNC SOLVE STATS: {}".format(FBAsyncSolver.stats()))
+
+    def _modal_event(self, context, event):
         logger = logging.getLogger(__name__)
         mouse_x = event.mouse_region_x
         mouse_y = event.mouse_region_y
 
         if event.value == "RELEASE" and event.type == "LEFTMOUSE":
             logger.debug("LEFT MOUSE RELEASE")
+            # Latest position should be solved before result saving
+            if self._async_solve or get_addon_preferences().preview_pin_solve:
+                self._stop_async_solve()
+                self._pending_move = None
+                self._release_pin_drag(context, mouse_x, mouse_y)
+            else:
+                self._flush_pending_move(context)
             return self.on_left_mouse_release(context, mouse_x, mouse_y)
 
         if event.type == "MOUSEMOVE" \
                 and FBLoader.viewport().pins().current_pin() is not None:
             logger.debug("MOUSEMOVE {} {}".format(mouse_x, mouse_y))
-            return self.on_mouse_move(context, mouse_x, mouse_y)
+            FBPinDragStats.add_received()
+            if self._move_timer is None:
+                return self._solve_move(context, mouse_x, mouse_y,
+                                        time.perf_counter())
+            # Previous unsolved position is superseded by this one
+            self._pending_move = (mouse_x, mouse_y, time.perf_counter())
+            return {"RUNNING_MODAL"}
+
+        if event.type == "TIMER" and self._move_timer is not None:
+            return self._flush_pending_move(context)
 
         return self.on_default_modal()
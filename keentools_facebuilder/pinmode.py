@@ -25,6 +25,7 @@ from .utils import manipulate, coords, cameras
 from .config import Config, get_main_settings, get_operators, ErrorType
 from .fbloader import FBLoader
 from .utils.other import FBStopShaderTimer, force_ui_redraw, hide_ui_elements
+from .utils.undo import FBUndoHistory
 
 
 class FB_OT_PinMode(bpy.types.Operator):
@@ -68,29 +69,31 @@ class FB_OT_PinMode(bpy.types.Operator):
             warn = getattr(get_operators(), Config.fb_warning_callname)
             warn('INVOKE_DEFAULT', msg=ErrorType.SceneDamaged)
 
-    def _coloring_special_parts(self, headobj, opacity):
+    def _coloring_special_parts(self, head, opacity):
         settings = get_main_settings()
         if settings.show_specials:
-            special_indices = FBLoader.viewport().get_special_indices(
-                FBLoader.get_builder_type())
+            edge_mask = FBLoader.viewport().get_special_edge_mask(
+                FBLoader.get_builder_type(), head.get_masks(),
+                head.tex_uv_shape)
             special_color = (*settings.wireframe_special_color,
                              opacity * settings.wireframe_opacity)
             FBLoader.viewport().wireframer().init_special_areas(
-                headobj.data, special_indices, special_color)
+                edge_mask, special_color)
 
-    def _init_wireframer_colors(self, opacity):
+    def _init_wireframer_colors(self, opacity, update_geometry=True):
         settings = get_main_settings()
         head = settings.get_head(settings.current_headnum)
         headobj = head.headobj
 
-        FBLoader.viewport().wireframer().init_geom_data(headobj)
-        FBLoader.viewport().wireframer().init_edge_indices(headobj)
+        if update_geometry:
+            FBLoader.viewport().wireframer().init_geom_data(headobj)
 
         FBLoader.viewport().wireframer().init_color_data(
             (*settings.wireframe_color, opacity * settings.wireframe_opacity))
-        self._coloring_special_parts(headobj, opacity)
+        self._coloring_special_parts(head, opacity)
 
-        FBLoader.viewport().wireframer().create_batches()
+        FBLoader.viewport().wireframer().update_batches(
+            positions=update_geometry)
 
     def _delete_found_pin(self, nearest, context):
         settings = get_main_settings()
@@ -100,8 +103,10 @@ class FB_OT_PinMode(bpy.types.Operator):
         kid = settings.get_keyframe(headnum, camnum)
 
         fb = FBLoader.get_builder()
+        FBLoader.inc_builder_revision()
         fb.remove_pin(kid, nearest)
-        del FBLoader.viewport().pins().arr()[nearest]
+        FBLoader.viewport().pins().remove_pin(nearest)
+        FBLoader.viewport().clear_pin_tables()
         logging.debug("PIN REMOVED {}".format(nearest))
 
         if not FBLoader.solve(headnum, camnum):
@@ -114,8 +119,10 @@ class FB_OT_PinMode(bpy.types.Operator):
         FBLoader.update_all_camera_positions(headnum)
         # Save result
         FBLoader.fb_save(headnum, camnum)
-        manipulate.push_neutral_head_in_undo_history(head, kid, 'Pin remove.')
+        FBUndoHistory.push(headnum, 'Pin remove.')
 
+        # Solved geometry goes to mesh before drawers read it
+        coords.update_head_mesh(settings, fb, head)
         FBLoader.viewport().update_surface_points(fb, head.headobj, kid)
         FBLoader.shader_update(head.headobj)
 
@@ -129,7 +136,11 @@ class FB_OT_PinMode(bpy.types.Operator):
         head = settings.get_head(headnum)
 
         head.need_update = False
+        # Camera model_mat properties are rewritten by history
+        FBLoader.clear_placed_cameras()
         FBLoader.load_model(headnum)
+        FBLoader.update_all_camera_positions(headnum)
+        FBLoader.update_head_camera_focals(head)
         FBLoader.place_camera(headnum, camnum)
         FBLoader.load_pins(headnum, camnum)
 
@@ -142,14 +153,25 @@ class FB_OT_PinMode(bpy.types.Operator):
         FBLoader.shader_update(head.headobj)
 
 
+    def _on_undo_redo(self, redo=False):
+        logger = logging.getLogger(__name__)
+        if redo:
+            restored = FBUndoHistory.redo()
+        else:
+            restored = FBUndoHistory.undo()
+        if restored:
+            logger.debug("PINMODE {}".format('REDO' if redo else 'UNDO'))
+            self._undo_detected()
+        return restored
+
     def _on_right_mouse_press(self, context, mouse_x, mouse_y):
         vp = FBLoader.viewport()
         vp.update_view_relative_pixel_size(context)
 
         x, y = coords.get_image_space_coord(mouse_x, mouse_y, context)
 
-        nearest, dist2 = coords.nearest_point(x, y, vp.pins().arr())
-        if nearest >= 0 and dist2 < FBLoader.viewport().tolerance_dist2():
+        nearest, dist2 = vp.pins().nearest_pin(x, y, vp.tolerance_dist())
+        if nearest >= 0:
             return self._delete_found_pin(nearest, context)
 
         FBLoader.viewport().create_batch_2d(context)
@@ -235,6 +257,7 @@ class FB_OT_PinMode(bpy.types.Operator):
         fb = FBLoader.get_builder()
         if not self._check_keyframes(fb, head):
             logger.debug("PINMODE NO KEYFRAME")
+            FBLoader.inc_builder_revision()
             for cam in head.cameras:
                 kfnum = cam.get_keyframe()
                 logger.debug("UPDATE KEYFRAME: {}".format(kfnum))
@@ -283,6 +306,8 @@ class FB_OT_PinMode(bpy.types.Operator):
         vp.update_surface_points(FBLoader.get_builder(), headobj, kid)
         manipulate.push_neutral_head_in_undo_history(head, kid,
                                                      'Pin Mode Start.')
+        # Pinmode operations use own undo history from this state
+        FBUndoHistory.start(settings.current_headnum)
         if not first_start:
             logger.debug('PINMODE SWITCH ONLY')
             return {'FINISHED'}
@@ -298,7 +323,8 @@ class FB_OT_PinMode(bpy.types.Operator):
             0.0 if settings.overall_opacity > 0.5 else 1.0
         logger.debug("OVERALL_OPACITY BY TAB {}".format(
             settings.overall_opacity))
-        self._init_wireframer_colors(settings.overall_opacity)
+        self._init_wireframer_colors(settings.overall_opacity,
+                                     update_geometry=False)
         force_ui_redraw("VIEW_3D")
 
     def _modal_should_finish(self, context, event):
@@ -365,6 +391,13 @@ class FB_OT_PinMode(bpy.types.Operator):
             logger.debug("FORCE TAG REDRAW")
             context.area.tag_redraw()
 
+        if event.value == 'PRESS' and event.type == 'Z' and \
+                (event.ctrl or event.oskey):
+            if self._on_undo_redo(redo=event.shift):
+                return {'RUNNING_MODAL'}
+            # Blender undo is used when pinmode history is exhausted
+            return {'PASS_THROUGH'}
+
         if event.value == 'PRESS' and event.type == 'TAB':
             self._wireframe_view_toggle()
             return {'RUNNING_MODAL'}
@@ -398,9 +431,9 @@ class FB_OT_PinMode(bpy.types.Operator):
             FBLoader.out_pinmode(headnum)
             return {'FINISHED'}
 
-        vp.create_batch_2d(context)
-        vp.update_residuals(
-            FBLoader.get_builder(), context, head.headobj, kid)
+        vp.update_modal_batches(FBLoader.get_builder(), context,
+                                head.headobj, kid,
+                                FBLoader.builder_revision())
 
         if vp.pins().current_pin() is not None:
             return {"RUNNING_MODAL"}
@@ -103,6 +103,21 @@ class FBAddonPreferences(bpy.types.AddonPreferences):
         default=False
     )
 
+    preview_pin_solve: bpy.props.BoolProperty(
+        name='Fast preview solve while dragging pins',
+        description='Solve with fixed focal lengths and without facial '
+                    'expressions while a pin is dragged. '
+                    'Full solve is done on pin release',
+        default=False
+    )
+
+    template_disk_cache: bpy.props.BoolProperty(
+        name='Store head templates on disk',
+        description='Keep new head template meshes in user cache '
+                    'directory to speed up head creation',
+        default=False
+    )
+
     def _license_was_accepted(self):
         return pkt.is_installed() or self.license_accepted
 
@@ -174,6 +189,12 @@ class FBAddonPreferences(bpy.types.AddonPreferences):
             floating_install_op.license_server = self.license_server
             floating_install_op.license_server_port = self.license_server_port
 
+    def _draw_solver_settings(self, layout):
+        layout.label(text='Solver:')
+        box = layout.box()
+        box.prop(self, 'preview_pin_solve')
+        box.prop(self, 'template_disk_cache')
+
     def _draw_warning_labels(self, layout, content, alert=True, icon='INFO'):
         col = layout.column()
         col.alert = alert
@@ -353,6 +374,7 @@ class FBAddonPreferences(bpy.types.AddonPreferences):
             try:
                 self._draw_version(box)
                 self._draw_license_info(layout)
+                self._draw_solver_settings(layout)
                 return
             except Exception:
                 cached_status[1] = 'NO_VERSION'
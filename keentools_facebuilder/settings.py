@@ -58,7 +58,7 @@ def update_wireframe(self, context):
     headnum = settings.current_headnum
     head = settings.get_head(headnum)
     FBLoader.viewport().update_wireframe(
-        FBLoader.get_builder_type(), head.headobj)
+        FBLoader.get_builder_type(), head)
 
 
 def update_pin_sensitivity(self, context):
@@ -77,6 +77,7 @@ def update_model_scale(self, context):
     head = settings.get_head(headnum)
     fb = FBLoader.get_builder()
     fb.set_scale(head.model_scale)
+    FBLoader.inc_builder_revision()
 
     coords.update_head_mesh(settings, fb, head)
     FBLoader.update_all_camera_positions(headnum)
@@ -113,6 +114,7 @@ def update_camera_focal(self, context):
     if fb.is_key_at(kid):
         fb.update_projection_mat(kid, self.get_projection_matrix())
         fb.update_image_size(kid, self.get_oriented_image_size())
+        FBLoader.inc_builder_revision()
         FBLoader.save_only(settings.current_headnum)
 
     if FBLoader.in_pin_drag() or self.auto_focal_estimation or \
@@ -163,10 +165,9 @@ def update_mesh_parts(self, context):
     old_mesh = head.headobj.data
     FBLoader.load_model(headnum)
     # Create new mesh
-    mesh = FBLoader.get_builder_mesh(FBLoader.get_builder(), 'FBHead_tmp_mesh',
-                                     head.get_masks(),
-                                     uv_set=head.tex_uv_shape,
-                                     keyframe=keyframe)
+    mesh = FBLoader.get_masked_mesh('FBHead_tmp_mesh', head.get_masks(),
+                                    uv_set=head.tex_uv_shape,
+                                    keyframe=keyframe)
     try:
         # Copy old material
         if old_mesh.materials:
@@ -176,10 +177,10 @@ def update_mesh_parts(self, context):
     head.headobj.data = mesh
     if settings.pinmode:
         # Update wireframe structures
+        FBLoader.viewport().wireframer().invalidate_topology()
         FBLoader.viewport().wireframer().init_geom_data(head.headobj)
-        FBLoader.viewport().wireframer().init_edge_indices(head.headobj)
         FBLoader.viewport().update_wireframe(
-            FBLoader.get_builder_type(), head.headobj)
+            FBLoader.get_builder_type(), head)
 
     mesh_name = old_mesh.name
     # Delete old mesh
@@ -773,6 +774,14 @@ class FBSceneSettings(PropertyGroup):
         name="Pin handle radius",
         default=Config.default_point_sensitivity, min=1.0, max=100.0,
         update=update_pin_sensitivity)
+    coalesce_pin_moves: BoolProperty(
+        description="Solve only the latest cursor position while dragging "
+                    "a pin and skip outdated mouse moves",
+        name="Skip outdated pin moves", default=True)
+    async_pin_solve: BoolProperty(
+        description="Experimental. Solve on a background thread while "
+                    "dragging a pin to keep the viewport responsive",
+        name="Background pin solve", default=False)
 
     # Other settings
     shape_rigidity: FloatProperty(
@@ -0,0 +1,78 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+
+
+class FBFloatBuffer:
+    """ Preallocated growable float32 array for shader attributes.
+    Memory is reused between updates and grows only when needed """
+    def __init__(self, item_size, capacity=64):
+        self._item_size = item_size
+        self._data = self._allocate(capacity)
+        self._count = 0
+
+    def _allocate(self, capacity):
+        if self._item_size == 1:
+            return np.empty(capacity, dtype=np.float32)
+        return np.empty((capacity, self._item_size), dtype=np.float32)
+
+    def _reserve(self, count):
+        if count <= len(self._data):
+            return
+        data = self._allocate(max(count, 2 * len(self._data)))
+        data[:self._count] = self._data[:self._count]
+        self._data = data
+
+    def __len__(self):
+        return self._count
+
+    def data(self):
+        """ Contiguous view of filled items, ready for batch_for_shader """
+        return self._data[:self._count]
+
+    def clear(self):
+        self._count = 0
+
+    def append(self, items):
+        arr = np.asarray(items, dtype=np.float32)
+        if self._item_size != 1:
+            arr = arr.reshape((-1, self._item_size))
+        count = self._count + len(arr)
+        self._reserve(count)
+        self._data[self._count:count] = arr
+        self._count = count
+
+    def append_repeated(self, item, repeat):
+        count = self._count + repeat
+        self._reserve(count)
+        self._data[self._count:count] = item
+        self._count = count
+
+    def resize(self, count):
+        """ Items count is changed, new items are not initialized """
+        self._reserve(count)
+        self._count = count
+
+    def set(self, items):
+        self.clear()
+        self.append(items)
+
+    def set_repeated(self, item, repeat):
+        self.clear()
+        self.append_repeated(item, repeat)
@@ -18,7 +18,9 @@
 import numpy as np
 import math
 import bpy
+from mathutils import Matrix
 from . fake_context import get_fake_context
+from . expression_cache import FBExpressionCache
 
 
 def nearest_point(x, y, points, dist=4000000):  # dist squared
@@ -32,10 +34,20 @@ def nearest_point(x, y, points, dist=4000000):  # dist squared
     return nearest, dist2
 
 
+def builder_to_object_space(geom, out=None):
+    """ Builder geometry axes to Blender ones: (x, y, z) -> (x, -z, y).
+    Result can be written into preallocated out array """
+    if out is None:
+        out = np.empty((len(geom), 3), dtype=np.float32)
+    out[:, 0] = geom[:, 0]
+    np.negative(geom[:, 2], out=out[:, 1])
+    out[:, 2] = geom[:, 1]
+    return out
+
+
 def update_head_mesh_geom(obj, geom):
     mesh = obj.data
-    rot = np.array([[1., 0., 0.], [0., 0., 1.], [0., -1., 0]])
-    npbuffer = geom @ rot
+    npbuffer = builder_to_object_space(geom)
     mesh.vertices.foreach_set('co', npbuffer.ravel())
     mesh.update()
 
@@ -46,17 +58,24 @@ def update_head_mesh_neutral(fb, headobj):
 
 
 def update_head_mesh_emotions(fb, headobj, keyframe):
-    geom = fb.applied_args_model_vertices_at(keyframe)
+    geom = FBExpressionCache.vertices_at(fb, keyframe)
     update_head_mesh_geom(headobj, geom)
 
 
-def update_head_mesh(settings, fb, head):
+def head_mesh_geom(settings, fb, head):
+    """ Builder geometry for head mesh or None """
     if head.should_use_emotions():
         if settings.current_camnum >= 0:
-            update_head_mesh_emotions(
-                fb, head.headobj, head.get_keyframe(settings.current_camnum))
-    else:
-        update_head_mesh_neutral(fb, head.headobj)
+            return FBExpressionCache.vertices_at(
+                fb, head.get_keyframe(settings.current_camnum))
+        return None
+    return fb.applied_args_vertices()
+
+
+def update_head_mesh(settings, fb, head):
+    geom = head_mesh_geom(settings, fb, head)
+    if geom is not None:
+        update_head_mesh_geom(head.headobj, geom)
 
 
 def projection_matrix(w, h, fl, sw, near, far, scale=1.0):
@@ -106,6 +125,15 @@ def image_space_to_region(x, y, x1, y1, x2, y2):
     return x1 + (x + 0.5) * sc, (y1 + y2) * 0.5 + y * sc
 
 
+def image_space_to_region_matrix(x1, y1, x2, y2):
+    """ Matrix form of image_space_to_region for shaders """
+    sc = x2 - x1
+    return Matrix(((sc, 0.0, 0.0, x1 + 0.5 * sc),
+                   (0.0, sc, 0.0, (y1 + y2) * 0.5),
+                   (0.0, 0.0, 1.0, 0.0),
+                   (0.0, 0.0, 0.0, 1.0)))
+
+
 def get_image_space_coord(px, py, context):
     x1, y1, x2, y2 = get_camera_border(context)
     x, y = region_to_image_space(px, py, x1, y1, x2, y2)
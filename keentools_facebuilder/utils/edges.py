@@ -16,19 +16,33 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # ##### END GPL LICENSE BLOCK #####
 
+import logging
+import time
+
 import numpy as np
 import bpy
 import gpu
 import bgl
 from gpu_extras.batch import batch_for_shader
-from . shaders import simple_fill_vertex_shader, \
-    black_fill_fragment_shader, residual_vertex_shader, \
-    residual_fragment_shader
+from mathutils import Matrix
+from . buffers import FBFloatBuffer
+from . shaders import FBShaderRegistry
+from . import coords
+
+
+def _create_vertex_buffer(attr_name, comp_len, data):
+    fmt = gpu.types.GPUVertFormat()
+    fmt.attr_add(id=attr_name, comp_type='F32', len=comp_len,
+                 fetch_mode='FLOAT')
+    vbo = gpu.types.GPUVertBuf(format=fmt, len=len(data))
+    vbo.attr_fill(id=attr_name, data=data)
+    return vbo
 
 
 class FBEdgeShaderBase:
     """ Wireframe drawing class """
     handler_list = []
+    vertex_size = 3
 
     @classmethod
     def add_handler_list(cls, handler):
@@ -50,13 +64,9 @@ class FBEdgeShaderBase:
         self.fill_batch = None
         self.line_batch = None
         # Triangle vertices & indices
-        self.vertices = []
+        self._vertices = FBFloatBuffer(self.vertex_size)
+        self._vertices_colors = FBFloatBuffer(4)
         self.indices = []
-        # Edge vertices
-        self.edges_vertices = []
-        self.edges_indices = []
-        self.edges_colors = []
-        self.vertices_colors = []
         # Check if blender started in background mode
         if not bpy.app.background:
             self.init_shaders()
@@ -64,16 +74,21 @@ class FBEdgeShaderBase:
     def is_working(self):
         return not (self.draw_handler is None)
 
-    def init_color_data(self, color=(0.5, 0.0, 0.7, 0.2)):
-        self.edges_colors = np.full(
-            (len(self.edges_vertices), 4), color).tolist()
+    @property
+    def vertices(self):
+        return self._vertices.data()
 
-    def init_special_areas(self, mesh, pairs, color=(0.5, 0.0, 0.7, 0.2)):
-        for i, edge in enumerate(mesh.edges):
-            vv = edge.vertices
-            if ((vv[0], vv[1]) in pairs) or ((vv[1], vv[0]) in pairs):
-                self.edges_colors[i * 2] = color
-                self.edges_colors[i * 2 + 1] = color
+    @vertices.setter
+    def vertices(self, verts):
+        self._vertices.set(verts)
+
+    @property
+    def vertices_colors(self):
+        return self._vertices_colors.data()
+
+    @vertices_colors.setter
+    def vertices_colors(self, colors):
+        self._vertices_colors.set(colors)
 
     def register_handler(self, args):
         if self.draw_handler is not None:
@@ -90,26 +105,24 @@ class FBEdgeShaderBase:
         self.draw_handler = None
 
     def add_color_vertices(self, color, verts):
-        for i, v in enumerate(verts):
-            self.vertices.append(verts[i])
-            self.vertices_colors.append(color)
+        self._vertices.append(verts)
+        self._vertices_colors.append_repeated(color, len(verts))
 
     def add_vertices_colors(self, verts, colors):
-        for i, v in enumerate(verts):
-            self.vertices.append(verts[i])
-            self.vertices_colors.append(colors[i])
+        self._vertices.append(verts)
+        self._vertices_colors.append(colors)
 
     def set_color_vertices(self, color, verts):
-        self.clear_vertices()
-        self.add_color_vertices(color, verts)
+        self._vertices.set(verts)
+        self._vertices_colors.set_repeated(color, len(verts))
 
     def set_vertices_colors(self, verts, colors):
-        self.clear_vertices()
-        self.add_vertices_colors(verts, colors)
+        self._vertices.set(verts)
+        self._vertices_colors.set(colors)
 
     def clear_vertices(self):
-        self.vertices = []
-        self.vertices_colors = []
+        self._vertices.clear()
+        self._vertices_colors.clear()
 
     def init_shaders(self):
         pass
@@ -119,13 +132,22 @@ class FBEdgeShaderBase:
 
 
 class FBEdgeShader2D(FBEdgeShaderBase):
+    vertex_size = 2
+
     def __init__(self):
-        self.edge_lengths = []
+        self._edge_lengths = FBFloatBuffer(1)
         super().__init__()
 
+    @property
+    def edge_lengths(self):
+        return self._edge_lengths.data()
+
+    @edge_lengths.setter
+    def edge_lengths(self, lengths):
+        self._edge_lengths.set(lengths)
+
     def init_shaders(self):
-        self.line_shader = gpu.types.GPUShader(
-            residual_vertex_shader(), residual_fragment_shader())
+        self.line_shader = FBShaderRegistry.get('RESIDUAL')
 
     def draw_callback(self, op, context):
         # Force Stop
@@ -141,8 +163,14 @@ class FBEdgeShader2D(FBEdgeShaderBase):
         bgl.glHint(bgl.GL_LINE_SMOOTH_HINT, bgl.GL_NICEST)
         bgl.glBlendFunc(bgl.GL_SRC_ALPHA, bgl.GL_ONE_MINUS_SRC_ALPHA)
 
-        self.line_shader.bind()
-        self.line_batch.draw(self.line_shader)
+        # Vertices are in image space, so zoom & pan don't need new batch
+        x1, y1, x2, y2 = coords.get_camera_border(bpy.context)
+        with gpu.matrix.push_pop():
+            gpu.matrix.multiply_matrix(
+                coords.image_space_to_region_matrix(x1, y1, x2, y2))
+            self.line_shader.bind()
+            self.line_shader.uniform_float('lineLengthScale', x2 - x1)
+            self.line_batch.draw(self.line_shader)
 
     def create_batch(self):
         # Our shader batch
@@ -162,6 +190,50 @@ class FBEdgeShader2D(FBEdgeShaderBase):
 
 class FBEdgeShader3D(FBEdgeShaderBase):
     """ Wireframe drawing class """
+    def __init__(self):
+        # Mesh edges as vertex index pairs
+        self.edges = np.empty((0, 2), dtype=np.int32)
+        # Edges are split into two index buffers: main and special ones.
+        # Both are drawn with uniform colors against the same vertex buffer
+        self.special_edge_mask = None
+        self.line_color = (0.5, 0.0, 0.7, 0.2)
+        self.special_line_color = (0.5, 0.0, 0.7, 0.2)
+        self.special_line_batch = None
+        # Topology dependent GPU buffers are reused on position updates
+        self.fill_indices_buffer = None
+        self.line_indices_buffer = None
+        self.special_line_indices_buffer = None
+        self.topology_counts = (0, 0)
+        # Topology and special edges mask the index buffers are built for
+        self._batched_topology_key = None
+        self._batched_special_mask = None
+        self.batch_build_time = 0.0
+        # Vertices are in object space, transform is applied at draw time
+        self.object_matrix = Matrix.Identity(4)
+        # Vertices came from builder and Blender mesh is not updated yet
+        self.mesh_outdated = False
+        # Mesh identity and counts for cached triangles & edges
+        self.topology_key = None
+        super().__init__()
+
+    def set_object_matrix(self, matrix):
+        self.object_matrix = matrix.copy()
+
+    def set_builder_vertices(self, geom):
+        """ Builder geometry goes to drawing without Blender mesh update.
+        Topology from the last init_geom_data call is used """
+        self._vertices.resize(len(geom))
+        coords.builder_to_object_space(geom, out=self._vertices.data())
+        self.mesh_outdated = True
+
+    def init_color_data(self, color=(0.5, 0.0, 0.7, 0.2)):
+        self.line_color = color
+        self.special_edge_mask = None
+
+    def init_special_areas(self, edge_mask, color=(0.5, 0.0, 0.7, 0.2)):
+        self.special_line_color = color
+        self.special_edge_mask = edge_mask
+
     def draw_callback(self, op, context):
         # Force Stop
         if self.is_handler_list_empty():
@@ -177,75 +249,166 @@ class FBEdgeShader3D(FBEdgeShaderBase):
         bgl.glEnable(bgl.GL_POLYGON_OFFSET_FILL)
         bgl.glPolygonOffset(1.0, 1.0)
 
-        bgl.glColorMask(bgl.GL_FALSE, bgl.GL_FALSE, bgl.GL_FALSE, bgl.GL_FALSE)
-        bgl.glPolygonMode(bgl.GL_FRONT_AND_BACK, bgl.GL_FILL)
+        with gpu.matrix.push_pop():
+            gpu.matrix.multiply_matrix(self.object_matrix)
+
+            bgl.glColorMask(bgl.GL_FALSE, bgl.GL_FALSE,
+                            bgl.GL_FALSE, bgl.GL_FALSE)
+            bgl.glPolygonMode(bgl.GL_FRONT_AND_BACK, bgl.GL_FILL)
 
-        self.fill_batch.draw(self.fill_shader)
+            self.fill_batch.draw(self.fill_shader)
 
-        bgl.glColorMask(bgl.GL_TRUE, bgl.GL_TRUE, bgl.GL_TRUE, bgl.GL_TRUE)
-        bgl.glDisable(bgl.GL_POLYGON_OFFSET_FILL)
+            bgl.glColorMask(bgl.GL_TRUE, bgl.GL_TRUE,
+                            bgl.GL_TRUE, bgl.GL_TRUE)
+            bgl.glDisable(bgl.GL_POLYGON_OFFSET_FILL)
 
-        bgl.glDepthMask(bgl.GL_FALSE)
-        bgl.glPolygonMode(bgl.GL_FRONT_AND_BACK, bgl.GL_LINE)
+            bgl.glDepthMask(bgl.GL_FALSE)
+            bgl.glPolygonMode(bgl.GL_FRONT_AND_BACK, bgl.GL_LINE)
 
-        self.line_batch.draw(self.line_shader)
+            self.line_shader.bind()
+            if self.line_batch is not None:
+                self.line_shader.uniform_float("color", self.line_color)
+                self.line_batch.draw(self.line_shader)
+            if self.special_line_batch is not None:
+                self.line_shader.uniform_float("color",
+                                               self.special_line_color)
+                self.special_line_batch.draw(self.line_shader)
 
         bgl.glPolygonMode(bgl.GL_FRONT_AND_BACK, bgl.GL_FILL)
         bgl.glDepthMask(bgl.GL_TRUE)
         bgl.glDisable(bgl.GL_DEPTH_TEST)
 
+    @staticmethod
+    def _create_lines_index_buffer(edges):
+        if len(edges) == 0:
+            return None
+        return gpu.types.GPUIndexBuf(type='LINES', seq=edges)
+
     def create_batches(self):
+        """ Full rebuild: topology buffers and vertex positions """
+        if bpy.app.background:
+            return
+        start_time = time.perf_counter()
+        self.fill_indices_buffer = gpu.types.GPUIndexBuf(
+            type='TRIS', seq=self.indices)
+
+        if self.special_edge_mask is not None \
+                and len(self.special_edge_mask) == len(self.edges):
+            main_edges = self.edges[~self.special_edge_mask]
+            special_edges = self.edges[self.special_edge_mask]
+        else:
+            main_edges = self.edges
+            special_edges = []
+        self.line_indices_buffer = self._create_lines_index_buffer(
+            main_edges)
+        self.special_line_indices_buffer = self._create_lines_index_buffer(
+            special_edges)
+
+        self.topology_counts = (len(self.vertices), len(self.edges))
+        self._batched_topology_key = self.topology_key
+        self._batched_special_mask = None if self.special_edge_mask is None \
+            else np.array(self.special_edge_mask, dtype=bool)
+        self._create_position_batches()
+        self._log_batch_build_time('FULL', start_time)
+
+    def _index_buffers_actual(self):
+        if self.fill_indices_buffer is None or \
+                self._batched_topology_key != self.topology_key:
+            return False
+        if self.special_edge_mask is None \
+                or self._batched_special_mask is None:
+            return self.special_edge_mask is None \
+                and self._batched_special_mask is None
+        return np.array_equal(self._batched_special_mask,
+                              self.special_edge_mask)
+
+    def update_batches(self, positions=True):
+        """ Colors are uniforms, so index buffers are rebuilt only
+        when topology or special edges mask has been changed """
         if bpy.app.background:
             return
-        self.fill_batch = batch_for_shader(
-                    self.fill_shader, 'TRIS',
-                    {"pos": self.vertices},
-                    indices=self.indices,
-                )
+        if not self._index_buffers_actual():
+            self.create_batches()
+        elif positions:
+            self.update_batches_positions()
+
+    def update_batches_positions(self):
+        """ Only vertex positions are uploaded, topology buffers are reused.
+        Falls back to full rebuild when topology has been changed,
+        same counts don't mean same index buffers """
+        if bpy.app.background:
+            return
+        if not self._index_buffers_actual() or \
+                self.topology_counts != (len(self.vertices), len(self.edges)):
+            self.create_batches()
+            return
+        start_time = time.perf_counter()
+        self._create_position_batches()
+        self._log_batch_build_time('POSITIONS', start_time)
 
-        # Our shader batch
-        self.line_batch = batch_for_shader(
-            self.line_shader, 'LINES',
-            {"pos": self.edges_vertices, "color": self.edges_colors},
-            indices=self.edges_indices)
+    def _create_position_batches(self):
+        # One vertex buffer is shared by fill and line passes
+        vbo = _create_vertex_buffer('pos', 3, self.vertices)
+        self.fill_batch = gpu.types.GPUBatch(
+            type='TRIS', buf=vbo, elem=self.fill_indices_buffer)
 
-    def init_shaders(self):
-        self.fill_shader = gpu.types.GPUShader(
-            simple_fill_vertex_shader(), black_fill_fragment_shader())
+        self.line_batch = None
+        if self.line_indices_buffer is not None:
+            self.line_batch = gpu.types.GPUBatch(
+                type='LINES', buf=vbo, elem=self.line_indices_buffer)
 
-        self.line_shader = gpu.shader.from_builtin('3D_SMOOTH_COLOR')
+        self.special_line_batch = None
+        if self.special_line_indices_buffer is not None:
+            self.special_line_batch = gpu.types.GPUBatch(
+                type='LINES', buf=vbo, elem=self.special_line_indices_buffer)
 
-    def init_geom_data(self, obj):
-        mesh = obj.data
-        mesh.calc_loop_triangles()
+    def _log_batch_build_time(self, mode, start_time):
+        logger = logging.getLogger(__name__)
+        self.batch_build_time = time.perf_counter() - start_time
+        logger.debug("WIREFRAME {} BATCHES: {:.4f} sec.".format(
+            mode, self.batch_build_time))
 
-        verts = np.empty((len(mesh.vertices), 3), 'f')
+    def init_shaders(self):
+        self.fill_shader = FBShaderRegistry.get('SIMPLE_FILL')
+        self.line_shader = FBShaderRegistry.get('3D_UNIFORM_COLOR')
+
+    def invalidate_topology(self):
+        """ Should be called when head mesh is replaced """
+        self.topology_key = None
+        self._batched_topology_key = None
+
+    @staticmethod
+    def _mesh_topology_key(mesh):
+        return (mesh.as_pointer(), len(mesh.vertices),
+                len(mesh.edges), len(mesh.polygons))
+
+    def _init_topology(self, mesh):
+        logger = logging.getLogger(__name__)
+        key = self._mesh_topology_key(mesh)
+        if key == self.topology_key:
+            return
+        mesh.calc_loop_triangles()
         indices = np.empty((len(mesh.loop_triangles), 3), 'i')
-
-        mesh.vertices.foreach_get(
-            "co", np.reshape(verts, len(mesh.vertices) * 3))
         mesh.loop_triangles.foreach_get(
             "vertices", np.reshape(indices, len(mesh.loop_triangles) * 3))
-
-        # Object matrix usage
-        m = np.array(obj.matrix_world, dtype=np.float32).transpose()
-        vv = np.ones((len(mesh.vertices), 4), dtype=np.float32)
-        vv[:, :-1] = verts
-        vv = vv @ m
-        # Transformed vertices
-        verts = vv[:, :3]
-
-        self.vertices = verts
         self.indices = indices
 
         edges = np.empty((len(mesh.edges), 2), 'i')
         mesh.edges.foreach_get(
             "vertices", np.reshape(edges, len(mesh.edges) * 2))
+        self.edges = edges
+        self.topology_key = key
+        logger.debug("WIREFRAME TOPOLOGY UPDATED: {} tris {} edges".format(
+            len(indices), len(edges)))
+
+    def init_geom_data(self, obj):
+        mesh = obj.data
+        self._init_topology(mesh)
 
-        self.edges_vertices = self.vertices[edges.ravel()]
-        # self.init_edge_indices(obj)
+        verts = np.empty((len(mesh.vertices), 3), 'f')
+        mesh.vertices.foreach_get(
+            "co", np.reshape(verts, len(mesh.vertices) * 3))
 
-    # Separated to
-    def init_edge_indices(self, obj):
-        self.edges_indices = np.arange(len(self.edges_vertices) * 2).reshape(
-            len(self.edges_vertices), 2).tolist()
+        self.set_object_matrix(obj.matrix_world)
+        self.vertices = verts
+        self.mesh_outdated = False
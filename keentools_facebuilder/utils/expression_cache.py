@@ -0,0 +1,88 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from .. config import Config
+
+
+class FBExpressionCache:
+    """ LRU cache of expression vertices per builder state
+    (serial digest), mesh parts mask and keyframe.
+    Stored arrays are read-only """
+    _cache = OrderedDict()
+    _size = 0
+    # Serial digest and builder instance of the current state,
+    # None when unknown
+    _state_key = None
+    # Builder masks change vertices, UV set doesn't.
+    # None for default masks of a new builder
+    _masks_key = None
+    _stats = {'hits': 0, 'misses': 0, 'uncached': 0}
+
+    @classmethod
+    def set_state_key(cls, state_key):
+        cls._state_key = state_key
+
+    @classmethod
+    def set_masks(cls, masks):
+        cls._masks_key = None if masks is None \
+            else tuple(bool(m) for m in masks)
+
+    @classmethod
+    def vertices_at(cls, fb, keyframe):
+        if cls._state_key is None:
+            # Unsaved state, e.g. while pin dragging, can't be met again
+            cls._stats['uncached'] += 1
+            return fb.applied_args_model_vertices_at(keyframe)
+        key = (cls._state_key, cls._masks_key, keyframe)
+        verts = cls._cache.get(key)
+        if verts is not None:
+            cls._cache.move_to_end(key)
+            cls._stats['hits'] += 1
+            return verts
+        cls._stats['misses'] += 1
+        verts = np.array(fb.applied_args_model_vertices_at(keyframe))
+        verts.flags.writeable = False
+        cls._put(key, verts)
+        return verts
+
+    @classmethod
+    def _put(cls, key, verts):
+        logger = logging.getLogger(__name__)
+        if verts.nbytes > Config.expression_cache_max_size:
+            return
+        cls._cache[key] = verts
+        cls._size += verts.nbytes
+        while cls._size > Config.expression_cache_max_size:
+            _, old = cls._cache.popitem(last=False)
+            cls._size -= old.nbytes
+            logger.debug('EXPRESSION CACHE EVICTED: {}'.format(len(old)))
+
+    @classmethod
+    def clear(cls):
+        cls._cache = OrderedDict()
+        cls._size = 0
+
+    @classmethod
+    def stats(cls):
+        return dict(cls._stats, entries=len(cls._cache), size=cls._size)
@@ -298,6 +298,7 @@ def reconstruct_by_head():
         scene.render.resolution_x = params['frame_width']
         scene.render.resolution_y = params['frame_height']
 
+        FBLoader.inc_builder_revision()
         fb.deserialize(head.get_serial_str())
         logger.debug("RECONSTRUCT KEYFRAMES {}".format(str(fb.keyframes())))
 
@@ -23,6 +23,7 @@ import numpy as np
 from .. config import Config, get_main_settings, get_operators, ErrorType
 from .. fbloader import FBLoader
 from ..utils.coords import projection_matrix
+from ..utils.expression_cache import FBExpressionCache
 import keentools_facebuilder.blender_independent_packages.pykeentools_loader as pkt
 
 
@@ -143,6 +144,7 @@ def _get_fb_for_bake_tex(headnum, head):
     logger = logging.getLogger(__name__)
     FBLoader.load_model(headnum)
     fb = FBLoader.get_builder()
+    FBExpressionCache.set_masks(head.get_masks())
     for i, m in enumerate(head.get_masks()):
         fb.set_mask(i, m)
 
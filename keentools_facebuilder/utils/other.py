@@ -20,6 +20,7 @@ import time
 
 import bpy
 import blf
+import numpy as np
 
 from . edges import FBEdgeShader2D, FBEdgeShader3D
 from . points import FBPoints2D, FBPoints3D
@@ -94,6 +95,49 @@ class UserState:
         cls._state = None
 
 
+class FBPinDragStats:
+    """ Pin drag events statistics: received vs solved mouse moves
+    and event-to-redraw latencies """
+    _received = 0
+    _solved = 0
+    _latencies = []
+    _last_result = None
+
+    @classmethod
+    def start(cls):
+        cls._received = 0
+        cls._solved = 0
+        cls._latencies = []
+
+    @classmethod
+    def add_received(cls):
+        cls._received += 1
+
+    @classmethod
+    def add_solved(cls, latency):
+        cls._solved += 1
+        cls._latencies.append(latency)
+
+    @classmethod
+    def finish(cls):
+        logger = logging.getLogger(__name__)
+        if len(cls._latencies) > 0:
+            p50, p95 = np.percentile(cls._latencies, (50, 95))
+        else:
+            p50 = p95 = 0.0
+        cls._last_result = {'received': cls._received,
+                            'solved': cls._solved,
+                            'latency_p50': p50, 'latency_p95': p95}
+        logger.debug("PIN DRAG STATS: received {} solved {} "
+                     "latency p50 {:.4f} sec. p95 {:.4f} sec.".format(
+                         cls._received, cls._solved, p50, p95))
+        return cls._last_result
+
+    @classmethod
+    def get_last_result(cls):
+        return cls._last_result
+
+
 class FBTimer:
     _active = False
 
@@ -20,14 +20,17 @@ import bpy
 import gpu
 import bgl
 from gpu_extras.batch import batch_for_shader
-from . shaders import flat_color_3d_vertex_shader, \
-    circular_dot_fragment_shader, flat_color_2d_vertex_shader
+from mathutils import Matrix
+from . shaders import FBShaderRegistry
+from . import coords
+from . buffers import FBFloatBuffer
 from .. config import Config
 
 
 class FBShaderPoints:
     """ Base class for Point Drawing Shaders """
     point_size = Config.default_pin_size
+    vertex_size = 2
 
     # Store all draw handlers registered by class objects
     handler_list = []
@@ -50,8 +53,24 @@ class FBShaderPoints:
         self.shader = None
         self.batch = None
 
-        self.vertices = []
-        self.vertices_colors = []
+        self._vertices = FBFloatBuffer(self.vertex_size)
+        self._vertices_colors = FBFloatBuffer(4)
+
+    @property
+    def vertices(self):
+        return self._vertices.data()
+
+    @vertices.setter
+    def vertices(self, verts):
+        self._vertices.set(verts)
+
+    @property
+    def vertices_colors(self):
+        return self._vertices_colors.data()
+
+    @vertices_colors.setter
+    def vertices_colors(self, colors):
+        self._vertices_colors.set(colors)
 
     @classmethod
     def set_point_size(cls, ps):
@@ -63,33 +82,16 @@ class FBShaderPoints:
             return
         if shadername == 'CUSTOM_3D':
             # 3D_FLAT_COLOR
-            vertex_shader = flat_color_3d_vertex_shader()
-            fragment_shader = circular_dot_fragment_shader()
-
-            self.shader = gpu.types.GPUShader(vertex_shader, fragment_shader)
-
-            self.batch = batch_for_shader(
-                self.shader, 'POINTS',
-                {"pos": vertices, "color": vertices_colors},
-                indices=None
-            )
+            self.shader = FBShaderRegistry.get('CIRCULAR_DOT_3D')
         elif shadername == 'CUSTOM_2D':
-            vertex_shader = flat_color_2d_vertex_shader()
-            fragment_shader = circular_dot_fragment_shader()
-
-            self.shader = gpu.types.GPUShader(vertex_shader, fragment_shader)
-
-            self.batch = batch_for_shader(
-                self.shader, 'POINTS',
-                {"pos": vertices, "color": vertices_colors},
-                indices=None
-            )
+            self.shader = FBShaderRegistry.get('CIRCULAR_DOT_2D')
         else:
-            self.shader = gpu.shader.from_builtin(shadername)
-            self.batch = batch_for_shader(
-                self.shader, 'POINTS',
-                {"pos": vertices, "color": vertices_colors}
-            )
+            self.shader = FBShaderRegistry.get(shadername)
+
+        self.batch = batch_for_shader(
+            self.shader, 'POINTS',
+            {"pos": vertices, "color": vertices_colors}
+        )
 
     def create_batch(self):
         self._create_batch(self.vertices, self.vertices_colors)
@@ -110,26 +112,24 @@ class FBShaderPoints:
         self.draw_handler = None
 
     def add_color_vertices(self, color, verts):
-        for i, v in enumerate(verts):
-            self.vertices.append(verts[i])
-            self.vertices_colors.append(color)
+        self._vertices.append(verts)
+        self._vertices_colors.append_repeated(color, len(verts))
 
     def add_vertices_colors(self, verts, colors):
-        for i, v in enumerate(verts):
-            self.vertices.append(verts[i])
-            self.vertices_colors.append(colors[i])
+        self._vertices.append(verts)
+        self._vertices_colors.append(colors)
 
     def set_color_vertices(self, color, verts):
-        self.clear_vertices()
-        self.add_color_vertices(color, verts)
+        self._vertices.set(verts)
+        self._vertices_colors.set_repeated(color, len(verts))
 
     def set_vertices_colors(self, verts, colors):
-        self.clear_vertices()
-        self.add_vertices_colors(verts, colors)
+        self._vertices.set(verts)
+        self._vertices_colors.set(colors)
 
     def clear_vertices(self):
-        self.vertices = []
-        self.vertices_colors = []
+        self._vertices.clear()
+        self._vertices_colors.clear()
 
     def draw_callback(self, op, context):
         # Force Stop
@@ -140,13 +140,24 @@ class FBShaderPoints:
         if self.shader is not None:
             bgl.glPointSize(self.point_size)
             bgl.glEnable(bgl.GL_BLEND)
-            self.shader.bind()
-            self.batch.draw(self.shader)
+            with gpu.matrix.push_pop():
+                self.apply_transform()
+                self.shader.bind()
+                self.batch.draw(self.shader)
             bgl.glDisable(bgl.GL_BLEND)
 
+    def apply_transform(self):
+        """ Vertices transform applied at draw time """
+        pass
+
 
 class FBPoints2D(FBShaderPoints):
     """ 2D Shader for 2D-points drawing """
+    def apply_transform(self):
+        # Points are in image space, so zoom & pan don't need new batch
+        gpu.matrix.multiply_matrix(coords.image_space_to_region_matrix(
+            *coords.get_camera_border(bpy.context)))
+
     def create_batch(self):
         self._create_batch(
             # 2D_FLAT_COLOR
@@ -161,6 +172,8 @@ class FBPoints2D(FBShaderPoints):
 
 class FBPoints3D(FBShaderPoints):
     """ 3D Shader wrapper for 3d-points draw """
+    vertex_size = 3
+
     def create_batch(self):
         # 3D_FLAT_COLOR
         self._create_batch(self.vertices, self.vertices_colors, 'CUSTOM_3D')
@@ -169,3 +182,11 @@ class FBPoints3D(FBShaderPoints):
         super().__init__()
         self.set_point_size(
             Config.default_pin_size * Config.surf_pin_size_scale)
+        # Vertices are in object space, transform is applied at draw time
+        self.object_matrix = Matrix.Identity(4)
+
+    def set_object_matrix(self, matrix):
+        self.object_matrix = matrix.copy()
+
+    def apply_transform(self):
+        gpu.matrix.multiply_matrix(self.object_matrix)
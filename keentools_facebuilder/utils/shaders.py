@@ -16,6 +16,12 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # ##### END GPL LICENSE BLOCK #####
 
+import logging
+import time
+
+import gpu
+
+
 def flat_color_3d_vertex_shader():
     return '''
     uniform mat4 ModelViewProjectionMatrix;
@@ -118,6 +124,7 @@ def black_fill_fragment_shader():
 def residual_vertex_shader():
     return '''
     uniform mat4 ModelViewProjectionMatrix;
+    uniform float lineLengthScale;
     in vec2 pos;
     in float lineLength;
     out float v_LineLength;
@@ -127,7 +134,7 @@ def residual_vertex_shader():
 
     void main()
     {
-        v_LineLength = lineLength;
+        v_LineLength = lineLength * lineLengthScale;
         gl_Position = ModelViewProjectionMatrix * vec4(pos, 0.0, 1.0f);
         finalColor = color;
     }
@@ -146,3 +153,53 @@ def residual_fragment_shader():
         fragColor = finalColor;
     }
     '''
+
+
+class FBShaderRegistry:
+    """ Shaders compiled once per session and shared by all drawers """
+    _sources = {
+        'CIRCULAR_DOT_2D': (flat_color_2d_vertex_shader,
+                            circular_dot_fragment_shader),
+        'CIRCULAR_DOT_3D': (flat_color_3d_vertex_shader,
+                            circular_dot_fragment_shader),
+        'SIMPLE_FILL': (simple_fill_vertex_shader,
+                        black_fill_fragment_shader),
+        'RESIDUAL': (residual_vertex_shader, residual_fragment_shader),
+    }
+    _shaders = {}
+    # name: (compile count, total compile time)
+    _stats = {}
+
+    @classmethod
+    def get(cls, name):
+        """ Custom shader by registry name or Blender builtin shader """
+        shader = cls._shaders.get(name)
+        if shader is None:
+            shader = cls._compile(name)
+            cls._shaders[name] = shader
+        return shader
+
+    @classmethod
+    def _compile(cls, name):
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+        if name in cls._sources:
+            vertex_shader, fragment_shader = cls._sources[name]
+            shader = gpu.types.GPUShader(vertex_shader(), fragment_shader())
+        else:
+            shader = gpu.shader.from_builtin(name)
+        compile_time = time.perf_counter() - start
+
+        count, total_time = cls._stats.get(name, (0, 0.0))
+        cls._stats[name] = (count + 1, total_time + compile_time)
+        logger.debug("SHADER COMPILED: {} {:.6f} sec.".format(
+            name, compile_time))
+        return shader
+
+    @classmethod
+    def stats(cls):
+        return cls._stats.copy()
+
+    @classmethod
+    def clear(cls):
+        cls._shaders = {}
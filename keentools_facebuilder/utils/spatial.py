@@ -0,0 +1,98 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+import math
+
+
+class FBPointGrid:
+    """ Uniform grid over 2D points for nearest and radius queries.
+    Stores point indices, so it follows add / move / remove of the list """
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._points = []
+
+    def _cell(self, p):
+        return (math.floor(p[0] / self.cell_size),
+                math.floor(p[1] / self.cell_size))
+
+    def rebuild(self, points):
+        self._cells = {}
+        self._points = list(points)
+        for i, p in enumerate(self._points):
+            self._cells.setdefault(self._cell(p), []).append(i)
+
+    def add(self, p):
+        self._points.append(p)
+        self._cells.setdefault(self._cell(p), []).append(
+            len(self._points) - 1)
+
+    def _remove_from_cell(self, index):
+        cell = self._cell(self._points[index])
+        indices = self._cells[cell]
+        indices.remove(index)
+        if len(indices) == 0:
+            del self._cells[cell]
+
+    def move(self, index, p):
+        old_cell = self._cell(self._points[index])
+        if old_cell != self._cell(p):
+            self._remove_from_cell(index)
+            self._cells.setdefault(self._cell(p), []).append(index)
+        self._points[index] = p
+
+    def remove(self, index):
+        self._remove_from_cell(index)
+        del self._points[index]
+        # Indices after removed one are shifted
+        for indices in self._cells.values():
+            for i, v in enumerate(indices):
+                if v > index:
+                    indices[i] = v - 1
+
+    def _candidates(self, x, y, radius):
+        cx, cy = self._cell((x, y))
+        r = math.ceil(radius / self.cell_size)
+        if (2 * r + 1) ** 2 >= len(self._cells):
+            # Search area is larger than occupied cells
+            for indices in self._cells.values():
+                yield from indices
+            return
+        for i in range(cx - r, cx + r + 1):
+            for j in range(cy - r, cy + r + 1):
+                yield from self._cells.get((i, j), ())
+
+    def nearest(self, x, y, radius):
+        """ Nearest point index within radius and its squared distance.
+        Returns (-1, radius ** 2) if nothing found """
+        dist2 = radius ** 2
+        nearest = -1
+        for i in self._candidates(x, y, radius):
+            p = self._points[i]
+            d2 = (x - p[0]) ** 2 + (y - p[1]) ** 2
+            if d2 < dist2:
+                dist2 = d2
+                nearest = i
+        return nearest, dist2
+
+    def in_radius(self, x, y, radius):
+        """ Sorted indices of points within radius """
+        radius2 = radius ** 2
+        return sorted(i for i in self._candidates(x, y, radius)
+                      if (x - self._points[i][0]) ** 2
+                      + (y - self._points[i][1]) ** 2 < radius2)
@@ -0,0 +1,134 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+
+import hashlib
+import logging
+import os
+
+import bpy
+import numpy as np
+
+from .. config import Config, get_addon_preferences
+import keentools_facebuilder.blender_independent_packages.pykeentools_loader as pkt
+
+
+class FBTemplateCache:
+    """ Neutral template mesh arrays per builder type, model version
+    and mesh parts. Kept in memory and optionally on disk
+    in per-user Blender directory """
+    _templates = {}
+    _array_names = ('vertices', 'face_sizes', 'loop_vertices', 'uvs')
+
+    @classmethod
+    def make_key(cls, builder_type, mod_ver, masks=(), uv_set='uv0'):
+        return (builder_type, mod_ver, pkt.pykeentools_version(),
+                tuple(bool(m) for m in masks), uv_set)
+
+    @staticmethod
+    def _disk_cache_enabled(key):
+        # Disk files can't be told apart without library version
+        if key[2] is None:
+            return False
+        try:
+            return get_addon_preferences().template_disk_cache
+        except (KeyError, AttributeError):
+            return False
+
+    @classmethod
+    def get(cls, key):
+        arrays = cls._templates.get(key)
+        if arrays is None and cls._disk_cache_enabled(key):
+            arrays = cls._load(key)
+            if arrays is not None:
+                cls._templates[key] = arrays
+        return arrays
+
+    @classmethod
+    def put(cls, key, arrays):
+        cls._templates[key] = arrays
+        if cls._disk_cache_enabled(key):
+            cls._save(key, arrays)
+
+    @classmethod
+    def clear(cls):
+        cls._templates = {}
+
+    @classmethod
+    def _file_path(cls, key):
+        digest = hashlib.md5(repr(key).encode()).hexdigest()
+        cache_dir = bpy.utils.user_resource(
+            'DATAFILES', path=Config.template_cache_dir_name)
+        if not cache_dir:
+            return None
+        return os.path.join(cache_dir, 'template_{}.npz'.format(digest))
+
+    @classmethod
+    def _load(cls, key):
+        logger = logging.getLogger(__name__)
+        path = cls._file_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in cls._array_names}
+        except Exception as err:
+            logger.warning('TEMPLATE CACHE LOAD ERROR: {}'.format(str(err)))
+            return None
+        logger.debug('TEMPLATE LOADED FROM DISK: {}'.format(path))
+        return arrays
+
+    @classmethod
+    def _save(cls, key, arrays):
+        logger = logging.getLogger(__name__)
+        path = cls._file_path(key)
+        if path is None:
+            return
+        tmp_path = path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception as err:
+            logger.warning('TEMPLATE CACHE SAVE ERROR: {}'.format(str(err)))
+
+
+class FBTopologyCache:
+    """ Masked mesh topology per builder type, model version, masks
+    and UV set. Positions are taken from builder vertices by vertex map """
+    _topologies = {}
+
+    @classmethod
+    def make_key(cls, builder_type, mod_ver, masks=(), uv_set='uv0'):
+        return (builder_type, mod_ver, tuple(bool(m) for m in masks), uv_set)
+
+    @classmethod
+    def get(cls, key):
+        return cls._topologies.get(key)
+
+    @classmethod
+    def put(cls, key, arrays, vertex_map):
+        topology = {name: arrays[name] for name in
+                    ('face_sizes', 'loop_vertices', 'uvs')}
+        topology['vertex_map'] = vertex_map
+        cls._topologies[key] = topology
+
+    @classmethod
+    def clear(cls):
+        cls._topologies = {}
@@ -0,0 +1,160 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+import logging
+import zlib
+
+from .. config import Config, get_main_settings
+
+
+class FBUndoState:
+    """ Compressed head serialization, camera model matrices and focals """
+    def __init__(self, msg, headnum, serial_str, model_mats, focals):
+        self.msg = msg
+        self.headnum = headnum
+        self.serial = zlib.compress(serial_str.encode(), 1)
+        self.model_mats = tuple(model_mats)
+        self.focals = tuple(focals)
+
+    def serial_str(self):
+        return zlib.decompress(self.serial).decode()
+
+    def size(self):
+        return len(self.serial) + sum(len(m) for m in self.model_mats)
+
+    def same_state(self, other):
+        return self.headnum == other.headnum and \
+            self.serial == other.serial and \
+            self.model_mats == other.model_mats and \
+            self.focals == other.focals
+
+
+class FBUndoHistory:
+    """ Pinmode undo history. Blender memfile undo is used
+    only on pinmode boundaries """
+    _states = []
+    # Index of the current state
+    _current = -1
+    # Has history changes not pushed to Blender undo
+    _changed = False
+
+    @classmethod
+    def start(cls, headnum):
+        """ Current head state becomes history base """
+        cls._states = []
+        cls._current = -1
+        cls._changed = False
+        cls.push(headnum, 'Base')
+        cls._changed = False
+
+    @classmethod
+    def clear(cls):
+        cls._states = []
+        cls._current = -1
+        cls._changed = False
+
+    @classmethod
+    def is_changed(cls):
+        return cls._changed
+
+    @classmethod
+    def push(cls, headnum, msg, serial_str=None, model_mats=None,
+             focals=None):
+        """ Head state from scene properties if not specified """
+        logger = logging.getLogger(__name__)
+        head = get_main_settings().get_head(headnum)
+        if head is None:
+            return
+        if serial_str is None:
+            serial_str = head.get_serial_str()
+        if model_mats is None:
+            model_mats = [cam.model_mat for cam in head.cameras]
+        if focals is None:
+            focals = [cam.focal for cam in head.cameras]
+
+        state = FBUndoState(msg, headnum, serial_str, model_mats, focals)
+        if cls._current >= 0 and state.same_state(cls._states[cls._current]):
+            return
+
+        # Redo states are dropped
+        del cls._states[cls._current + 1:]
+        cls._states.append(state)
+        cls._current = len(cls._states) - 1
+        cls._changed = True
+        cls._limit_size()
+        logger.debug("UNDO PUSH: {} {} states {} bytes".format(
+            msg, len(cls._states), cls.size()))
+
+    @classmethod
+    def size(cls):
+        return sum(state.size() for state in cls._states)
+
+    @classmethod
+    def _limit_size(cls):
+        while len(cls._states) > 1 and (
+                len(cls._states) > Config.undo_history_max_steps
+                or cls.size() > Config.undo_history_max_size):
+            del cls._states[0]
+            cls._current -= 1
+
+    @classmethod
+    def can_undo(cls):
+        return cls._current > 0
+
+    @classmethod
+    def can_redo(cls):
+        return 0 <= cls._current < len(cls._states) - 1
+
+    @classmethod
+    def undo(cls):
+        if not cls.can_undo():
+            return False
+        if not cls._restore(cls._states[cls._current - 1]):
+            return False
+        cls._current -= 1
+        cls._changed = True
+        return True
+
+    @classmethod
+    def redo(cls):
+        if not cls.can_redo():
+            return False
+        if not cls._restore(cls._states[cls._current + 1]):
+            return False
+        cls._current += 1
+        cls._changed = True
+        return True
+
+    @classmethod
+    def _restore(cls, state):
+        """ Write state into scene properties, builder reload is needed """
+        logger = logging.getLogger(__name__)
+        head = get_main_settings().get_head(state.headnum)
+        if head is None or len(head.cameras) != len(state.model_mats) \
+                or len(head.cameras) != len(state.focals):
+            logger.debug("UNDO STATE MISMATCH: {}".format(state.msg))
+            return False
+        # Focal update callback saves builder, so serial is written after
+        for cam, focal in zip(head.cameras, state.focals):
+            if abs(cam.focal - focal) > Config.focal_update_tolerance:
+                cam.focal = focal
+        head.set_serial_str(state.serial_str())
+        for cam, model_mat in zip(head.cameras, state.model_mats):
+            cam.model_mat = model_mat
+        logger.debug("UNDO RESTORE: {}".format(state.msg))
+        return True
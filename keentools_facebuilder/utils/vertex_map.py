@@ -0,0 +1,44 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+# KeenTools for blender is a blender addon for using KeenTools in Blender.
+# Copyright (C) 2019  KeenTools
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+
+
+def build_vertex_map(points, source, decimals=6):
+    """ Indices of source vertices for every mesh point or None.
+    Coinciding vertices can't be told apart by position,
+    so any ambiguity gives None """
+    if len(points) == len(source) and np.array_equal(points, source):
+        # Unmasked mesh points are builder vertices
+        return np.arange(len(source), dtype=np.int32)
+    index = {}
+    ambiguous = set()
+    for i, p in enumerate(np.round(source, decimals).tolist()):
+        key = tuple(p)
+        if key in index:
+            ambiguous.add(key)
+        index[key] = i
+    keys = [tuple(p) for p in np.round(points, decimals).tolist()]
+    if any(key in ambiguous or key not in index for key in keys):
+        return None
+    vertex_map = np.array([index[key] for key in keys], dtype=np.int32)
+    if len(np.unique(vertex_map)) != len(points):
+        return None
+    if not np.allclose(source[vertex_map], points, atol=1e-5):
+        return None
+    return vertex_map
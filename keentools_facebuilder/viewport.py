@@ -27,12 +27,25 @@ from . utils import coords
 from . utils.edges import FBEdgeShader3D, FBEdgeShader2D
 from . utils.other import FBText
 from . utils.points import FBPoints2D, FBPoints3D
+from . utils.spatial import FBPointGrid
 
 
 class FBScreenPins:
     _pins = []
     _current_pin = None
     _current_pin_num = -1
+    # Incremented on every change to detect outdated batches
+    _version = 0
+    # Hit-test index, follows all changes of pins list
+    _grid = FBPointGrid(Config.pin_grid_cell_size)
+
+    @classmethod
+    def version(cls):
+        return cls._version
+
+    @classmethod
+    def _inc_version(cls):
+        cls._version += 1
 
     @classmethod
     def arr(cls):
@@ -41,10 +54,36 @@ class FBScreenPins:
     @classmethod
     def set_pins(cls, arr):
         cls._pins = arr
+        cls._grid.rebuild(arr)
+        cls._inc_version()
 
     @classmethod
     def add_pin(cls, vec2d):
         cls._pins.append(vec2d)
+        cls._grid.add(vec2d)
+        cls._inc_version()
+
+    @classmethod
+    def move_pin(cls, index, vec2d):
+        cls._pins[index] = vec2d
+        cls._grid.move(index, vec2d)
+        cls._inc_version()
+
+    @classmethod
+    def remove_pin(cls, index):
+        del cls._pins[index]
+        cls._grid.remove(index)
+        cls._inc_version()
+
+    @classmethod
+    def nearest_pin(cls, x, y, radius):
+        """ Nearest pin within radius: (index, squared distance).
+        Index is -1 if there is no pin """
+        return cls._grid.nearest(x, y, radius)
+
+    @classmethod
+    def pins_in_radius(cls, x, y, radius):
+        return cls._grid.in_radius(x, y, radius)
 
     @classmethod
     def current_pin_num(cls):
@@ -53,10 +92,12 @@ class FBScreenPins:
     @classmethod
     def set_current_pin_num(cls, value):
         cls._current_pin_num = value
+        cls._inc_version()
 
     @classmethod
     def set_current_pin_num_to_last(cls):
         cls._current_pin_num = len(cls.arr()) - 1
+        cls._inc_version()
 
     @classmethod
     def current_pin(cls):
@@ -65,11 +106,13 @@ class FBScreenPins:
     @classmethod
     def set_current_pin(cls, value):
         cls._current_pin = value
+        cls._inc_version()
 
     @classmethod
     def reset_current_pin(cls):
         cls._current_pin = None
         cls._current_pin_num = -1
+        cls._inc_version()
 
 
 class FBViewport:
@@ -92,10 +135,21 @@ class FBViewport:
     _draw_timer_handler = None
 
     _residuals = FBEdgeShader2D()
+    # Special edges masks: {(builder_type, masks, uv_set): edge_mask}
+    _special_edge_masks = {}
 
     # Pins
     _pins = FBScreenPins()
 
+    # Input fingerprints of the last built modal batches
+    _batch_2d_fingerprint = None
+    _residuals_fingerprint = None
+    _rebuild_counters = {'performed': 0, 'skipped': 0}
+    # Residual arrays by keyframe
+    _residuals_data = {}
+    # Pins surface point tables by keyframe
+    _pin_tables = {}
+
     @classmethod
     def pins(cls):
         return cls._pins
@@ -146,6 +200,7 @@ class FBViewport:
     @classmethod
     def register_handlers(cls, args, context):
         cls.unregister_handlers()  # Experimental
+        cls.reset_batch_fingerprints()
 
         cls.residuals().register_handler(args)
 
@@ -185,21 +240,12 @@ class FBViewport:
         verts, colors = cls.surface_points(
             fb, headobj, keyframe, allcolor, selcolor)
 
-        if len(verts) > 0:
-            # Object matrix usage
-            m = np.array(headobj.matrix_world, dtype=np.float32).transpose()
-            vv = np.ones((len(verts), 4), dtype=np.float32)
-            vv[:, :-1] = verts
-            vv = vv @ m
-            # Transformed vertices
-            verts = vv[:, :3]
-
+        cls.points3d().set_object_matrix(headobj.matrix_world)
         cls.points3d().set_vertices_colors(verts, colors)
         cls.points3d().create_batch()
 
     @classmethod
-    def update_wireframe(cls, builder_type, obj):
-        logger = logging.getLogger(__name__)
+    def update_wireframe(cls, builder_type, head):
         settings = get_main_settings()
         main_color = settings.wireframe_color
         comp_color = settings.wireframe_special_color
@@ -207,32 +253,58 @@ class FBViewport:
         cls.wireframer().init_color_data((*main_color,
                                           settings.wireframe_opacity))
         if settings.show_specials:
-            mesh = obj.data
-            # Check to prevent shader problem
-            if len(mesh.edges) * 2 == len(cls.wireframer().edges_colors):
-                logger.debug("COLORING")
-                special_indices = cls.get_special_indices(builder_type)
-                cls.wireframer().init_special_areas(
-                    obj.data, special_indices, (*comp_color,
-                                                settings.wireframe_opacity))
-            else:
-                logging.warning("LISTS HAVE DIFFERENT SIZES")
-        cls.wireframer().create_batches()
+            edge_mask = cls.get_special_edge_mask(
+                builder_type, head.get_masks(), head.tex_uv_shape)
+            cls.wireframer().init_special_areas(
+                edge_mask, (*comp_color, settings.wireframe_opacity))
+        cls.wireframer().update_batches(positions=False)
+
+    @classmethod
+    def get_special_edge_mask(cls, builder_type, masks=(), uv_set='uv0'):
+        """ Boolean mask of special edges in current wireframer topology """
+        logger = logging.getLogger(__name__)
+        edges = cls.wireframer().edges
+        key = (builder_type, tuple(masks), uv_set)
+        edge_mask = cls._special_edge_masks.get(key)
+        # Edges count check prevents usage of mask from another model version
+        if edge_mask is not None and len(edge_mask) == len(edges):
+            return edge_mask
+
+        logger.debug("CALC SPECIAL EDGE MASK: {}".format(key))
+        edge_mask = cls.calc_special_edge_mask(
+            edges, cls.get_special_indices(builder_type))
+        cls._special_edge_masks[key] = edge_mask
+        return edge_mask
+
+    @staticmethod
+    def calc_special_edge_mask(edges, pairs):
+        """ Check both vertex orders of every edge in special pairs """
+        pairs = np.asarray(pairs, dtype=np.int64).reshape((-1, 2))
+        edges = np.asarray(edges, dtype=np.int64).reshape((-1, 2))
+        if len(pairs) == 0 or len(edges) == 0:
+            return np.zeros(len(edges), dtype=np.bool_)
+
+        # Order-independent unique key for every vertex pair
+        base = max(pairs.max(), edges.max()) + 1
+        pair_keys = pairs.min(axis=1) * base + pairs.max(axis=1)
+        edge_keys = edges.min(axis=1) * base + edges.max(axis=1)
+        return np.isin(edge_keys, pair_keys)
 
     @classmethod
     def get_special_indices(cls, builder_type):
         if builder_type == BuilderType.FaceBuilder:
-            pairs = const.get_eyes_indices()
-            pairs = pairs.union(const.get_eyebrows_indices())
-            pairs = pairs.union(const.get_nose_indices())
-            pairs = pairs.union(const.get_mouth_indices())
-            pairs = pairs.union(const.get_ears_indices())
-            pairs = pairs.union(const.get_half_indices())
-            # pairs = pairs.union(const.get_jaw_indices2())
-            return pairs
+            return np.concatenate((
+                const.get_eyes_indices(),
+                const.get_eyebrows_indices(),
+                const.get_nose_indices(),
+                const.get_mouth_indices(),
+                const.get_ears_indices(),
+                const.get_half_indices(),
+                # const.get_jaw_indices2(),
+            ))
         elif builder_type == BuilderType.BodyBuilder:
             return const.get_bodybuilder_highlight_indices()
-        return {}
+        return np.empty((0, 2), dtype=np.int32)
 
     @classmethod
     def update_pin_sensitivity(cls):
@@ -246,32 +318,72 @@ class FBViewport:
         cls.points3d().set_point_size(
             settings.pin_size * Config.surf_pin_size_scale)
 
+    @classmethod
+    def clear_pin_tables(cls):
+        cls._pin_tables = {}
+
+    @classmethod
+    def pin_tables(cls, fb, keyframe):
+        """ Pins surface points as arrays: geo point indices (N, 3)
+        and barycentric coordinates (N, 3). Cached until pins count
+        changes or tables are cleared by pins add / remove / reload """
+        pins_count = fb.pins_count(keyframe)
+        tables = cls._pin_tables.get(keyframe)
+        if tables is not None and len(tables[0]) == pins_count:
+            return tables
+
+        indices = np.empty((pins_count, 3), dtype=np.int32)
+        barycentrics = np.empty((pins_count, 3), dtype=np.float32)
+        for i in range(pins_count):
+            sp = fb.pin(keyframe, i).surface_point
+            indices[i] = sp.geo_point_idxs
+            barycentrics[i] = sp.barycentric_coordinates
+        tables = (indices, barycentrics)
+        cls._pin_tables[keyframe] = tables
+        return tables
+
+    @classmethod
+    def _mesh_vertices(cls, headobj):
+        wireframer = cls.wireframer()
+        if wireframer.mesh_outdated:
+            # The same object space vertices as mesh will get later
+            return wireframer.vertices
+        vertices = headobj.data.vertices
+        verts = np.empty((len(vertices), 3), dtype=np.float32)
+        vertices.foreach_get('co', np.reshape(verts, len(vertices) * 3))
+        return verts
+
+    @staticmethod
+    def _barycentric_points(verts, indices, barycentrics):
+        return np.einsum('ijk,ij->ik', verts[indices], barycentrics)
+
     @classmethod
     def surface_points(cls, fb, headobj, keyframe=-1,
                        allcolor=(0, 0, 1, 0.15), selcolor=(0, 1, 0, 1)):
-        verts = []
-        colors = []
-
-        for k in fb.keyframes():
-            for i in range(fb.pins_count(k)):
-                pin = fb.pin(k, i)
-                p = coords.pin_to_xyz(pin, headobj)
-                verts.append(p)
-                if k == keyframe:
-                    colors.append(selcolor)
-                else:
-                    colors.append(allcolor)
+        keyframes = fb.keyframes()
+        tables = [cls.pin_tables(fb, k) for k in keyframes]
+        if len(tables) == 0:
+            return np.empty((0, 3), dtype=np.float32), \
+                np.empty((0, 4), dtype=np.float32)
+
+        indices = np.concatenate([t[0] for t in tables])
+        barycentrics = np.concatenate([t[1] for t in tables])
+        verts = cls._barycentric_points(
+            cls._mesh_vertices(headobj), indices, barycentrics)
+
+        colors = np.empty((len(verts), 4), dtype=np.float32)
+        start = 0
+        for k, t in zip(keyframes, tables):
+            end = start + len(t[0])
+            colors[start:end] = selcolor if k == keyframe else allcolor
+            start = end
         return verts, colors
 
     @classmethod
     def surface_points_only(cls, fb, headobj, keyframe=-1):
-        verts = []
-
-        for i in range(fb.pins_count(keyframe)):
-            pin = fb.pin(keyframe, i)
-            p = coords.pin_to_xyz(pin, headobj)
-            verts.append(p)
-        return verts
+        indices, barycentrics = cls.pin_tables(fb, keyframe)
+        return cls._barycentric_points(
+            cls._mesh_vertices(headobj), indices, barycentrics)
 
     @classmethod
     def img_points(cls, fb, keyframe):
@@ -280,13 +392,12 @@ class FBViewport:
         h = scene.render.resolution_y
 
         pins_count = fb.pins_count(keyframe)
-
-        verts = []
-        for i in range(pins_count):
-            pin = fb.pin(keyframe, i)
-            x, y = pin.img_pos
-            verts.append((coords.frame_to_image_space(x, y, w, h)))
-        return verts
+        verts = np.array([fb.pin(keyframe, i).img_pos
+                          for i in range(pins_count)],
+                         dtype=np.float32).reshape((-1, 2))
+        verts[:, 0], verts[:, 1] = coords.frame_to_image_space(
+            verts[:, 0], verts[:, 1], w, h)
+        return [tuple(p) for p in verts.tolist()]
 
     @classmethod
     def create_batch_2d(cls, context):
@@ -298,12 +409,6 @@ class FBViewport:
         ry = scene.render.resolution_y
         asp = ry / rx
 
-        x1, y1, x2, y2 = coords.get_camera_border(context)
-
-        for i, p in enumerate(points):
-            x, y = coords.image_space_to_region(p[0], p[1], x1, y1, x2, y2)
-            points[i] = (x, y)
-
         vertex_colors = [Config.pin_color for _ in range(len(points))]
 
         pins = cls.pins()
@@ -311,36 +416,108 @@ class FBViewport:
             vertex_colors[pins.current_pin_num()] = Config.current_pin_color
 
         # Camera corners
-        points.append(
-            (coords.image_space_to_region(
-                -0.5, -asp * 0.5, x1, y1, x2, y2))
-        )
-        points.append(
-            (coords.image_space_to_region(
-                0.5, asp * 0.5,
-                x1, y1, x2, y2))
-        )
+        points.append((-0.5, -asp * 0.5))
+        points.append((0.5, asp * 0.5))
         vertex_colors.append((1.0, 0.0, 1.0, 0.2))  # left camera corner
         vertex_colors.append((1.0, 0, 1.0, 0.2))  # right camera corner
 
         cls.points2d().set_vertices_colors(points, vertex_colors)
         cls.points2d().create_batch()
 
+    @classmethod
+    def reset_batch_fingerprints(cls):
+        cls._batch_2d_fingerprint = None
+        cls._residuals_fingerprint = None
+
+    @classmethod
+    def rebuild_counters(cls):
+        return cls._rebuild_counters.copy()
+
+    @classmethod
+    def reset_rebuild_counters(cls):
+        cls._rebuild_counters = {'performed': 0, 'skipped': 0}
+
+    @classmethod
+    def _count_rebuild(cls, performed):
+        cls._rebuild_counters['performed' if performed else 'skipped'] += 1
+
+    @staticmethod
+    def _matrix_fingerprint(obj):
+        if obj is None:
+            return None
+        return tuple(tuple(row) for row in obj.matrix_world)
+
+    @classmethod
+    def update_modal_batches(cls, fb, context, headobj, keyframe,
+                             builder_revision):
+        """ Rebuild pin and residual batches only when their inputs changed.
+        Batches are in image space so camera zoom & offset don't matter """
+        # Object transforms are shader uniforms, no batch rebuild needed
+        cls.wireframer().set_object_matrix(headobj.matrix_world)
+        cls.points3d().set_object_matrix(headobj.matrix_world)
+
+        scene = context.scene
+        frame_size = (scene.render.resolution_x, scene.render.resolution_y)
+        pins = cls.pins()
+
+        fingerprint_2d = (frame_size, pins.version())
+        if fingerprint_2d != cls._batch_2d_fingerprint:
+            cls.create_batch_2d(context)
+            cls._batch_2d_fingerprint = fingerprint_2d
+            cls._count_rebuild(True)
+        else:
+            cls._count_rebuild(False)
+
+        fingerprint_residuals = (
+            frame_size, pins.version(), builder_revision, keyframe,
+            cls._matrix_fingerprint(headobj),
+            cls._matrix_fingerprint(context.scene.camera))
+        if fingerprint_residuals != cls._residuals_fingerprint:
+            cls.update_residuals(fb, context, headobj, keyframe)
+            cls._residuals_fingerprint = fingerprint_residuals
+            cls._count_rebuild(True)
+        else:
+            cls._count_rebuild(False)
+
+    @classmethod
+    def residuals_data(cls, keyframe):
+        """ Last calculated residuals for keyframe or None.
+        Dict of arrays: projected, pins and lengths in image space """
+        return cls._residuals_data.get(keyframe)
+
+    @classmethod
+    def clear_residuals_data(cls):
+        cls._residuals_data = {}
+
+    @classmethod
+    def project_surface_points(cls, fb, headobj, keyframe, p3d):
+        """ Project object space points into frame pixels """
+        projection = fb.projection_mat(keyframe).T
+        m = bpy.context.scene.camera.matrix_world.inverted()
+
+        # Fill matrix in homogeneous coords
+        vv = np.ones((len(p3d), 4), dtype=np.float32)
+        vv[:, :-1] = p3d
+
+        # Object transform, inverse camera, projection apply -> numpy
+        transform = np.array(
+            headobj.matrix_world.transposed() @ m.transposed()) @ projection
+        vv = vv @ transform
+        return vv[:, :2] / vv[:, 3:]
+
     @classmethod
     def update_residuals(cls, fb, context, headobj, keyframe):
         scene = bpy.context.scene
         rx = scene.render.resolution_x
         ry = scene.render.resolution_y
 
-        x1, y1, x2, y2 = coords.get_camera_border(context)
-
         p2d = cls.img_points(fb, keyframe)
         p3d = cls.surface_points_only(fb, headobj, keyframe)
 
         wire = cls.residuals()
         wire.clear_vertices()
         wire.edge_lengths = []
-        wire.vertices_colors = []
+        cls._residuals_data.pop(keyframe, None)
 
         # Pins count != Surf points count
         if len(p2d) != len(p3d):
@@ -351,37 +528,23 @@ class FBViewport:
             wire.create_batch()
             return
 
-        # ----------
-        # Projection
-        projection = fb.projection_mat(keyframe).T
+        p2d = np.array(p2d, dtype=np.float32)
+        projected = np.empty_like(p2d)
+        projected[:, 0], projected[:, 1] = coords.frame_to_image_space(
+            *cls.project_surface_points(fb, headobj, keyframe, p3d).T, rx, ry)
 
-        camobj = bpy.context.scene.camera
-        m = camobj.matrix_world.inverted()
+        # Projected point and pin are line ends
+        verts = np.empty((2 * len(p2d), 2), dtype=np.float32)
+        verts[0::2] = projected
+        verts[1::2] = p2d
 
-        # Fill matrix in homogeneous coords
-        vv = np.ones((len(p3d), 4), dtype=np.float32)
-        vv[:, :-1] = p3d
+        lengths = np.linalg.norm(p2d - projected, axis=1)
+        edge_lengths = np.zeros(len(verts), dtype=np.float32)
+        edge_lengths[1::2] = lengths
 
-        # Object transform, inverse camera, projection apply -> numpy
-        transform = np.array(
-            headobj.matrix_world.transposed() @ m.transposed()) @ projection
-        # Calc projection
-        vv = vv @ transform
-        vv = (vv.T / vv[:, 3]).T
-
-        verts2 = []
-        for i, v in enumerate(vv):
-            x, y = coords.frame_to_image_space(v[0], v[1], rx, ry)
-            verts2.append(coords.image_space_to_region(x, y,
-                                                       x1, y1, x2, y2))
-            wire.edge_lengths.append(0)
-            verts2.append(coords.image_space_to_region(p2d[i][0], p2d[i][1],
-                                                       x1, y1, x2, y2))
-            # length = np.linalg.norm((v[0]-p2d[i][0], v[1]-p2d[i][1]))
-            length = 22.0
-            wire.edge_lengths.append(length)
-
-        wire.vertices = verts2
-        wire.vertices_colors = np.full((len(verts2), 4),
-                                       Config.residual_color).tolist()
+        cls._residuals_data[keyframe] = {
+            'projected': projected, 'pins': p2d, 'lengths': lengths}
+
+        wire.set_color_vertices(Config.residual_color, verts)
+        wire.edge_lengths = edge_lengths
         wire.create_batch()
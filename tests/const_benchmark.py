@@ -0,0 +1,111 @@
+# -------
+# Import time benchmark for highlight index tables (const.py)
+# Blender is not needed, start it from commandline:
+# python const_benchmark.py [baseline_revision]
+# Baseline is the literal sets module taken from git history
+# -------
+import importlib.util
+import marshal
+import os
+import subprocess
+import sys
+import time
+
+
+CONST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', 'keentools_facebuilder', 'const.py')
+GETTERS = ('get_eyes_indices', 'get_eyebrows_indices', 'get_nose_indices',
+           'get_mouth_indices', 'get_ears_indices', 'get_half_indices')
+# Last revision with literal sets in const.py
+BASELINE_REVISION = '912869c^'
+
+
+def import_const():
+    spec = importlib.util.spec_from_file_location('fb_const', CONST_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000.0
+
+
+def baseline_source(revision):
+    repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    try:
+        return subprocess.check_output(
+            ['git', 'show', revision + ':keentools_facebuilder/const.py'],
+            cwd=repo_dir, stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_baseline(source, repeat):
+    code = compile(source, 'const_baseline.py', 'exec')
+    # The same as .pyc contents
+    bytecode = marshal.dumps(code)
+
+    def _calls(namespace):
+        for name in GETTERS:
+            namespace[name]()
+
+    def _first_compile():
+        namespace = {}
+        exec(compile(source, 'const_baseline.py', 'exec'), namespace)
+        _calls(namespace)
+
+    def _cached_bytecode():
+        namespace = {}
+        exec(marshal.loads(bytecode), namespace)
+        _calls(namespace)
+
+    namespace = {}
+    exec(code, namespace)
+    print('baseline compile + import + calls: {:.3f} ms'.format(
+        measure(_first_compile, max(1, repeat // 4))))
+    print('baseline import + calls (cached bytecode): {:.3f} ms'.format(
+        measure(_cached_bytecode, repeat)))
+    print('baseline next calls: {:.3f} ms'.format(
+        measure(lambda: _calls(namespace), repeat)))
+
+
+def main(repeat=20, baseline_revision=BASELINE_REVISION):
+    source = baseline_source(baseline_revision)
+    if source is None:
+        print('baseline {} is not available'.format(baseline_revision))
+    else:
+        measure_baseline(source, repeat)
+
+    import_const()  # Warm up bytecode cache
+    print('import: {:.3f} ms'.format(measure(import_const, repeat)))
+
+    def _first_call():
+        module = import_const()
+        for name in GETTERS:
+            getattr(module, name)()
+
+    print('import + first calls: {:.3f} ms'.format(
+        measure(_first_call, repeat)))
+
+    module = import_const()
+    for name in GETTERS:
+        getattr(module, name)()
+
+    def _next_calls():
+        for name in GETTERS:
+            getattr(module, name)()
+
+    print('memoized calls: {:.3f} ms'.format(measure(_next_calls, repeat)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(baseline_revision=sys.argv[1])
+    else:
+        main()
@@ -8,6 +8,9 @@ import unittest
 import bpy
 import sys
 import os
+import time
+
+import numpy as np
 
 # Import test functions used in unit-tests started from any location
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -18,6 +21,7 @@ import test_utils
 from keentools_facebuilder.utils import coords, materials
 from keentools_facebuilder.config import Config, get_main_settings, \
     get_operators
+from keentools_facebuilder.fbloader import FBLoader
 
 
 class FaceBuilderTest(unittest.TestCase):
@@ -159,6 +163,74 @@ class FaceBuilderTest(unittest.TestCase):
         tex_name = materials.bake_tex(headnum=0, tex_name='bake_texture_name')
         self.assertTrue(tex_name is not None)
 
+    def test_bulk_builder_mesh(self):
+        def _mesh_arrays(mesh):
+            verts = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', verts)
+            loops = np.empty(len(mesh.loops), dtype=np.int32)
+            mesh.loops.foreach_get('vertex_index', loops)
+            uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            mesh.uv_layers[0].data.foreach_get('uv', uvs)
+            return verts, loops, uvs, len(mesh.polygons), len(mesh.edges)
+
+        def _timed_mesh(bulk):
+            start = time.perf_counter()
+            mesh = FBLoader.get_builder_mesh(
+                FBLoader.get_builder(), 'FBBulkTest', bulk=bulk)
+            return mesh, time.perf_counter() - start
+
+        test_utils.new_scene()
+        test_utils.create_head()
+        old_mesh, old_time = _timed_mesh(bulk=False)
+        new_mesh, new_time = _timed_mesh(bulk=True)
+        print('get_builder_mesh old: {:.4f} sec. bulk: {:.4f} sec.'.format(
+            old_time, new_time))
+
+        old_data = _mesh_arrays(old_mesh)
+        new_data = _mesh_arrays(new_mesh)
+        for old, new in zip(old_data[:3], new_data[:3]):
+            self.assertTrue(np.allclose(old, new, atol=1e-6))
+        self.assertEqual(old_data[3:], new_data[3:])
+        bpy.data.meshes.remove(old_mesh)
+        bpy.data.meshes.remove(new_mesh)
+
+    def test_expression_head_mesh(self):
+        test_utils.new_scene()
+        self._head_cams_and_pins()
+        settings = get_main_settings()
+        headnum = settings.get_last_headnum()
+        camnum = settings.get_last_camnum(headnum)
+        head = settings.get_head(headnum)
+        head.use_emotions = True
+        settings.current_headnum = headnum
+        settings.current_camnum = camnum
+
+        FBLoader.load_model(headnum)
+        fb = FBLoader.get_builder()
+        geom = coords.head_mesh_geom(settings, fb, head)
+        self.assertTrue(geom is not None)
+        self.assertEqual(len(geom), len(head.headobj.data.vertices))
+        coords.update_head_mesh(settings, fb, head)
+        # Second call gets the same vertices from expression cache
+        self.assertTrue(np.array_equal(
+            geom, coords.head_mesh_geom(settings, fb, head)))
+
+    def test_load_after_builder_sync_version(self):
+        test_utils.new_scene()
+        self._head_cams_and_pins()
+        settings = get_main_settings()
+        headnum = settings.get_last_headnum()
+        camnum = settings.get_last_camnum(headnum)
+        kid = settings.get_keyframe(headnum, camnum)
+
+        FBLoader.load_model(headnum)
+        FBLoader.save_only(headnum)
+        self.assertEqual(4, FBLoader.get_builder().pins_count(kid))
+        # Unknown version makes new empty builder without revision change
+        FBLoader.builder().sync_version(Config.unknown_mod_ver)
+        self.assertTrue(FBLoader.load_model(headnum))
+        self.assertEqual(4, FBLoader.get_builder().pins_count(kid))
+
 
 if __name__ == "__main__":
     # unittest.main()  # -- Doesn't work with Blender, so we use Suite
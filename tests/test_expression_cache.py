@@ -0,0 +1,143 @@
+# -------
+# Expression vertices cache test, Blender is not needed:
+# python -m pytest test_expression_cache.py
+# -------
+import importlib.util
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', 'keentools_facebuilder', 'utils',
+                          'expression_cache.py')
+PACKAGE = 'fb_expression_cache_test'
+VERTEX_COUNT = 1000
+# float32 xyz
+ENTRY_SIZE = VERTEX_COUNT * 3 * 4
+
+
+class Config:
+    expression_cache_max_size = 32 * 1024 * 1024
+
+
+class Builder:
+    """ Vertices depend on keyframe, calls are counted """
+    def __init__(self):
+        self.calls = 0
+
+    def applied_args_model_vertices_at(self, keyframe):
+        self.calls += 1
+        return np.full((VERTEX_COUNT, 3), keyframe, dtype=np.float32)
+
+
+def import_expression_cache():
+    """ Package config module is replaced by plain Config """
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = []
+    utils = types.ModuleType(PACKAGE + '.utils')
+    utils.__path__ = []
+    config = types.ModuleType(PACKAGE + '.config')
+    config.Config = Config
+    sys.modules[PACKAGE] = package
+    sys.modules[PACKAGE + '.utils'] = utils
+    sys.modules[PACKAGE + '.config'] = config
+
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE + '.utils.expression_cache', CACHE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def cache():
+    cache = import_expression_cache().FBExpressionCache
+    cache.clear()
+    cache.set_state_key(b'state')
+    cache.set_masks(None)
+    yield cache
+    cache.clear()
+
+
+def test_hit_and_miss(cache):
+    fb = Builder()
+    verts = cache.vertices_at(fb, 1)
+    assert not verts.flags.writeable
+    assert cache.vertices_at(fb, 1) is verts
+    assert fb.calls == 1
+    cache.vertices_at(fb, 2)
+    assert fb.calls == 2
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['entries'] == 2
+    assert stats['size'] == 2 * ENTRY_SIZE
+
+
+def test_unknown_state_is_not_cached(cache):
+    fb = Builder()
+    cache.set_state_key(None)
+    cache.vertices_at(fb, 1)
+    cache.vertices_at(fb, 1)
+    assert fb.calls == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_key_parts(cache):
+    fb = Builder()
+    cache.vertices_at(fb, 1)
+    cache.set_masks([True, False])
+    cache.vertices_at(fb, 1)
+    cache.set_state_key(b'other')
+    cache.vertices_at(fb, 1)
+    assert fb.calls == 3
+
+    # Previous mask selection is still cached
+    cache.set_state_key(b'state')
+    cache.set_masks(None)
+    cache.vertices_at(fb, 1)
+    assert fb.calls == 3
+
+
+def test_lru_eviction(cache, monkeypatch):
+    monkeypatch.setattr(Config, 'expression_cache_max_size', 3 * ENTRY_SIZE)
+    fb = Builder()
+    for keyframe in (1, 2, 3):
+        cache.vertices_at(fb, keyframe)
+    # Keyframe 1 becomes the most recently used
+    cache.vertices_at(fb, 1)
+    cache.vertices_at(fb, 4)
+    assert cache.stats()['entries'] == 3
+    assert cache.stats()['size'] == 3 * ENTRY_SIZE
+
+    calls = fb.calls
+    cache.vertices_at(fb, 1)
+    cache.vertices_at(fb, 3)
+    cache.vertices_at(fb, 4)
+    assert fb.calls == calls
+    # Keyframe 2 has been evicted
+    cache.vertices_at(fb, 2)
+    assert fb.calls == calls + 1
+
+
+def test_size_cap(cache):
+    fb = Builder()
+    keyframes = Config.expression_cache_max_size // ENTRY_SIZE + 10
+    for keyframe in range(keyframes):
+        cache.vertices_at(fb, keyframe)
+        assert cache.stats()['size'] <= Config.expression_cache_max_size
+    assert cache.stats()['entries'] == \
+        Config.expression_cache_max_size // ENTRY_SIZE
+
+
+def test_too_large_entry_is_not_stored(cache, monkeypatch):
+    monkeypatch.setattr(Config, 'expression_cache_max_size', ENTRY_SIZE - 1)
+    fb = Builder()
+    verts = cache.vertices_at(fb, 1)
+    assert verts.shape == (VERTEX_COUNT, 3)
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['size'] == 0
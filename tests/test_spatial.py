@@ -0,0 +1,83 @@
+# -------
+# Pin grid index test, Blender is not needed:
+# python -m pytest test_spatial.py
+# -------
+import importlib.util
+import os
+import random
+
+
+SPATIAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            '..', 'keentools_facebuilder', 'utils',
+                            'spatial.py')
+
+
+def import_spatial():
+    spec = importlib.util.spec_from_file_location('fb_spatial', SPATIAL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def linear_nearest(points, x, y, radius):
+    dist2 = radius ** 2
+    nearest = -1
+    for i, p in enumerate(points):
+        d2 = (x - p[0]) ** 2 + (y - p[1]) ** 2
+        if d2 < dist2:
+            dist2 = d2
+            nearest = i
+    return nearest, dist2
+
+
+def linear_in_radius(points, x, y, radius):
+    return [i for i, p in enumerate(points)
+            if (x - p[0]) ** 2 + (y - p[1]) ** 2 < radius ** 2]
+
+
+def random_point(rnd):
+    return (rnd.uniform(-0.5, 0.5), rnd.uniform(-0.5, 0.5))
+
+
+def check_queries(grid, points, rnd):
+    for _ in range(20):
+        x, y = random_point(rnd)
+        radius = rnd.choice((0.005, 0.03, 0.1, 2.0))
+        assert grid.nearest(x, y, radius) == \
+            linear_nearest(points, x, y, radius)
+        assert grid.in_radius(x, y, radius) == \
+            linear_in_radius(points, x, y, radius)
+
+
+def test_grid_matches_linear_scan():
+    spatial = import_spatial()
+    rnd = random.Random(1)
+    grid = spatial.FBPointGrid(0.02)
+    points = [random_point(rnd) for _ in range(200)]
+    grid.rebuild(points)
+    check_queries(grid, points, rnd)
+
+    for _ in range(300):
+        action = rnd.random()
+        if action < 0.35 or len(points) == 0:
+            p = random_point(rnd)
+            points.append(p)
+            grid.add(p)
+        elif action < 0.7:
+            index = rnd.randrange(len(points))
+            p = random_point(rnd)
+            points[index] = p
+            grid.move(index, p)
+        else:
+            index = rnd.randrange(len(points))
+            del points[index]
+            grid.remove(index)
+        check_queries(grid, points, rnd)
+
+
+def test_empty_grid():
+    spatial = import_spatial()
+    grid = spatial.FBPointGrid(0.02)
+    grid.rebuild([])
+    assert grid.nearest(0.0, 0.0, 0.1) == (-1, 0.1 ** 2)
+    assert grid.in_radius(0.0, 0.0, 0.1) == []
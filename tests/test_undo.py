@@ -0,0 +1,196 @@
+# -------
+# Pinmode undo history test, Blender is not needed:
+# python -m pytest test_undo.py
+# -------
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+
+UNDO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'keentools_facebuilder', 'utils', 'undo.py')
+PACKAGE = 'fb_undo_test'
+
+
+class Config:
+    undo_history_max_steps = 128
+    undo_history_max_size = 64 * 1024 * 1024
+    focal_update_tolerance = 1e-4
+
+
+class Camera:
+    def __init__(self):
+        self.model_mat = ''
+        self.focal = 50.0
+
+
+class Head:
+    def __init__(self, cameras_count=2):
+        self.serial_str = ''
+        self.cameras = [Camera() for _ in range(cameras_count)]
+
+    def get_serial_str(self):
+        return self.serial_str
+
+    def set_serial_str(self, value):
+        self.serial_str = value
+
+
+class Settings:
+    def __init__(self):
+        self.heads = [Head()]
+
+    def get_head(self, headnum):
+        if 0 <= headnum < len(self.heads):
+            return self.heads[headnum]
+        return None
+
+
+def import_undo(settings):
+    """ Scene settings are replaced by plain objects """
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = []
+    utils = types.ModuleType(PACKAGE + '.utils')
+    utils.__path__ = []
+    config = types.ModuleType(PACKAGE + '.config')
+    config.Config = Config
+    config.get_main_settings = lambda: settings
+    sys.modules[PACKAGE] = package
+    sys.modules[PACKAGE + '.utils'] = utils
+    sys.modules[PACKAGE + '.config'] = config
+
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE + '.utils.undo', UNDO_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def settings():
+    return Settings()
+
+
+@pytest.fixture
+def history(settings):
+    module = import_undo(settings)
+    module.FBUndoHistory.clear()
+    yield module.FBUndoHistory
+    module.FBUndoHistory.clear()
+
+
+def set_state(head, num):
+    head.set_serial_str('serial {}'.format(num))
+    for i, cam in enumerate(head.cameras):
+        cam.model_mat = 'model_mat {} {}'.format(num, i)
+        cam.focal = 50.0 + num
+
+
+def test_undo_redo(settings, history):
+    head = settings.get_head(0)
+    set_state(head, 0)
+    history.start(0)
+    assert not history.can_undo()
+    assert not history.is_changed()
+
+    set_state(head, 1)
+    history.push(0, 'Step 1')
+    set_state(head, 2)
+    history.push(0, 'Step 2')
+
+    assert history.undo()
+    assert head.get_serial_str() == 'serial 1'
+    assert history.undo()
+    assert head.get_serial_str() == 'serial 0'
+    assert head.cameras[1].model_mat == 'model_mat 0 1'
+    assert head.cameras[1].focal == 50.0
+    assert not history.undo()
+
+    assert history.redo()
+    assert history.redo()
+    assert head.get_serial_str() == 'serial 2'
+    assert head.cameras[0].focal == 52.0
+    assert not history.redo()
+    assert history.is_changed()
+
+
+def test_same_state_is_not_pushed(settings, history):
+    head = settings.get_head(0)
+    set_state(head, 0)
+    history.start(0)
+    history.push(0, 'Same')
+    assert not history.can_undo()
+
+    # Focal change only is a new state
+    head.cameras[0].focal = 35.0
+    history.push(0, 'Focal')
+    assert history.can_undo()
+
+
+def test_push_truncates_redo(settings, history):
+    head = settings.get_head(0)
+    set_state(head, 0)
+    history.start(0)
+    for num in range(1, 4):
+        set_state(head, num)
+        history.push(0, 'Step {}'.format(num))
+
+    assert history.undo()
+    assert history.undo()
+    assert history.can_redo()
+
+    set_state(head, 10)
+    history.push(0, 'Branch')
+    assert not history.can_redo()
+    assert history.undo()
+    assert head.get_serial_str() == 'serial 1'
+
+
+def test_max_steps(settings, history, monkeypatch):
+    monkeypatch.setattr(Config, 'undo_history_max_steps', 5)
+    head = settings.get_head(0)
+    set_state(head, 0)
+    history.start(0)
+    for num in range(1, 20):
+        set_state(head, num)
+        history.push(0, 'Step {}'.format(num))
+
+    undo_count = 0
+    while history.undo():
+        undo_count += 1
+    assert undo_count == 4
+    assert head.get_serial_str() == 'serial 15'
+
+
+def test_max_size(settings, history, monkeypatch):
+    head = settings.get_head(0)
+    set_state(head, 0)
+    history.start(0)
+    state_size = history.size()
+    monkeypatch.setattr(Config, 'undo_history_max_size', 3 * state_size)
+    for num in range(1, 10):
+        set_state(head, num)
+        history.push(0, 'Step {}'.format(num))
+        assert history.size() <= 3 * state_size
+
+    # Current state is kept even if it's over the limit
+    monkeypatch.setattr(Config, 'undo_history_max_size', 0)
+    set_state(head, 100)
+    history.push(0, 'Last')
+    assert not history.can_undo()
+    assert not history.can_redo()
+
+
+def test_restore_mismatch(settings, history):
+    head = settings.get_head(0)
+    set_state(head, 0)
+    history.start(0)
+    set_state(head, 1)
+    history.push(0, 'Step 1')
+
+    head.cameras.append(Camera())
+    assert not history.undo()
+    assert head.get_serial_str() == 'serial 1'
@@ -0,0 +1,76 @@
+# -------
+# Masked topology vertex map test, Blender is not needed:
+# python -m pytest test_vertex_map.py
+# -------
+import importlib.util
+import os
+
+import numpy as np
+
+
+VERTEX_MAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', 'keentools_facebuilder', 'utils',
+                               'vertex_map.py')
+
+
+def import_vertex_map():
+    spec = importlib.util.spec_from_file_location('fb_vertex_map',
+                                                  VERTEX_MAP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def random_vertices(count, seed=0):
+    rnd = np.random.RandomState(seed)
+    return rnd.uniform(-1.0, 1.0, (count, 3)).astype(np.float32)
+
+
+def test_identity():
+    vm = import_vertex_map()
+    source = random_vertices(100)
+    vertex_map = vm.build_vertex_map(source.copy(), source)
+    assert np.array_equal(vertex_map, np.arange(100))
+
+
+def test_masked_subset():
+    vm = import_vertex_map()
+    source = random_vertices(200)
+    indices = np.random.RandomState(1).permutation(200)[:120]
+    points = source[indices]
+    vertex_map = vm.build_vertex_map(points, source)
+    assert vertex_map is not None
+    assert vertex_map.dtype == np.int32
+    assert np.array_equal(vertex_map, indices)
+
+
+def test_missing_point():
+    vm = import_vertex_map()
+    source = random_vertices(50)
+    points = np.vstack([source[:10], [[5.0, 5.0, 5.0]]])
+    assert vm.build_vertex_map(points, source) is None
+
+
+def test_ambiguous_source_is_rejected():
+    vm = import_vertex_map()
+    source = random_vertices(50)
+    # Seam vertices share position, so mesh point can't be mapped
+    source[40] = source[3]
+    points = source[:20]
+    assert vm.build_vertex_map(points, source) is None
+
+
+def test_ambiguity_outside_points_is_ignored():
+    vm = import_vertex_map()
+    source = random_vertices(50)
+    source[49] = source[48]
+    points = source[:20]
+    vertex_map = vm.build_vertex_map(points, source)
+    assert np.array_equal(vertex_map, np.arange(20))
+
+
+def test_repeated_points_are_rejected():
+    vm = import_vertex_map()
+    source = random_vertices(50)
+    points = source[[1, 2, 2, 3]]
+    assert vm.build_vertex_map(points, source) is None